@@ -11,8 +11,13 @@
  '''
 import sys
 sys.path.append('../')
-import smbus
 import time
+import numpy as np
+try:
+    from smbus2 import SMBus, i2c_msg
+except ImportError:
+    from smbus import SMBus
+    i2c_msg = None
 
 class BMX160:
     
@@ -75,6 +80,10 @@ class BMX160:
     _BMX160_COMMAND_REG_ADDR         = (0x7E)
     
     BMX160_SOFT_RESET_CMD           = (0xb6)
+    BMX160_FIFO_FLUSH_CMD           = (0xb0)
+    BMX160_FIFO_MAGN_GYRO_ACCEL     = (0xe0)
+    BMX160_FIFO_SIZE                = (1024)
+    BMX160_FIFO_FRAME_LEN           = (20)
     BMX160_MAGN_UT_LSB              = (0.3)
     _BMX160_ACCEL_MG_LSB_2G          = (0.000061035)
     _BMX160_ACCEL_MG_LSB_4G          = (0.000122070)
@@ -97,12 +106,39 @@ class BMX160:
     AccelRange_4G                    = (0x01)
     AccelRange_8G                    = (0x02)
     AccelRange_16G                   = (0x03)
+
+    # register values for GyroRange_* / AccelRange_*, indexed by the range bits
+    _BMX160_GYRO_RANGE_REG           = (0x04, 0x03, 0x02, 0x01, 0x00)
+    _BMX160_ACCEL_RANGE_REG          = (0x03, 0x05, 0x08, 0x0C)
+
+    # output data rate (Hz) to the odr field of the accel, gyro and magn config registers
+    # (the gyro starts at 25Hz, so do the rates offered here)
+    _BMX160_ODR_REG                  = {25: 0x06, 50: 0x07, 100: 0x08, 200: 0x09,
+                                        400: 0x0A, 800: 0x0B, 1600: 0x0C, 3200: 0x0D}
+    _BMX160_ACCEL_MAX_ODR            = (1600)
+    _BMX160_GYRO_MAX_ODR             = (3200)
+    _BMX160_MAGN_MAX_ODR             = (800)
+    _BMX160_CONF_BWP_NORMAL          = (0x20)
+
+    BMX160_DRDY_ACCEL                = (0x80)
+    BMX160_DRDY_GYRO                 = (0x40)
+    BMX160_DRDY_MAGN                 = (0x20)
     
     accelRange = _BMX160_ACCEL_MG_LSB_2G
     gyroRange = _BMX160_GYRO_SENSITIVITY_250DPS
+    accelRangeBits = AccelRange_2G
+    gyroRangeBits = GyroRange_250DPS
+    dataRate = 100
+    fifoOverflows = 0
+    # Longest FIFO read in one I2C transaction (bytes, 0: whole FIFO at once); shorter bursts
+    # let other devices on a shared bus in between
+    fifoBurst = 0
     
     def __init__(self, bus):
-        self.i2cbus = smbus.SMBus(bus)
+        '''!
+          @param bus I2C bus number, or an already open smbus-compatible bus object
+        '''
+        self.i2cbus = SMBus(bus) if isinstance(bus, int) else bus
         self.i2c_addr = 0x68
         time.sleep(0.16)
     
@@ -124,6 +160,7 @@ class BMX160:
             self.write_bmx_reg(self._BMX160_COMMAND_REG_ADDR, 0x19)
             time.sleep(0.01)
             self.set_magn_conf()
+            self.apply_config()
             return True
 
     def set_low_power(self):
@@ -155,6 +192,7 @@ class BMX160:
         time.sleep(0.1)
         self.write_bmx_reg(self._BMX160_COMMAND_REG_ADDR, 0x19)
         time.sleep(0.1)
+        self.apply_config()
 
     def soft_reset(self):
         '''!
@@ -211,6 +249,9 @@ class BMX160:
             self.gyroRange = self._BMX160_GYRO_SENSITIVITY_2000DPS
         else:
             self.gyroRange = self._BMX160_GYRO_SENSITIVITY_250DPS
+            bits = self.GyroRange_250DPS
+        self.gyroRangeBits = bits
+        self.write_bmx_reg(self._BMX160_GYRO_RANGE_ADDR, self._BMX160_GYRO_RANGE_REG[bits])
 
     def set_accel_range(self, bits):
         '''!
@@ -231,13 +272,71 @@ class BMX160:
             self.accelRange = self._BMX160_ACCEL_MG_LSB_16G
         else:
             self.accelRange = self._BMX160_ACCEL_MG_LSB_2G
+            bits = self.AccelRange_2G
+        self.accelRangeBits = bits
+        self.write_bmx_reg(self._BMX160_ACCEL_RANGE_ADDR, self._BMX160_ACCEL_RANGE_REG[bits])
+
+    def set_odr(self, rate):
+        '''!
+          @brief set the output data rate of the accel, gyro and magn on the chip
+          @param rate output data rate in Hz: 25, 50, 100, 200, 400, 800, 1600 or 3200
+          @n     accel is limited to 1600Hz and magn to 800Hz, they run at their limit above it
+          @n     (headerless FIFO frames need all three at the same rate, so keep it at or below 800Hz)
+        '''
+        if rate not in self._BMX160_ODR_REG:
+            raise ValueError("Unsupported BMX160 output data rate: {0}Hz".format(rate))
+        self.dataRate = rate
+        self._write_odr()
+
+    def _write_odr(self):
+        accel_odr = self._BMX160_ODR_REG[min(self.dataRate, self._BMX160_ACCEL_MAX_ODR)]
+        gyro_odr = self._BMX160_ODR_REG[min(self.dataRate, self._BMX160_GYRO_MAX_ODR)]
+        magn_odr = self._BMX160_ODR_REG[min(self.dataRate, self._BMX160_MAGN_MAX_ODR)]
+        self.write_bmx_reg(self._BMX160_ACCEL_CONFIG_ADDR, self._BMX160_CONF_BWP_NORMAL | accel_odr)
+        self.write_bmx_reg(self._BMX160_GYRO_CONFIG_ADDR, self._BMX160_CONF_BWP_NORMAL | gyro_odr)
+        self.write_bmx_reg(self._BMX160_MAGN_CONFIG_ADDR, magn_odr)
+
+    def apply_config(self):
+        '''!
+          @brief write the configured output data rate and ranges to the chip
+          @n     a soft reset restores the chip defaults (100Hz, 2g, 2000dps), begin() and wake_up() call this afterwards
+        '''
+        self._write_odr()
+        self.write_bmx_reg(self._BMX160_GYRO_RANGE_ADDR, self._BMX160_GYRO_RANGE_REG[self.gyroRangeBits])
+        self.write_bmx_reg(self._BMX160_ACCEL_RANGE_ADDR, self._BMX160_ACCEL_RANGE_REG[self.accelRangeBits])
 
     def get_all_data(self):
         '''!
           @brief get the magn, gyro and accel data 
           @return all data
         '''
-        data = self.read_bmx_reg(self._BMX160_MAG_DATA_ADDR)
+        return self.decode_frame(self.read_bmx_reg(self._BMX160_MAG_DATA_ADDR))
+
+    def iter_data_ready(self, mask=BMX160_DRDY_ACCEL | BMX160_DRDY_GYRO, poll_interval=None):
+        '''!
+          @brief stream samples gated on the data-ready bits, so every new sample is read exactly once
+          @param mask BMX160_DRDY_* bits that must all be set before a sample is taken
+          @param poll_interval seconds to wait when no new sample is ready, defaults to a quarter of the sample period
+          @return generator of (timestamp, data) tuples, data laid out as in get_all_data
+          @n      The status register is read on its own first: reading the data registers clears
+          @n      the bits, so a burst covering both could clear them before status is sampled.
+        '''
+        if poll_interval is None:
+            poll_interval = 0.25 / self.dataRate
+        while True:
+            status = self.read_bmx_reg(self._BMX160_STATUS_ADDR, 1)[0]
+            if (status & mask) == mask:
+                data = self.read_bmx_reg(self._BMX160_MAG_DATA_ADDR, 20)
+                yield time.time(), self.decode_frame(data)
+            else:
+                time.sleep(poll_interval)
+
+    def decode_frame(self, data):
+        '''!
+          @brief convert a raw 20 byte magn, gyro, accel frame into physical units
+          @param data raw frame, laid out as the data registers starting at _BMX160_MAG_DATA_ADDR
+          @return all data
+        '''
         if (data[1] & 0x80):
             magnx = - 0x10000 + ((data[1] << 8) | (data[0]))
         else:
@@ -300,6 +399,121 @@ class BMX160:
         out_put.append(accelz)
         return out_put
 
+    def decode_frames(self, frames, dtype=np.float32, structured=False):
+        '''!
+          @brief convert N raw 20 byte frames into physical units in one vectorized pass
+          @param frames raw frames from read_fifo_frames() or read_bmx_reg(), see decode_frames()
+          @param dtype floating point type of the result
+          @param structured return a structured array with magn, gyro and accel fields
+          @return (N, 9) array laid out as in get_all_data, scaled with the current ranges
+        '''
+        return decode_frames(frames, self.accelRange, self.gyroRange, dtype, structured)
+
+    def enable_fifo(self, watermark=0):
+        '''!
+          @brief buffer magn, gyro and accel samples in the on-chip FIFO (headerless mode)
+          @param watermark FIFO fill level in bytes for the watermark interrupt, 0 disables it
+        '''
+        self.write_bmx_reg(self._BMX160_FIFO_CONFIG_0_ADDR, (watermark // 4) & 0xFF)
+        self.write_bmx_reg(self._BMX160_FIFO_CONFIG_1_ADDR, self.BMX160_FIFO_MAGN_GYRO_ACCEL)
+        self.flush_fifo()
+
+    def disable_fifo(self):
+        '''!
+          @brief stop buffering samples in the FIFO
+        '''
+        self.write_bmx_reg(self._BMX160_FIFO_CONFIG_1_ADDR, 0x00)
+        self.flush_fifo()
+
+    def flush_fifo(self):
+        '''!
+          @brief discard everything currently held in the FIFO
+        '''
+        self.write_bmx_reg(self._BMX160_COMMAND_REG_ADDR, self.BMX160_FIFO_FLUSH_CMD)
+
+    def get_fifo_length(self):
+        '''!
+          @brief read the FIFO fill level
+          @return number of bytes held in the FIFO
+        '''
+        data = self.i2cbus.read_i2c_block_data(self.i2c_addr, self._BMX160_FIFO_LENGTH_ADDR, 2)
+        return ((data[1] & 0x07) << 8) | data[0]
+
+    def read_fifo_bytes(self, length):
+        '''!
+          @brief burst read raw bytes out of the FIFO data register
+          @param length number of bytes to read, a multiple of BMX160_FIFO_FRAME_LEN
+          @return bytearray of FIFO data
+          @n      With smbus2 the whole length (or fifoBurst bytes at a time) is read in one
+          @n      combined I2C transaction. Plain smbus caps block reads at 32 bytes, so it
+          @n      falls back to one frame per read
+          @n      (a partially read frame is repeated by the chip on the next read).
+        '''
+        if i2c_msg is not None and hasattr(self.i2cbus, 'i2c_rdwr'):
+            burst = length
+            if self.fifoBurst:
+                burst = max(self.fifoBurst - self.fifoBurst % self.BMX160_FIFO_FRAME_LEN, self.BMX160_FIFO_FRAME_LEN)
+            data = bytearray()
+            while len(data) < length:
+                write = i2c_msg.write(self.i2c_addr, [self._BMX160_FIFO_DATA_ADDR])
+                read = i2c_msg.read(self.i2c_addr, min(burst, length - len(data)))
+                self.i2cbus.i2c_rdwr(write, read)
+                data += bytearray(read)
+            return data
+        data = bytearray()
+        while len(data) < length:
+            data += bytearray(self.i2cbus.read_i2c_block_data(
+                self.i2c_addr, self._BMX160_FIFO_DATA_ADDR, self.BMX160_FIFO_FRAME_LEN))
+        return data
+
+    def read_fifo_frames(self):
+        '''!
+          @brief drain every complete frame currently held in the FIFO
+          @return list of raw 20 byte frames, oldest first
+        '''
+        length = self.get_fifo_length()
+        # No room left for another frame: the FIFO is dropping samples
+        if length > self.BMX160_FIFO_SIZE - self.BMX160_FIFO_FRAME_LEN:
+            self.fifoOverflows += 1
+        length -= length % self.BMX160_FIFO_FRAME_LEN
+        if length == 0:
+            return []
+        data = self.read_fifo_bytes(length)
+        frame_len = self.BMX160_FIFO_FRAME_LEN
+        return [data[i:i + frame_len] for i in range(0, length, frame_len)]
+
+    def read_fifo(self):
+        '''!
+          @brief drain the FIFO and timestamp every sample
+          @return list of (timestamp, data) tuples, data laid out as in get_all_data
+          @n      Samples are spaced 1 / dataRate apart, the newest one stamped with the drain time.
+        '''
+        frames = self.read_fifo_frames()
+        now = time.time()
+        if not frames:
+            return []
+        period = 1.0 / self.dataRate
+        last = len(frames) - 1
+        data = self.decode_frames(frames, dtype=np.float64).tolist()
+        return [(now - (last - i) * period, sample) for i, sample in enumerate(data)]
+
+    def iter_fifo(self, poll_interval=None):
+        '''!
+          @brief stream timestamped samples out of the FIFO, draining it in bursts
+          @param poll_interval seconds between drains, defaults to half the time it takes to fill the FIFO
+          @return generator of (timestamp, data) tuples
+        '''
+        if poll_interval is None:
+            frames = self.BMX160_FIFO_SIZE // self.BMX160_FIFO_FRAME_LEN
+            poll_interval = frames / 2.0 / self.dataRate
+        while True:
+            start = time.time()
+            for sample in self.read_fifo():
+                yield sample
+            remaining = poll_interval - (time.time() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+
     def write_bmx_reg(self, register, value):
         '''!
           @brief Write data to the BMX register
@@ -309,13 +523,14 @@ class BMX160:
         '''
         self.i2cbus.write_byte_data(self.i2c_addr, register, value)
 
-    def read_bmx_reg(self, register):
+    def read_bmx_reg(self, register, length=32):
         '''!
           @brief Read BMX register data
           @param register register
+          @param length number of bytes to read (at most 32)
           @return data
         '''
-        return self.i2cbus.read_i2c_block_data(self.i2c_addr, register)
+        return self.i2cbus.read_i2c_block_data(self.i2c_addr, register, length)
 
     def scan(self):
         '''!
@@ -330,3 +545,32 @@ class BMX160:
         except:
             print("I2C init fail")
             return False
+
+FRAME_DTYPE = np.dtype([('magn', '<f4', (3,)), ('gyro', '<f4', (3,)), ('accel', '<f4', (3,))])
+
+# int16 words of a 20 byte frame that hold the magn, gyro and accel axes (word 3 is the magn hall resistance)
+_FRAME_AXES = [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+def decode_frames(frames, accel_range=BMX160.accelRange, gyro_range=BMX160.gyroRange,
+                  dtype=np.float32, structured=False):
+    '''!
+      @brief convert N raw 20 byte frames into physical units without touching the sensor
+      @param frames list of raw frames, one bytes-like buffer of N * 20 bytes, or an (N, 20) uint8 array
+      @param accel_range accel LSB scale in g, as stored in BMX160.accelRange
+      @param gyro_range gyro LSB scale in dps, as stored in BMX160.gyroRange
+      @param dtype floating point type of the result
+      @param structured return a FRAME_DTYPE array (float32 only) instead of (N, 9)
+      @return (N, 9) array of magn (uT), gyro (dps) and accel (m/s^2)
+    '''
+    if isinstance(frames, np.ndarray):
+        raw = np.ascontiguousarray(frames, dtype=np.uint8)
+    elif isinstance(frames, (bytes, bytearray, memoryview)):
+        raw = np.frombuffer(frames, dtype=np.uint8)
+    else:
+        raw = np.frombuffer(b''.join(bytes(frame) for frame in frames), dtype=np.uint8)
+    words = raw.reshape(-1, BMX160.BMX160_FIFO_FRAME_LEN).view('<i2')
+    scale = np.array([BMX160.BMX160_MAGN_UT_LSB] * 3 + [gyro_range] * 3 + [accel_range * 9.8] * 3, dtype=dtype)
+    out = np.multiply(words[:, _FRAME_AXES], scale, dtype=dtype)
+    if structured:
+        return np.ascontiguousarray(out, dtype=np.float32).view(FRAME_DTYPE).reshape(-1)
+    return out
@@ -1,49 +1,270 @@
 import cv2
+import multiprocessing
+import queue
+import threading
 import time
 import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import open_video_capture
+from frame_segments import SEGMENT_FORMATS, FrameSegmentWriter
 
-# Create folders for color and grayscale frames
-os.makedirs("color_frames", exist_ok=True)
-os.makedirs("gray_frames", exist_ok=True)
+# What the capture thread does when the encoders fall behind and the frame queue is full
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+ENCODERS = ("process", "thread")
+# "jpeg": a color and a grayscale JPEG per frame; "segments": rolling segment files, see frame_segments.py
+MODES = ("jpeg", "segments")
 
-# Initialize the camera
-cap = cv2.VideoCapture(0)
+def frame_timestamp(wall_time):
+    """Filename timestamp, format: YYYYMMDD_HHMMSS_microseconds."""
+    # time.strftime does not expand %f, so the microseconds are added by hand
+    return time.strftime("%Y%m%d_%H%M%S", time.localtime(wall_time)) + f"_{int(wall_time % 1 * 1e6):06d}"
 
-# Check if the camera is opened successfully
-if not cap.isOpened():
-    print("Error: Could not open the camera.")
-    exit()
+def encode_frame(frame, color_filename, gray_filename):
+    """Convert a frame to grayscale and save both JPEGs. Runs in an encoder process."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    cv2.imwrite(color_filename, frame)
+    cv2.imwrite(gray_filename, gray)
+    return os.path.getsize(color_filename) + os.path.getsize(gray_filename)
 
-print("Press 'q' to stop recording...")
+def encode_jpeg(frame, quality=95):
+    """JPEG bytes of a frame, for segment recordings. Runs in an encoder process."""
+    ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("cv2.imencode failed")
+    return data.tobytes()
 
-while True:
-    ret, frame = cap.read()  # Capture a frame
-    if not ret:
-        print("Error: Could not read frame.")
-        break
+def _start_encoder():
+    """No-op task that makes the pool start a process (and import cv2) before recording begins."""
+    return os.getpid()
 
-    # Get the current timestamp
-    timestamp = time.strftime("%Y%m%d_%H%M%S_%f")  # Format: YYYYMMDD_HHMMSS_microseconds
+class CameraPipeline:
+    """
+    Camera recording split into a capture thread, a bounded frame queue and a pool of
+    encoder processes, so JPEG encoding never holds up capture.
+    - cap: opened VideoCapture-like source
+    - output_dir: folder for the color frames, or the recording folder in "segments" mode
+    - gray_dir: folder for the grayscale frames (unused in "segments" mode)
+    - workers: number of encoder processes
+    - queue_size: frames the queue holds while all encoders are busy
+    - drop_policy: "drop_oldest", "drop_newest" or "block" (stall capture) when the queue is full
+    - encoder: "process" encodes in a process pool; "thread" in a thread pool, which skips copying
+      every frame to another process (cv2 releases the GIL while encoding)
+    - mode: "jpeg" or "segments"
+    - segment_format: "mjpeg" or "raw" (frames stored unencoded, no encoder work at all)
+    - segment_frames: frames per segment file
+    """
+    def __init__(self, cap, output_dir, gray_dir, workers=2, queue_size=8, drop_policy="drop_oldest", encoder="process",
+                 mode="jpeg", segment_format="mjpeg", segment_frames=1800):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        if encoder not in ENCODERS:
+            raise ValueError(f"Unknown encoder: {encoder}")
+        if mode not in MODES:
+            raise ValueError(f"Unknown recording mode: {mode}")
+        if segment_format not in SEGMENT_FORMATS:
+            raise ValueError(f"Unknown segment format: {segment_format}")
+        self.encoder = encoder
+        self.mode = mode
+        self.segment_format = segment_format
+        self.segment_frames = segment_frames
+        self.segments = None
+        self.cap = cap
+        self.output_dir = output_dir
+        self.gray_dir = gray_dir
+        self.workers = workers
+        self.drop_policy = drop_policy
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.latest_frame = None
+        # Ends this pipeline only; the caller's stop_event may be shared with the other sensors
+        self._stop_event = threading.Event()
+        # captured/dropped are only updated by the capture thread, the rest by the encoder dispatch loop
+        self.counters = {"captured": 0, "dropped": 0, "encoded": 0, "failed": 0, "bytes_written": 0}
 
-    # Convert the frame to grayscale
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    def _enqueue(self, item):
+        if self.drop_policy == "block":
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        self.counters["dropped"] += 1
+        if self.drop_policy == "drop_newest":
+            return
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.queue.put_nowait(item)
 
-    # Save the color frame with a timestamp in the "color_frames" folder
-    color_filename = os.path.join("color_frames", f"color_{timestamp}.jpg")
-    cv2.imwrite(color_filename, frame)
+    def stop(self):
+        """Make run() finish the frames already captured and return."""
+        self._stop_event.set()
 
-    # Save the grayscale frame with a timestamp in the "gray_frames" folder
-    gray_filename = os.path.join("gray_frames", f"gray_{timestamp}.jpg")
-    cv2.imwrite(gray_filename, gray)
+    def _capture_loop(self, stop_event):
+        while not (stop_event.is_set() or self._stop_event.is_set()):
+            ret, frame = self.cap.read()  # Capture a frame
+            if not ret:
+                print("Error: Could not read frame.")
+                break
+
+            # Capture time on both clocks: wall time names/aligns frames, monotonic orders them
+            wall_time, monotonic = time.time(), time.monotonic()
+            seq = self.counters["captured"]
+            self.counters["captured"] += 1
+            self.latest_frame = frame
+            self._enqueue((seq, wall_time, monotonic, frame))
+        # The end marker is never dropped
+        self.queue.put(None)
+
+    def _collect(self, entry):
+        future, item = entry
+        try:
+            if self.segments is None:
+                self.counters["bytes_written"] += future.result()
+            else:
+                # Futures are collected in capture order, so segments stay ordered by seq
+                seq, wall_time, monotonic, frame = item
+                self.counters["bytes_written"] += self.segments.write(future.result(), seq, monotonic, wall_time,
+                                                                      frame.shape)
+            self.counters["encoded"] += 1
+        except Exception as e:
+            self.counters["failed"] += 1
+            print(f"Error: Could not encode frame: {e}")
+
+    def _dispatch(self, pool, pending, show):
+        """Hand queued frames to the encoders until the capture thread's end marker arrives."""
+        while True:
+            try:
+                item = self.queue.get(timeout=0.02)
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                return
+            if item:
+                seq, wall_time, monotonic, frame = item
+                if self.mode == "jpeg":
+                    timestamp = frame_timestamp(wall_time)
+                    color_filename = os.path.join(self.output_dir, f"color_{timestamp}.jpg")
+                    gray_filename = os.path.join(self.gray_dir, f"gray_{timestamp}.jpg")
+                    pending.append((pool.submit(encode_frame, frame, color_filename, gray_filename), None))
+                elif self.segment_format == "raw":
+                    self.counters["bytes_written"] += self.segments.write(frame, seq, monotonic, wall_time)
+                    self.counters["encoded"] += 1
+                else:
+                    # Only the frame goes to the encoder, the capture metadata stays here
+                    pending.append((pool.submit(encode_jpeg, frame), (seq, wall_time, monotonic, frame)))
+
+            # Hand back finished work; keep at most two frames per encoder in flight
+            while pending and (pending[0][0].done() or len(pending) > 2 * self.workers):
+                self._collect(pending.popleft())
+
+            if show and self.latest_frame is not None:
+                # Display the frames
+                cv2.imshow('Color Frame', self.latest_frame)
+                cv2.imshow('Grayscale Frame', cv2.cvtColor(self.latest_frame, cv2.COLOR_BGR2GRAY))
+
+                # Stop recording when 'q' is pressed
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    self.stop()
+
+    def run(self, stop_event=None, show=False):
+        """
+        Record until stop_event is set, the camera stops delivering frames or 'q' is pressed
+        in the preview windows (show=True). On Ctrl+C the frames already captured are still
+        written and the capture thread is stopped before the KeyboardInterrupt is passed on.
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        capture = threading.Thread(target=self._capture_loop, args=(stop_event,), name="CameraCapture", daemon=True)
+        if self.mode == "segments":
+            self.segments = FrameSegmentWriter(self.output_dir, self.segment_format, self.segment_frames)
+        if self.encoder == "process":
+            # spawn: the capture thread is already running when the pool starts its processes
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="CameraEncoder")
+        try:
+            with executor as pool:
+                # Starting an encoder takes a while, don't let the first frames pile up behind it
+                for started in [pool.submit(_start_encoder) for _ in range(self.workers)]:
+                    started.result()
+                pending = deque()
+                capture.start()
+                try:
+                    self._dispatch(pool, pending, show)
+                except KeyboardInterrupt:
+                    # Stop capturing, and keep draining so the capture thread can queue its end marker
+                    self.stop()
+                    self._dispatch(pool, pending, False)
+                    raise
+                finally:
+                    while pending:
+                        self._collect(pending.popleft())
+        finally:
+            if capture.ident is not None:
+                capture.join()
+            if self.segments is not None:
+                self.segments.close()
+        return self.counters
+
+def save_camera_frames(output_dir="color_frames", gray_dir="gray_frames", show=True, stop_event=None, cap=None,
+                       workers=2, queue_size=8, drop_policy="drop_oldest", encoder="process",
+                       mode="jpeg", segment_format="mjpeg", segment_frames=1800):
+    """
+    Capture frames from camera 0 and save color and grayscale JPEGs, or (mode="segments")
+    append them to segment files in output_dir; read those back with FrameSegmentReader.
+    - output_dir: folder for the color frames, or the recording folder in "segments" mode
+    - gray_dir: folder for the grayscale frames (unused in "segments" mode)
+    - show: display the frames in windows (press 'q' to stop); False runs headless
+    - stop_event: optional threading.Event that ends the recording when set
+    - cap: already opened VideoCapture-like source to record instead of camera 0
+    - workers, queue_size, drop_policy, encoder: encoder pipeline settings, see CameraPipeline
+    - mode, segment_format, segment_frames: recording layout, see CameraPipeline
+    Returns the pipeline counters (captured, dropped, encoded, failed, bytes_written).
+    """
+    # Create folders for color and grayscale frames
+    os.makedirs(output_dir, exist_ok=True)
+    if mode == "jpeg":
+        os.makedirs(gray_dir, exist_ok=True)
+
+    # Initialize the camera
+    if cap is None:
+        cap = open_video_capture(0)
+
+    # Check if the camera is opened successfully
+    if not cap.isOpened():
+        print("Error: Could not open the camera.")
+        return None
+
+    if show:
+        print("Press 'q' to stop recording...")
 
-    # Display the frames
-    cv2.imshow('Color Frame', frame)
-    cv2.imshow('Grayscale Frame', gray)
+    if stop_event is None:
+        stop_event = threading.Event()
+    pipeline = CameraPipeline(cap, output_dir, gray_dir, workers, queue_size, drop_policy, encoder,
+                              mode, segment_format, segment_frames)
+    try:
+        counters = pipeline.run(stop_event, show)
+    except KeyboardInterrupt:
+        pipeline.stop()
+        print("Recording stopped by user.")
+        counters = pipeline.counters
+    finally:
+        # Release the camera and close windows
+        cap.release()
+        if pipeline.segments is not None:
+            pipeline.segments.close()
+        if show:
+            cv2.destroyAllWindows()
 
-    # Stop recording when 'q' is pressed
-    if cv2.waitKey(20) & 0xFF == ord('q'):
-        break
+    print("Camera frames: {captured} captured, {encoded} encoded, {dropped} dropped, {failed} failed".format(**counters))
+    return counters
 
-# Release the camera and close windows
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    save_camera_frames()
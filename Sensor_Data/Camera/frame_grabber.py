@@ -0,0 +1,80 @@
+import threading
+import time
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import open_video_capture
+
+class FrameGrabber:
+    """
+    Keeps a camera open and reads it continuously on a background thread, so the newest
+    frame is always waiting in a single slot instead of the driver's queue going stale.
+    The slot holds (seq, timestamp, frame); seq counts frames from 1, timestamp is the
+    time.time() of the read, like the other sensors.
+    - cap: already opened VideoCapture-like source; camera `index` is opened if None
+    - index: camera to open when no cap is given
+    """
+    def __init__(self, cap=None, index=0):
+        self.cap = open_video_capture(index) if cap is None else cap
+        self.seq = 0
+        self.timestamp = None
+        self.frame = None
+        self.failed = False
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.cap.isOpened():
+            print("Error: Could not open the camera.")
+            self.failed = True
+            return self
+        self._thread = threading.Thread(target=self._grab_loop, name="FrameGrabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def _grab_loop(self):
+        while not self._stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                print("Error: Could not read frame.")
+                break
+            timestamp = time.time()
+            # read() hands out a new array every time, so the slot can be shared without copying
+            with self._condition:
+                self.seq += 1
+                self.timestamp = timestamp
+                self.frame = frame
+                self._condition.notify_all()
+        with self._condition:
+            self.failed = not self._stop_event.is_set()
+            self._condition.notify_all()
+
+    def latest(self):
+        """(seq, timestamp, frame) of the newest frame; (0, None, None) before the first one."""
+        with self._condition:
+            return self.seq, self.timestamp, self.frame
+
+    def wait_newer(self, seq, timeout=None):
+        """
+        Block until a frame newer than `seq` is in the slot and return it as latest() does.
+        Returns the current slot unchanged if timeout (seconds) expires or the camera fails.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.seq > seq or self.failed or self._stop_event.is_set(), timeout)
+            return self.seq, self.timestamp, self.frame
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.cap.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
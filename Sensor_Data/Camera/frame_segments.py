@@ -0,0 +1,185 @@
+"""
+Segmented camera recordings.
+
+Instead of two JPEG files per frame, frames are appended to rolling segment files
+and described by a sidecar index:
+
+    recording/
+        segments.json          format and frame size
+        index.csv              seq, monotonic, wall_time, segment, offset, length
+        segment_00000.mjpeg    concatenated JPEGs (plays as an MJPEG stream), or
+        segment_00000.raw      raw BGR frames
+        ...
+
+Grayscale is not stored: FrameSegmentReader derives it when a frame is read.
+"""
+import bisect
+import csv
+import json
+import os
+import cv2
+import numpy as np
+
+SEGMENT_FORMATS = ("mjpeg", "raw")
+INDEX_HEADER = ["seq", "monotonic", "wall_time", "segment", "offset", "length"]
+
+class FrameSegmentWriter:
+    """
+    Appends frames to rolling segment files in `directory`.
+    - directory: recording folder, created if needed
+    - format: "mjpeg" (write() takes JPEG bytes) or "raw" (write() takes BGR frames)
+    - segment_frames: frames per segment file
+    - segment_bytes: start a new segment once the current one reaches this size
+    - flush_frames: flush segment and index every this many frames
+    """
+    def __init__(self, directory, format="mjpeg", segment_frames=1800, segment_bytes=512 * 1024 * 1024,
+                 flush_frames=30):
+        if format not in SEGMENT_FORMATS:
+            raise ValueError(f"Unknown segment format: {format}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.format = format
+        self.segment_frames = segment_frames
+        self.segment_bytes = segment_bytes
+        self.flush_frames = flush_frames
+        self.frames = 0
+        self.segment = -1
+        self.segment_file = None
+        self._segment_count = 0
+        self._metadata_written = False
+        self.index_file = open(os.path.join(directory, "index.csv"), "w", newline="")
+        self.index = csv.writer(self.index_file)
+        self.index.writerow(INDEX_HEADER)
+
+    def _write_metadata(self, shape):
+        metadata = {"format": self.format, "height": shape[0], "width": shape[1],
+                    "channels": shape[2] if len(shape) > 2 else 1}
+        with open(os.path.join(self.directory, "segments.json"), "w") as f:
+            json.dump(metadata, f)
+        self._metadata_written = True
+
+    def _roll(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+        self.segment += 1
+        self._segment_count = 0
+        self.segment_file = open(self.segment_path(self.directory, self.segment, self.format), "wb")
+
+    @staticmethod
+    def segment_path(directory, segment, format):
+        return os.path.join(directory, f"segment_{segment:05d}.{format}")
+
+    def write(self, data, seq, monotonic, wall_time, shape=None):
+        """
+        Append one frame.
+        - data: JPEG bytes ("mjpeg") or a BGR frame ("raw")
+        - seq: capture sequence number
+        - monotonic, wall_time: capture time from time.monotonic() and time.time()
+        - shape: frame shape for segments.json ("mjpeg" only, raw frames carry it)
+        """
+        if self.format == "raw":
+            shape = data.shape
+            data = np.ascontiguousarray(data).data
+        if not self._metadata_written and shape is not None:
+            self._write_metadata(shape)
+        if (self.segment_file is None or self._segment_count >= self.segment_frames
+                or self.segment_file.tell() >= self.segment_bytes):
+            self._roll()
+        offset = self.segment_file.tell()
+        self.segment_file.write(data)
+        length = self.segment_file.tell() - offset
+        self.index.writerow([seq, f"{monotonic:.6f}", f"{wall_time:.6f}", self.segment, offset, length])
+        self._segment_count += 1
+        self.frames += 1
+        if self.frames % self.flush_frames == 0:
+            self.flush()
+        return length
+
+    def flush(self):
+        # Segment data first, so the index never points past the end of a segment
+        if self.segment_file is not None:
+            self.segment_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        if self.index_file.closed:
+            return
+        self.flush()
+        if self.segment_file is not None:
+            self.segment_file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FrameSegmentReader:
+    """
+    Reads a segmented recording by position or capture time.
+    Index rows pointing past the end of their segment (recording cut off) are ignored.
+    - directory: recording folder written by FrameSegmentWriter
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "segments.json")) as f:
+            self.metadata = json.load(f)
+        self.format = self.metadata["format"]
+        self.seq, self.monotonic, self.wall_time = [], [], []
+        self.locations = []
+        sizes = {}
+        with open(os.path.join(directory, "index.csv"), newline="") as f:
+            rows = csv.reader(f)
+            next(rows, None)
+            for row in rows:
+                if len(row) != len(INDEX_HEADER):
+                    break
+                segment, offset, length = int(row[3]), int(row[4]), int(row[5])
+                if segment not in sizes:
+                    path = FrameSegmentWriter.segment_path(directory, segment, self.format)
+                    sizes[segment] = os.path.getsize(path) if os.path.exists(path) else 0
+                if offset + length > sizes[segment]:
+                    break
+                self.seq.append(int(row[0]))
+                self.monotonic.append(float(row[1]))
+                self.wall_time.append(float(row[2]))
+                self.locations.append((segment, offset, length))
+        self._files = {}
+
+    def __len__(self):
+        return len(self.locations)
+
+    def read_bytes(self, position):
+        """Stored bytes of a frame: JPEG data or raw BGR pixels."""
+        segment, offset, length = self.locations[position]
+        if segment not in self._files:
+            self._files[segment] = open(FrameSegmentWriter.segment_path(self.directory, segment, self.format), "rb")
+        f = self._files[segment]
+        f.seek(offset)
+        return f.read(length)
+
+    def read(self, position, gray=False):
+        """Decoded BGR frame at a position, or its grayscale version."""
+        data = self.read_bytes(position)
+        if self.format == "raw":
+            shape = (self.metadata["height"], self.metadata["width"], self.metadata["channels"])
+            frame = np.frombuffer(data, dtype=np.uint8).reshape(shape)
+        else:
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if gray:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.wall_time[position], self.read(position)
+
+    def index_at(self, wall_time):
+        """Position of the first frame captured at or after wall_time (time.time() clock)."""
+        return bisect.bisect_left(self.wall_time, wall_time)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
@@ -0,0 +1,146 @@
+import bisect
+import threading
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import open_joystick
+
+class ControllerReader:
+    """
+    Reads a game controller on a background thread that blocks on its axis events, so every
+    stick or trigger change is timestamped when it arrives instead of at the next poll.
+    Keeps the current axis values, the recent changes and notifies waiters and an optional
+    callback on every change.
+    - joystick: controller from backends.open_joystick(); controller `index` is opened if None
+    - index: controller to open when no joystick is given
+    - driver: "pygame" or "evdev", see backends.open_joystick
+    - history: changes kept for changes_since() and resample()
+    - on_change: called as on_change(timestamp, axes) on the reader thread after each batch of
+      changes; keep it short, the next report waits for it
+    If the controller is disconnected the reader thread ends, keeping the error in `error`;
+    alive() tells.
+    """
+    def __init__(self, joystick=None, index=0, driver="pygame", history=100000, on_change=None):
+        self.joystick = open_joystick(index, driver) if joystick is None else joystick
+        self.on_change = on_change
+        self.axes = [self.joystick.get_axis(axis) for axis in range(self.joystick.get_numaxes())]
+        self.seq = 0
+        self.timestamp = None
+        # Parallel lists, trimmed to `history` entries in bulk
+        self.history = history
+        self._seqs = []
+        self._times = []
+        self._changes = []
+        self._start_axes = list(self.axes)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._read_loop, name="ControllerReader", daemon=True)
+        self._thread.start()
+        return self
+
+    def _read_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                # Short timeout so stop() does not wait for the next stick movement
+                changes = self.joystick.wait_axis_events(0.1)
+            except OSError as e:
+                print(f"Controller error, stopped reading it: {e}")
+                with self._condition:
+                    self.error = e
+                    self._condition.notify_all()
+                return
+            if not changes:
+                continue
+            with self._condition:
+                for timestamp, axis, value in changes:
+                    if axis >= len(self.axes):
+                        continue
+                    self.axes[axis] = value
+                    self.seq += 1
+                    self._seqs.append(self.seq)
+                    self._times.append(timestamp)
+                    self._changes.append((axis, value))
+                    self.timestamp = timestamp
+                if len(self._seqs) > self.history + self.history // 10:
+                    drop = len(self._seqs) - self.history
+                    # Axis values before the oldest change kept, for resample()
+                    for axis, value in self._changes[:drop]:
+                        self._start_axes[axis] = value
+                    del self._seqs[:drop], self._times[:drop], self._changes[:drop]
+                axes = tuple(self.axes)
+                timestamp = self.timestamp
+                self._condition.notify_all()
+            if self.on_change is not None:
+                self.on_change(timestamp, axes)
+
+    def alive(self):
+        """True while the reader thread is reading the controller."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def state(self):
+        """(seq, timestamp, axes): changes so far, time.time() of the newest change, current axis values."""
+        with self._condition:
+            return self.seq, self.timestamp, tuple(self.axes)
+
+    def wait_change(self, seq, timeout=None):
+        """
+        Block until a change after `seq` arrived and return state().
+        Returns the current state unchanged if timeout (seconds) expires.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.seq > seq or self._stop_event.is_set() or self.error, timeout)
+            return self.seq, self.timestamp, tuple(self.axes)
+
+    def changes_since(self, seq):
+        """List of (seq, timestamp, axis, value) for every kept change after `seq`, oldest first."""
+        with self._condition:
+            start = bisect.bisect_right(self._seqs, seq)
+            return [(s, t, axis, value) for s, t, (axis, value)
+                    in zip(self._seqs[start:], self._times[start:], self._changes[start:])]
+
+    def resample(self, rate, start=None, end=None):
+        """
+        Fixed-rate view of the kept changes: each axis holds its last reported value until the
+        next change (as the controller itself does).
+        - rate: samples per second
+        - start, end: time.time() range, defaults to the oldest and newest kept change
+        Returns:
+            - times: float64 array of sample times
+            - values: float32 array of shape (len(times), axes)
+        """
+        with self._condition:
+            times = np.array(self._times, dtype=np.float64)
+            changes = list(self._changes)
+            values = list(self._start_axes)
+        if start is None:
+            start = times[0] if len(times) else 0.0
+        if end is None:
+            end = times[-1] if len(times) else start
+        sample_times = start + np.arange(int((end - start) * rate) + 1) / rate
+        # Axis values after each change, then pick the last change at or before each sample
+        rows = np.empty((len(changes) + 1, len(values)), dtype=np.float32)
+        rows[0] = values
+        for i, (axis, value) in enumerate(changes, 1):
+            values[axis] = value
+            rows[i] = values
+        return sample_times, rows[np.searchsorted(times, sample_times, side="right")]
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.joystick.quit()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,83 +1,306 @@
-import pygame
+import os
+import sys
 import time
 import csv
+import threading
+from collections import deque
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import open_joystick
+from column_log import ColumnLogWriter, CONTROLLER_COLUMNS
+from control_loop import ControlLoop
+from controller_events import ControllerReader
 
 class ControllerInputLogger:
-    def __init__(self, max_steering=80, max_throttle=20):
+    """
+    Logs one row (timestamp, steering_angle, throttle) per control tick to a CSV file, or to a
+    binary column log if filename ends in .col.
+    Rows go into preallocated columns in memory; a writer thread appends them to the file in
+    batches every flush_interval seconds (or when a chunk fills up), so recording a row costs
+    a few array stores and never touches the disk.
+    - max_steering, max_throttle: scale of the mapped controller axes
+    - output_dir, filename: where the CSV file is written
+    - flush_interval: seconds a row may wait in memory before it is written (durability interval)
+    - chunk_rows: rows per in-memory chunk
+    - fsync: also force each batch to the storage device, not just to the OS
+    """
+    def __init__(self, max_steering=80, max_throttle=20, output_dir=".", filename="controller_data.csv",
+                 flush_interval=0.5, chunk_rows=1024, fsync=False):
         self.max_steering = max_steering
         self.max_throttle = max_throttle
         self.steering_angle = 0
         self.throttle = 0
+        self.car = None
+        self.teleop_latency = deque(maxlen=100000)
+        self.flush_interval = flush_interval
+        self.chunk_rows = chunk_rows
+        self.fsync = fsync
 
         # Open CSV file for recording controller data
-        self.data_file = open("controller_data.csv", 'w', newline='')
-        self.csv_writer = csv.writer(self.data_file)
-        
-        # Write the header row
-        self.csv_writer.writerow(['timestamp', 'steering_angle', 'throttle'])
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, filename)
+        if filename.endswith(".col"):
+            self.column_log = ColumnLogWriter(self.path, CONTROLLER_COLUMNS)
+            self.data_file = self.column_log.file
+        else:
+            self.column_log = None
+            self.data_file = open(self.path, 'w', newline='')
+            self.csv_writer = csv.writer(self.data_file)
 
-    def __del__(self):
-        # Close the CSV file when the instance is deleted
-        if self.data_file:
-            self.data_file.close()
+            # Write the header row
+            self.csv_writer.writerow(['timestamp', 'steering_angle', 'throttle'])
+            self.data_file.flush()
+
+        self._free = []
+        self._full = []
+        self._chunk = self._new_chunk()
+        self._rows = 0
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.counters = {"rows": 0, "rows_written": 0, "batches": 0, "write_s": 0.0, "writer_cpu_s": 0.0}
+        self._writer = threading.Thread(target=self._write_loop, name="ControllerLogWriter", daemon=True)
+        self._writer.start()
+
+    def _new_chunk(self):
+        if self._free:
+            return self._free.pop()
+        return {column: np.empty(self.chunk_rows, dtype=np.float64)
+                for column in ('timestamp', 'steering_angle', 'throttle')}
 
     def set_steering_angle(self, angle):
-        """Sets and records the steering angle."""
+        """Sets the steering angle recorded by the next record_data()."""
         self.steering_angle = angle
-        self.record_data()
 
     def set_throttle(self, throttle):
-        """Sets and records the throttle."""
+        """Sets the throttle recorded by the next record_data()."""
         self.throttle = throttle
-        self.record_data()
 
-    def record_data(self):
-        """Records timestamp, steering angle, and throttle values to a CSV file."""
-        timestamp = time.time()
-        data = [timestamp, self.steering_angle, self.throttle]
-        self.csv_writer.writerow(data)
-        self.data_file.flush()  # Ensure data is written immediately
+    def record(self, steering_angle, throttle, timestamp=None):
+        """Sets both values and records them as one row."""
+        self.record_data(timestamp, steering_angle, throttle)
 
-# Initialize Pygame and the controller
-pygame.init()
-pygame.joystick.init()
+    def record_data(self, timestamp=None, steering_angle=None, throttle=None):
+        """
+        Records timestamp (default: now), steering angle, and throttle values as one row.
+        steering_angle, throttle: set together with the row (default: the values last set), so
+        rows recorded from different threads never mix the values of two commands
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self._condition:
+            if steering_angle is not None:
+                self.steering_angle = steering_angle
+            if throttle is not None:
+                self.throttle = throttle
+            chunk, row = self._chunk, self._rows
+            chunk['timestamp'][row] = timestamp
+            chunk['steering_angle'][row] = self.steering_angle
+            chunk['throttle'][row] = self.throttle
+            self._rows += 1
+            self.counters["rows"] += 1
+            if self._rows == self.chunk_rows:
+                self._full.append((self._chunk, self._rows))
+                self._chunk = self._new_chunk()
+                self._rows = 0
+                self._condition.notify_all()
 
-try:
-    controller = pygame.joystick.Joystick(0)
-    controller.init()
-except pygame.error:
-    print("No joystick found. Please connect a controller and try again.")
-    pygame.quit()
-    exit()
+    def _take_rows(self):
+        """Filled chunks and the current partial one, handed over to be written."""
+        with self._condition:
+            batches, self._full = self._full, []
+            if self._rows:
+                batches.append((self._chunk, self._rows))
+                self._chunk = self._new_chunk()
+                self._rows = 0
+        return batches
 
-# Initialize Controller Logger
-controller_logger = ControllerInputLogger()
+    def _write_loop(self):
+        cpu_start = time.thread_time()
+        while not self._stop_event.is_set():
+            with self._condition:
+                self._condition.wait_for(lambda: self._full or self._stop_event.is_set(), self.flush_interval)
+            self.flush()
+        self.counters["writer_cpu_s"] = time.thread_time() - cpu_start
 
-print("Starting controller input logging. Press Ctrl+C to stop.")
+    def flush(self):
+        """Write every recorded row to the file now."""
+        with self._write_lock:
+            batches = self._take_rows()
+            if not batches:
+                return
+            start = time.perf_counter()
+            for chunk, rows in batches:
+                columns = (chunk['timestamp'][:rows], chunk['steering_angle'][:rows], chunk['throttle'][:rows])
+                if self.column_log is not None:
+                    self.column_log.write_columns(columns)
+                else:
+                    self.csv_writer.writerows(np.column_stack(columns).tolist())
+                self.counters["rows_written"] += rows
+            if self.column_log is not None:
+                self.column_log.flush()
+            else:
+                self.data_file.flush()
+            if self.fsync:
+                os.fsync(self.data_file.fileno())
+            self.counters["batches"] += 1
+            self.counters["write_s"] += time.perf_counter() - start
+            with self._condition:
+                self._free.extend(chunk for chunk, _ in batches)
+
+    def close(self):
+        """Write the remaining rows, stop the writer thread and close the file."""
+        if self.data_file.closed:
+            return
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._writer.join()
+        self.flush()
+        if self.column_log is not None:
+            # Writes the footer index
+            self.column_log.close()
+        else:
+            self.data_file.close()
+
+    def __del__(self):
+        # Close the CSV file when the instance is deleted
+        if getattr(self, "data_file", None) is not None:
+            self.close()
 
-try:
-    while True:
-        pygame.event.pump()  # Process events to update controller state
+    def __enter__(self):
+        return self
 
-        # Read the controller input
-        steering_value = controller.get_axis(0)    # Left thumbstick horizontal axis
-        forward_value = controller.get_axis(5)     # Right trigger (forward throttle)
-        reverse_value = controller.get_axis(4)     # Left trigger (reverse throttle)
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def stick_values(axes):
+        """(steering, throttle), each -1 to 1, for the controller's axis values."""
+        steering_value = axes[0]    # Left thumbstick horizontal axis
+        forward_value = axes[5]     # Right trigger (forward throttle)
+        reverse_value = axes[4]     # Left trigger (reverse throttle)
 
         # Combine throttle values into a single throttle range (-1 to 1)
         throttle_value = (forward_value + 1) / 2 - (reverse_value + 1) / 2  # Ensure values are scaled correctly
+        return steering_value, throttle_value
+
+    def map_axes(self, axes):
+        """(steering angle, throttle) for the controller's axis values."""
+        steering_value, throttle_value = self.stick_values(axes)
+        return steering_value * self.max_steering, throttle_value * self.max_throttle
+
+    def _log_change(self, timestamp, axes):
+        self.record(*self.map_axes(axes), timestamp)
+
+    def _drive_change(self, timestamp, axes):
+        # Hot path of teleop: straight from the controller report to the servos, then one
+        # in-memory row; the file and the console are handled by other threads
+        self.car.drive(*self.stick_values(axes))
+        self.teleop_latency.append(time.time() - timestamp)
+        self.record(*self.map_axes(axes), timestamp)
+
+    def teleop_stats(self):
+        """Count and percentiles (ms) of the time from a controller report to its servo write."""
+        latency = sorted(self.teleop_latency)
+        if not latency:
+            return {"count": 0}
+        return {"count": len(latency),
+                "p50_ms": 1e3 * latency[len(latency) // 2],
+                "p99_ms": 1e3 * latency[min(int(0.99 * len(latency)), len(latency) - 1)],
+                "max_ms": 1e3 * latency[-1]}
+
+    def start_logging(self, stop_event=None, verbose=True, rate=10, realtime=False, cpus=None, driver="pygame",
+                      every_change=False, car=None, input_timeout=1.0):
+        """
+        Read the first game controller and log its inputs until stopped.
+        The controller is read by a ControllerReader, which timestamps each change as it arrives.
+        - stop_event: optional threading.Event that ends the logging when set
+        - verbose: print the mapped values on every iteration and the loop timing at the end
+        - rate: rows per second, kept on fixed deadlines by a ControlLoop
+        - realtime, cpus: scheduling priority and CPU affinity of the loop (see ControlLoop)
+        - driver: "pygame" or "evdev", see backends.open_joystick
+        - every_change: log one row per controller report at its arrival time instead of at `rate`
+        - car: teleop; drive this SlugMobile (anything with drive(steering, throttle) and
+          set_controls(angle, throttle)) on every controller report, logging every command as
+          with every_change
+        - input_timeout: teleop deadman; when the controller has not reported for this many
+          seconds, or it was disconnected, the car is set to neutral (90, 90) until the next
+          report (None: never). Holding the sticks perfectly still counts as no report.
+        The log file is complete and closed when this returns.
+        Returns the ControlLoop stats, with the input to servo write latency under "teleop".
+        """
+        try:
+            controller = open_joystick(0, driver)
+        except RuntimeError as e:
+            print(e)
+            return None
+
+        print("Starting controller input logging. Press Ctrl+C to stop.")
+        self.car = car
+        if car is not None:
+            on_change = self._drive_change
+        elif every_change:
+            on_change = self._log_change
+        else:
+            on_change = None
+        reader = ControllerReader(controller, on_change=on_change).start()
+        reader_started = time.time()
+        # Controller seq at which the car was last stopped for lack of input
+        stopped_at = [None]
+
+        def check_input():
+            seq, timestamp, _ = reader.state()
+            last_report = reader_started if timestamp is None else timestamp
+            if reader.alive() and (input_timeout is None or time.time() - last_report < input_timeout):
+                return
+            if stopped_at[0] == seq:
+                return
+            stopped_at[0] = seq
+            car.set_controls(90, 90)
+            self.record(0.0, 0.0)
+            if reader.alive():
+                print(f"Warning: no controller input for {input_timeout} s, car set to neutral")
+            else:
+                print("Warning: controller lost, car set to neutral")
+
+        def step(tick):
+            if car is not None:
+                with tick.stage("deadman"):
+                    check_input()
+            with tick.stage("read"):
+                _, _, axes = reader.state()
+                steering, throttle = self.map_axes(axes)
 
-        # Map and log the values
-        controller_logger.set_steering_angle(steering_value * controller_logger.max_steering)
-        controller_logger.set_throttle(throttle_value * controller_logger.max_throttle)
+            if on_change is None:
+                with tick.stage("log"):
+                    # One row per tick, written out by the writer thread
+                    self.record(steering, throttle)
 
-        # Print to console for real-time feedback (optional)
-        print(f"Steering: {steering_value * controller_logger.max_steering}, Throttle: {throttle_value * controller_logger.max_throttle}")
+            # Print to console for real-time feedback (optional)
+            if verbose:
+                print(f"Steering: {steering}, Throttle: {throttle}")
 
-        # Delay for a smoother output (adjust as needed)
-        time.sleep(0.1)
+        loop = ControlLoop(rate, step, realtime=realtime, cpus=cpus)
+        try:
+            loop.run(stop_event)
+        except KeyboardInterrupt:
+            print("Logging stopped by user.")
+        finally:
+            reader.stop()
+            self.close()
+        stats = loop.stats()
+        if car is not None:
+            stats["teleop"] = self.teleop_stats()
+        if verbose:
+            print(f"Controller loop: {stats['iterations']} iterations at {stats['achieved_hz'] or 0:.1f} Hz, "
+                  f"{stats['overruns']} overruns, jitter p99 {stats['jitter_us']['p99'] or 0:.0f} us")
+            if car is not None and stats["teleop"]["count"]:
+                print(f"Teleop: {stats['teleop']['count']} commands, input to servo p50 "
+                      f"{stats['teleop']['p50_ms']:.2f} ms, p99 {stats['teleop']['p99_ms']:.2f} ms")
+        return stats
 
-except KeyboardInterrupt:
-    print("Logging stopped by user.")
-finally:
-    pygame.quit()
+if __name__ == "__main__":
+    # Initialize Controller Logger
+    controller_logger = ControllerInputLogger()
+    controller_logger.start_logging()
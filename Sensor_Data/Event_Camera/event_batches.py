@@ -0,0 +1,169 @@
+import bisect
+import threading
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import EVENT_CD_DTYPE, open_events_iterator
+
+class EventBatcher:
+    """
+    Reads an event camera on a background thread and hands out events as structured NumPy
+    arrays (fields x, y, p, t; t in microseconds) by time window or by count.
+    Events are kept in a bounded buffer; when the consumer falls behind and the buffer is
+    full, the oldest events are dropped and counted in `counters`.
+    - iterator: EventsIterator-like source yielding event arrays; by default the first
+      camera, read in delta_t=1000 (1 ms) slices so events reach the buffer quickly
+    - max_events: buffer capacity in events (16 bytes each)
+    """
+    def __init__(self, iterator=None, max_events=4_000_000):
+        if iterator is None:
+            iterator = open_events_iterator(input_path="", mode="delta_t", delta_t=1000)
+        self.iterator = iterator
+        self.max_events = max_events
+        # Buffered chunks with the absolute number and timestamp of their first event, for bisection
+        self.chunks = []
+        self._chunk_starts = []
+        self._chunk_times = []
+        # Absolute event numbers: first event still buffered, next event not handed out yet
+        self._first = 0
+        self._read = 0
+        self._size = 0
+        self._window_start = None
+        self.counters = {"received": 0, "dropped": 0, "overflows": 0}
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.finished = False
+
+    def start(self):
+        self._thread = threading.Thread(target=self._read_loop, name="EventBatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def _read_loop(self):
+        try:
+            for events in self.iterator:
+                if self._stop_event.is_set():
+                    break
+                if not len(events):
+                    continue
+                # The iterator may reuse its buffer for the next slice
+                events = np.array(events, dtype=EVENT_CD_DTYPE)
+                with self._condition:
+                    self._chunk_starts.append(self._first + self._size)
+                    self._chunk_times.append(int(events['t'][0]))
+                    self.chunks.append(events)
+                    self._size += len(events)
+                    self.counters["received"] += len(events)
+                    self._trim()
+                    self._condition.notify_all()
+        finally:
+            with self._condition:
+                self.finished = True
+                self._condition.notify_all()
+
+    def _trim(self):
+        removed = 0
+        while self._size > self.max_events and removed < len(self.chunks) - 1:
+            self._size -= len(self.chunks[removed])
+            removed += 1
+        if not removed:
+            return
+        del self.chunks[:removed], self._chunk_starts[:removed], self._chunk_times[:removed]
+        self._first = self._chunk_starts[0]
+        if self._read < self._first:
+            # Only events nobody has seen count as dropped
+            self.counters["dropped"] += self._first - self._read
+            self._read = self._first
+            self.counters["overflows"] += 1
+            # Windows restart at the oldest event left rather than replaying the gap as empty windows
+            self._window_start = None
+
+    def _slice(self, start, end):
+        """Buffered events with absolute numbers in [start, end), concatenated."""
+        pieces = []
+        index = max(bisect.bisect_right(self._chunk_starts, start) - 1, 0)
+        while index < len(self.chunks) and self._chunk_starts[index] < end:
+            position, chunk = self._chunk_starts[index], self.chunks[index]
+            if position + len(chunk) > start:
+                pieces.append(chunk[max(start - position, 0):min(end - position, len(chunk))])
+            index += 1
+        if not pieces:
+            return np.zeros(0, dtype=EVENT_CD_DTYPE)
+        # Into an EVENT_CD_DTYPE array: concatenating structured arrays would drop the padding before t
+        out = np.empty(sum(len(piece) for piece in pieces), dtype=EVENT_CD_DTYPE)
+        return np.concatenate(pieces, out=out)
+
+    def _count_before(self, t):
+        """Absolute number of the first buffered event with timestamp >= t."""
+        # The last chunk starting before t is the only one that can hold both sides of t
+        index = bisect.bisect_left(self._chunk_times, t) - 1
+        if index < 0:
+            return self._first
+        return self._chunk_starts[index] + int(np.searchsorted(self.chunks[index]["t"], t))
+
+    def _newest_time(self):
+        return int(self.chunks[-1]["t"][-1]) if self.chunks else None
+
+    def next_window(self, delta_t, timeout=None):
+        """
+        Next delta_t microseconds of events, consecutive with the previous window.
+        Blocks until the stream has moved past the end of the window; returns None if
+        timeout (seconds) expires first or the stream ended.
+        """
+        with self._condition:
+            if self._window_start is None:
+                if not self._condition.wait_for(lambda: self._read < self._first + self._size or self.finished, timeout) \
+                        or self._read >= self._first + self._size:
+                    return None
+                self._window_start = int(self._slice(self._read, self._read + 1)["t"][0])
+            end = self._window_start + delta_t
+            if not self._condition.wait_for(lambda: (self._newest_time() or -1) >= end or self.finished, timeout) \
+                    or (self._newest_time() or -1) < end:
+                return None
+            stop = max(self._count_before(end), self._read)
+            events = self._slice(self._read, stop)
+            self._read = stop
+            self._window_start = end
+            return events
+
+    def next_events(self, n_events, timeout=None):
+        """Next n_events events not handed out yet; None if timeout (seconds) expires first."""
+        if n_events > self.max_events:
+            raise ValueError(f"n_events must be at most max_events ({self.max_events})")
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._first + self._size - self._read >= n_events or self.finished,
+                                            timeout) or self._first + self._size - self._read < n_events:
+                return None
+            events = self._slice(self._read, self._read + n_events)
+            self._read += n_events
+            # Windows restart at the next event after a count-based read
+            self._window_start = None
+            return events
+
+    def latest_window(self, delta_t):
+        """Events of the last delta_t microseconds of the stream, whether handed out before or not."""
+        with self._condition:
+            newest = self._newest_time()
+            if newest is None:
+                return np.zeros(0, dtype=EVENT_CD_DTYPE)
+            return self._slice(self._count_before(newest - delta_t + 1), self._first + self._size)
+
+    def latest_events(self, n_events):
+        """The last n_events events of the stream (fewer if not buffered)."""
+        with self._condition:
+            end = self._first + self._size
+            return self._slice(max(end - n_events, self._first), end)
+
+    def stats(self):
+        """Counters plus the number of events buffered and not handed out yet."""
+        with self._condition:
+            return dict(self.counters, pending=self._first + self._size - self._read)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            # The reader notices the stop with the iterator's next slice
+            self._thread.join(timeout=1.0)
+            self._thread = None
@@ -0,0 +1,111 @@
+"""
+Event arrays (fields x, y, p, t as recorded/batched, t in microseconds) to dense tensors
+for networks:
+
+- polarity_histogram: (2, H, W) event counts per polarity
+- voxel_grid: (bins, H, W) polarity-signed counts spread over time bins
+- TimeSurface: (2, H, W) exponentially decaying time of the last event per pixel,
+  updated batch by batch
+
+Accumulation is done with np.bincount over the distinct flattened pixel indices of a batch,
+so the cost follows the number of events rather than the sensor resolution.
+The histogram and voxel grid add into `out` when given, so a tensor can be built up over
+several batches.
+"""
+import numpy as np
+
+def _pixel_index(events, width):
+    return events['y'].astype(np.intp) * width + events['x']
+
+def _accumulate(flat, index, weights=None):
+    """flat[index] += weights (or 1), summing duplicate indices."""
+    # bincount over the whole frame would touch every pixel for a few thousand events
+    pixels, inverse = np.unique(index, return_inverse=True)
+    flat[pixels] += np.bincount(inverse, weights=weights, minlength=len(pixels))
+
+def polarity_histogram(events, height, width, out=None, dtype=np.float32):
+    """
+    Events per pixel and polarity, shape (2, height, width); channel 0 is OFF, 1 is ON.
+    - out: existing (2, height, width) array to add the counts to
+    """
+    if out is None:
+        out = np.zeros((2, height, width), dtype=dtype)
+    index = events['p'].astype(np.intp) * (height * width) + _pixel_index(events, width)
+    _accumulate(out.reshape(-1), index)
+    return out
+
+def voxel_grid(events, bins, height, width, t_start=None, t_end=None, out=None, dtype=np.float32):
+    """
+    Temporal voxel grid, shape (bins, height, width): each event adds +1 (ON) or -1 (OFF),
+    split linearly between the two nearest time bins.
+    - t_start, t_end: time range mapped onto the bins (default: first and last event);
+      give them explicitly when accumulating several batches into the same `out`
+    - out: existing (bins, height, width) array to add to
+    """
+    if out is None:
+        out = np.zeros((bins, height, width), dtype=dtype)
+    if not len(events):
+        return out
+    t = events['t']
+    if t_start is None:
+        t_start = t[0]
+    if t_end is None:
+        t_end = t[-1]
+    scale = (bins - 1) / max(float(t_end - t_start), 1.0)
+    position = np.clip((t - t_start) * scale, 0, bins - 1).astype(np.float32)
+    lower = position.astype(np.intp)
+    upper_weight = position - lower
+    polarity = events['p'].astype(np.float32) * 2 - 1
+    size = height * width
+    pixel = _pixel_index(events, width)
+    # Events in the last bin have no upper neighbour, their upper weight is 0
+    upper = np.minimum(lower + 1, bins - 1)
+    index = np.concatenate([lower * size + pixel, upper * size + pixel])
+    weights = np.concatenate([polarity * (1 - upper_weight), polarity * upper_weight])
+    _accumulate(out.reshape(-1), index, weights)
+    return out
+
+class TimeSurface:
+    """
+    Exponentially decaying time surface, shape (2, height, width).
+    update() only records the time of the latest event at each touched pixel, so each batch
+    costs O(events); render() evaluates exp((t_last - t_now) / tau) for the whole frame.
+    - tau: decay time constant in microseconds
+    """
+    def __init__(self, height, width, tau=50000):
+        self.height = height
+        self.width = width
+        self.tau = tau
+        # Pixels that never saw an event render as 0
+        self.last_t = np.full(2 * height * width, np.iinfo(np.int64).min // 2, dtype=np.int64)
+        self.t_now = None
+
+    def update(self, events):
+        """Add a batch of events in time order."""
+        if not len(events):
+            return
+        index = events['p'].astype(np.intp) * (self.height * self.width) + _pixel_index(events, self.width)
+        # Fancy assignment does not guarantee the last duplicate wins, pick the last event per pixel explicitly
+        reversed_index = index[::-1]
+        pixels, last = np.unique(reversed_index, return_index=True)
+        self.last_t[pixels] = events['t'][::-1][last]
+        self.t_now = int(events['t'][-1])
+
+    def render(self, t_now=None, out=None):
+        """
+        Surface values at t_now (default: time of the latest event), shape (2, height, width).
+        - out: float32 array of that shape to render into
+        """
+        if t_now is None:
+            t_now = self.t_now if self.t_now is not None else 0
+        if out is None:
+            out = np.empty((2, self.height, self.width), dtype=np.float32)
+        flat = out.reshape(-1)
+        np.subtract(self.last_t, t_now, out=flat, casting='unsafe')
+        flat *= 1.0 / self.tau
+        np.exp(flat, out=flat)
+        return out
+
+    def reset(self):
+        self.last_t.fill(np.iinfo(np.int64).min // 2)
+        self.t_now = None
@@ -1,36 +1,217 @@
-from metavision_hal import DeviceDiscovery
-from metavision_core.event_io import DatWriter
+import json
+import os
+import sys
+import threading
 import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import open_event_device
 
-def main():
-    device = DeviceDiscovery.open("")
+# "evt" header field of the RAW encodings
+EVT_VERSIONS = {"EVT2": "2.0", "EVT21": "2.1", "EVT3": "3.0"}
+
+def raw_header(device, width, height):
+    """
+    Header of a Metavision RAW file for the device's event stream: "% key value" lines ending
+    with "% end", as written by the SDK's raw logger. The SDK reads the encoding and sensor size
+    from it to decode the raw buffers that follow.
+    """
+    identification = device.get_i_hw_identification()
+    encoding = identification.get_current_data_encoding_format()
+    fields = [("date", time.strftime("%Y-%m-%d %H:%M:%S"))]
+    if encoding in EVT_VERSIONS:
+        fields.append(("evt", EVT_VERSIONS[encoding]))
+    fields += [("format", f"{encoding};height={height};width={width}"),
+               ("geometry", f"{width}x{height}"),
+               ("serial_number", identification.get_serial())]
+    return "".join(f"% {key} {value}\n" for key, value in fields).encode() + b"% end\n"
+
+class EventRecorder:
+    """
+    Records a raw event stream with two threads and two preallocated buffers:
+    the acquisition thread polls the stream (sleeping poll_interval when nothing is ready)
+    and copies buffers into the fill buffer; the writer thread writes the other one to disk.
+    The buffers are swapped when the fill buffer is full or flush_interval has passed and the
+    writer is idle. Nothing is ever dropped: EVT 2.0/3.0 carry time-high and address state from
+    one buffer to the next, so a gap would corrupt every event after it. If the writer falls so
+    far behind that both buffers are full, acquisition waits for it (the camera keeps buffering
+    on its side meanwhile; stalls are counted), and a stream buffer larger than buffer_bytes
+    grows the fill buffer.
+    - stream: started-or-not HAL I_EventsStream (poll_buffer, get_latest_raw_data)
+    - output_file: path of the recording
+    - header: bytes written before the stream, see raw_header
+    - buffer_bytes: size of each of the two buffers
+    - flush_interval: seconds after which a partly filled buffer is handed to the writer
+    - poll_interval: seconds to sleep when the stream has no new buffer
+    """
+    def __init__(self, stream, output_file, buffer_bytes=8 * 1024 * 1024, flush_interval=0.5, poll_interval=0.002,
+                 header=b""):
+        self.stream = stream
+        self.output_file = output_file
+        self.header = header
+        self.buffer_bytes = buffer_bytes
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self._buffers = [bytearray(buffer_bytes), bytearray(buffer_bytes)]
+        self._fill = 0
+        self._fill_len = 0
+        # Bytes of the other buffer waiting for the writer, 0 while the writer is idle
+        self._drain_len = 0
+        self._last_swap = time.monotonic()
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._acquired = False
+        self._threads = []
+        self.counters = {"buffers": 0, "bytes_received": 0, "bytes_written": 0, "stalls": 0, "stall_s": 0.0,
+                         "grown": 0, "swaps": 0, "max_depth_bytes": 0, "acquire_cpu_s": 0.0, "writer_cpu_s": 0.0}
+        self._rate_bytes = 0
+        self._rate_time = time.monotonic()
+
+    def start(self):
+        self._file = open(self.output_file, 'wb', buffering=0)
+        self._file.write(self.header)
+        self.stream.start()
+        self._threads = [threading.Thread(target=self._acquire_loop, name="EventAcquire", daemon=True),
+                         threading.Thread(target=self._write_loop, name="EventWriter", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _swap(self):
+        """Hand the fill buffer to the writer; only called with the lock held and the writer idle."""
+        self._drain_len = self._fill_len
+        self._fill = 1 - self._fill
+        self._fill_len = 0
+        self._last_swap = time.monotonic()
+        self.counters["swaps"] += 1
+        self._condition.notify_all()
+
+    def _acquire_loop(self):
+        cpu_start = time.thread_time()
+        while not self._stop_event.is_set():
+            if not self.stream.poll_buffer():
+                with self._condition:
+                    if (self._fill_len and not self._drain_len
+                            and time.monotonic() - self._last_swap >= self.flush_interval):
+                        self._swap()
+                time.sleep(self.poll_interval)
+                continue
+            data = self.stream.get_latest_raw_data()
+            if data is None:
+                continue
+            size = len(data)
+            with self._condition:
+                self.counters["buffers"] += 1
+                self.counters["bytes_received"] += size
+                if self._fill_len + size > len(self._buffers[self._fill]) and self._fill_len:
+                    if self._drain_len:
+                        # Writer still busy with the other buffer
+                        stall_start = time.monotonic()
+                        self._condition.wait_for(lambda: not self._drain_len)
+                        self.counters["stalls"] += 1
+                        self.counters["stall_s"] += time.monotonic() - stall_start
+                    self._swap()
+                if size > len(self._buffers[self._fill]):
+                    # The writer never touches the fill buffer, it can be replaced
+                    self._buffers[self._fill] = bytearray(size)
+                    self.counters["grown"] += 1
+                fill_start = self._fill_len
+                self._fill_len += size
+                self.counters["max_depth_bytes"] = max(self.counters["max_depth_bytes"], self._fill_len + self._drain_len)
+            # The writer never touches the fill buffer, so the copy needs no lock
+            memoryview(self._buffers[self._fill])[fill_start:fill_start + size] = memoryview(data).cast('B')
+        with self._condition:
+            self._acquired = True
+            self._condition.notify_all()
+        self.counters["acquire_cpu_s"] = time.thread_time() - cpu_start
+
+    def _write_loop(self):
+        cpu_start = time.thread_time()
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._drain_len or self._acquired)
+                if not self._drain_len:
+                    if not self._fill_len:
+                        break
+                    # Acquisition has ended: write out what is left in the fill buffer
+                    self._swap()
+                drain, size = 1 - self._fill, self._drain_len
+            self._file.write(memoryview(self._buffers[drain])[:size])
+            with self._condition:
+                self._drain_len = 0
+                self.counters["bytes_written"] += size
+                self._condition.notify_all()
+        self.counters["writer_cpu_s"] = time.thread_time() - cpu_start
+
+    def depth(self):
+        """Bytes received and not written yet."""
+        with self._condition:
+            return self._fill_len + self._drain_len
+
+    def stats(self):
+        """Counters, current buffer depth and the receive rate since the previous stats() call."""
+        with self._condition:
+            now = time.monotonic()
+            received = self.counters["bytes_received"]
+            rate = (received - self._rate_bytes) / max(now - self._rate_time, 1e-9)
+            self._rate_bytes, self._rate_time = received, now
+            return dict(self.counters, depth_bytes=self._fill_len + self._drain_len, bytes_per_s=rate)
+
+    def stop(self):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self.stream.stop()
+        self._file.close()
+        return self.stats()
+
+def record_event_camera_data(output_file=None, stop_event=None, device=None, buffer_bytes=8 * 1024 * 1024):
+    """
+    Record the raw event stream of the first event camera found into a Metavision RAW file
+    (header, then the stream's buffers unchanged), readable by the SDK's EventsIterator.
+    The wall time at which recording started and the sensor size are saved next to it in
+    <output_file>.json, so the sensor timestamps can be aligned with the other sensors.
+    - output_file: path of the recording (default: recording_<date>_<time>.raw)
+    - stop_event: optional threading.Event that ends the recording when set
+    - device: already opened HAL device to record instead of the first camera found
+    - buffer_bytes: size of each of the recorder's two buffers, see EventRecorder
+    Returns the recorder counters.
+    """
+    if device is None:
+        device = open_event_device("")
     width = device.get_i_geometry().get_width()
     height = device.get_i_geometry().get_height()
-    
+
     # Output filename with timestamp
-    filename = f"recording_{time.strftime('%Y%m%d_%H%M%S')}.dat"
-    
-    # Initialize DAT writer
-    writer = DatWriter(filename, height=height, width=width)
-    
-    # Get CD (Change Detection) events from the camera
-    i_events = device.get_i_events_stream()
-    
-    print(f"Recording to {filename}...")
+    if output_file is None:
+        output_file = f"recording_{time.strftime('%Y%m%d_%H%M%S')}.raw"
+
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    # The stream hands out raw encoded buffers, they are written unchanged after the header
+    recorder = EventRecorder(device.get_i_events_stream(), output_file, buffer_bytes,
+                             header=raw_header(device, width, height))
+    # The sensor clock starts with the stream
+    start_time = time.time()
+    recorder.start()
+    with open(output_file + ".json", "w") as f:
+        json.dump({"start_time": start_time, "width": width, "height": height}, f)
+
+    print(f"Recording {width}x{height} events to {output_file}...")
     print("Press Ctrl+C to stop recording")
-    
+
     try:
-        while True:
-            # Get next event buffer
-            events = i_events.get_latest_raw_data()
-            if events is not None:
-                writer.write(events)
-            
+        while not stop_event.wait(0.5):
+            pass
     except KeyboardInterrupt:
         print("\nStopping recording...")
     finally:
-        writer.close()
-        print("Recording finished!")
+        stats = recorder.stop()
+        print("Recording finished! {bytes_written} bytes written, {stalls} writer stalls".format(**stats))
+    return stats
+
+def main():
+    record_event_camera_data()
 
 if __name__ == "__main__":
     main()
@@ -1,44 +1,100 @@
 import csv
+import os
+import sys
 import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import open_smbus
 from BMX160 import BMX160
+from column_log import ColumnLogWriter, IMU_COLUMNS
 
-bmx = BMX160(1)
+def print_imu_data(data):
+    print("magn: x: {0:.2f} uT, y: {1:.2f} uT, z: {2:.2f} uT".format(data[0], data[1], data[2]))
+    print("gyro  x: {0:.2f} g, y: {1:.2f} g, z: {2:.2f} g".format(data[3], data[4], data[5]))
+    print("accel x: {0:.2f} m/s^2, y: {1:.2f} m/s^2, z: {2:.2f} m/s^2".format(data[6], data[7], data[8]))
+    print(" ")
 
-# Wait for sensor initialization
-while not bmx.begin():
-    time.sleep(2)
+def log_imu_data(output_file="imu_data.csv", use_fifo=False, stop_event=None, rate=None, print_interval=1.0,
+                 samples=None, flush_interval=0.5):
+    """
+    Log every BMX160 sample to a CSV file, or to a binary column log if output_file ends in .col.
+    - output_file: path of the CSV (or .col) file to write
+    - use_fifo: drain samples from the sensor FIFO in bursts instead of polling the data-ready bits
+    - stop_event: optional threading.Event that ends the recording when set
+    - rate: output data rate in Hz to configure on the sensor (default: keep the chip's 100 Hz)
+    - print_interval: seconds between console printouts, None disables printing
+    - samples: iterable of (timestamp, data) to log instead of opening the sensor
+    - flush_interval: seconds between writes of a .col log to the file (CSV rows are flushed one by one)
+    """
+    if samples is None:
+        bmx = BMX160(open_smbus(1))
+
+        # Wait for sensor initialization
+        while not bmx.begin():
+            time.sleep(2)
+
+        if rate is not None:
+            bmx.set_odr(rate)
+
+        if use_fifo:
+            bmx.enable_fifo()
+            samples = bmx.iter_fifo()
+        else:
+            samples = bmx.iter_data_ready()
+    last_print = 0
+
+    if output_file.endswith(".col"):
+        _log_imu_columns(output_file, samples, stop_event, print_interval, flush_interval)
+        return
 
-def main():
     # Open CSV file for writing
-    with open("imu_data.csv", "w", newline="") as csvfile:
+    with open(output_file, "w", newline="") as csvfile:
         csv_writer = csv.writer(csvfile)
         # Write header
         csv_writer.writerow(["timestamp", "magn_x", "magn_y", "magn_z",
                              "gyro_x", "gyro_y", "gyro_z",
                              "accel_x", "accel_y", "accel_z"])
-        
-        while True:
-            try:
-                # Get sensor data
-                data = bmx.get_all_data()
-                timestamp = time.time()
-                
+
+        try:
+            for timestamp, data in samples:
+                if stop_event is not None and stop_event.is_set():
+                    break
+
                 # Write row to CSV
                 csv_writer.writerow([timestamp, *data])
                 csvfile.flush()  # Ensure data is written immediately
-                
+
                 # Print data to console for verification
-                print("magn: x: {0:.2f} uT, y: {1:.2f} uT, z: {2:.2f} uT".format(data[0], data[1], data[2]))
-                print("gyro  x: {0:.2f} g, y: {1:.2f} g, z: {2:.2f} g".format(data[3], data[4], data[5]))
-                print("accel x: {0:.2f} m/s^2, y: {1:.2f} m/s^2, z: {2:.2f} m/s^2".format(data[6], data[7], data[8]))
-                print(" ")
+                if print_interval is not None and timestamp - last_print >= print_interval:
+                    print_imu_data(data)
+                    last_print = timestamp
+
+        except KeyboardInterrupt:
+            print("Recording stopped by user.")
+
+def _log_imu_columns(output_file, samples, stop_event, print_interval, flush_interval):
+    last_print = 0
+    last_flush = time.monotonic()
+    with ColumnLogWriter(output_file, IMU_COLUMNS, metadata={"sensor": "BMX160"}) as log:
+        try:
+            for timestamp, data in samples:
+                if stop_event is not None and stop_event.is_set():
+                    break
 
-                # Delay for data collection rate
-                time.sleep(1)
+                # Buffered in memory, written as a chunk every flush_interval
+                log.write(timestamp, *data)
+                if time.monotonic() - last_flush >= flush_interval:
+                    log.flush()
+                    last_flush = time.monotonic()
 
-            except KeyboardInterrupt:
-                print("Recording stopped by user.")
-                break
+                if print_interval is not None and timestamp - last_print >= print_interval:
+                    print_imu_data(data)
+                    last_print = timestamp
+
+        except KeyboardInterrupt:
+            print("Recording stopped by user.")
+
+def main():
+    log_imu_data()
 
 if __name__ == "__main__":
     main()
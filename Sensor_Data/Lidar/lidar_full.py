@@ -1,45 +1,126 @@
+import os
 import signal
 import sys
-import struct
-from hokuyolx import HokuyoLX
+import threading
+import time
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backends import open_lidar
 
-# Initialize the LIDAR
-laser = HokuyoLX()
+# One .dat record: timestamp as double followed by the scan distances as floats
+LIDAR_BEAMS = 1081
+
+def lidar_record_dtype(beams=LIDAR_BEAMS):
+    """.dat record of a scanner with `beams` distances per scan (the file does not store it)."""
+    return np.dtype([('timestamp', '<f8'), ('scan', '<f4', (beams,))])
+
+LIDAR_RECORD_DTYPE = lidar_record_dtype()
+
+class LidarDatWriter:
+    """
+    Buffered writer for LIDAR .dat files.
+    Scans are copied into a preallocated record buffer and written to the file in blocks,
+    straight from the buffer memory.
+    - filename: Name of the .dat file to store data
+    - buffer_records: scans per block write
+    - flush_interval: seconds a scan may wait in the buffer before the block is written early (None: only when full)
+    - fsync_interval: seconds between fsyncs of the file (0: after every block write, None: leave it to the OS)
+    - beams: distances per scan; readers of a file with other than LIDAR_BEAMS must be told
+    """
+    def __init__(self, filename, buffer_records=64, flush_interval=1.0, fsync_interval=None, beams=LIDAR_BEAMS):
+        self.file = open(filename, 'wb', buffering=0)
+        self.beams = beams
+        self.buffer = np.zeros(buffer_records, dtype=lidar_record_dtype(beams))
+        self.count = 0
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.records_written = 0
+        self._first_buffered = 0.0
+        self._last_fsync = time.monotonic()
+
+    def write(self, timestamp, scan):
+        """Buffers one scan of `beams` distances."""
+        if self.count == 0:
+            self._first_buffered = time.monotonic()
+        record = self.buffer[self.count]
+        record['timestamp'] = timestamp
+        record['scan'] = scan
+        self.count += 1
+        if self.count == len(self.buffer):
+            self.flush()
+        elif self.flush_interval is not None and time.monotonic() - self._first_buffered >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered scans to the file."""
+        if self.count:
+            self.file.write(self.buffer[:self.count].data)
+            self.records_written += self.count
+            self.count = 0
+        if self.fsync_interval is not None and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 """
-Function to write LIDAR data to a .dat file.
+Function to write LIDAR data to a .dat file, or to a .ldr log (lidar_log.py) when filename ends in .ldr.
+A .ldr log takes its beam count from the first scan and stores it; a .dat file holds
+LIDAR_BEAMS distances per scan. Scans of another length are skipped and counted.
 - generator_func: A generator function like laser.iterdist()
-- filename: Name of the .dat file to store data
+- filename: Name of the .dat or .ldr file to store data
+- stop_event: optional threading.Event that ends the recording when set
+- buffer_records, flush_interval: scans per block write / chunk and how long one may wait, see LidarDatWriter
+- fsync_interval: see LidarDatWriter (.dat only)
 """
-def write_lidar_to_dat(generator_func, filename):
+def write_lidar_to_dat(generator_func, filename, stop_event=None, buffer_records=64, flush_interval=1.0,
+                       fsync_interval=None):
     def signal_handler(sig, frame):
         print("\nInterrupted. Closing file and exiting.")
         sys.exit(0)
     
-    # Handle Ctrl+C gracefully
-    signal.signal(signal.SIGINT, signal_handler)
-
-    with open(filename, 'wb') as datfile:
-        try:
-            for timestamp, lidar_scan in generator_func():
-                if len(lidar_scan) != 1081:
-                    print(f"Warning: Expected 1081 elements, got {len(lidar_scan)}. Skipping this row.")
-                    continue
-
-                # Pack and write the timestamp and scan data into binary format
-                datfile.write(struct.pack('d', timestamp))  # Write timestamp as double
-                datfile.write(struct.pack(f'{len(lidar_scan)}f', *lidar_scan))  # Write scan distances as floats
-        except KeyboardInterrupt:
-            print("\nInterrupted. Closing file and exiting.")
-        finally:
-            datfile.close()
-            print("File closed.")
+    # Handle Ctrl+C gracefully (signal handlers can only be installed from the main thread)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, signal_handler)
+
+    if filename.endswith(".ldr"):
+        from lidar_log import LidarLogWriter
+        datfile = LidarLogWriter(filename, chunk_scans=buffer_records, flush_interval=flush_interval)
+    else:
+        datfile = LidarDatWriter(filename, buffer_records, flush_interval, fsync_interval)
+    skipped = 0
+    try:
+        for timestamp, lidar_scan in generator_func():
+            if stop_event is not None and stop_event.is_set():
+                break
+
+            beams = datfile.beams if datfile.beams is not None else len(lidar_scan)
+            if len(lidar_scan) != beams:
+                skipped += 1
+                print(f"Warning: Expected {beams} elements, got {len(lidar_scan)}. Skipping this row ({skipped} skipped).")
+                continue
+
+            datfile.write(timestamp, lidar_scan)
+    except KeyboardInterrupt:
+        print("\nInterrupted. Closing file and exiting.")
+    finally:
+        datfile.close()
+        print(f"File closed, {skipped} scans skipped." if skipped else "File closed.")
 
 """
-Substitute for laser.iterdist() for testing (generates fake data)
+Substitute for laser.iterdist() for testing (generates fake data).
+For paced, deterministic scans use the simulated backend instead (SLUG_MOBILE_BACKEND=sim).
 """
 def lidar_generator():
-    import time
     import random
     while True:
         timestamp = time.time()  # Precise timestamp (seconds with microsecond precision)
@@ -47,9 +128,12 @@ def lidar_generator():
         yield timestamp, lidar_scan
 
 if __name__ == "__main__":
-    # Define filename with timestamp for the .dat file
-    filename = f"lidar_output_{int(time.time())}.dat"
+    # Initialize the LIDAR
+    laser = open_lidar()
+
+    # Define filename with timestamp for the .ldr log
+    filename = f"lidar_output_{int(time.time())}.ldr"
 
-    # Start writing LIDAR data to the .dat file
+    # Start writing LIDAR data to the log
     print(f"Recording LIDAR data to {filename}...")
     write_lidar_to_dat(laser.iterdist, filename)
@@ -0,0 +1,352 @@
+"""
+Chunked, compressed LIDAR log format (.ldr).
+
+Layout (all integers little-endian):
+
+    header   b"SLUGLDR\\0", uint16 version, uint32 length, JSON metadata
+             (beams, angle_min, angle_max, units, scale, sensor_id, codec)
+    chunks   b"CHNK", uint32 scans, uint32 timestamps length, uint32 distances length,
+             zlib(float64 timestamps), encoded distances
+    footer   one (uint64 offset, uint32 scans, float64 first, float64 last) entry per chunk,
+             then uint64 footer offset, uint32 chunk count, b"SLUGIDX\\0"
+
+Codecs for the distances of a chunk:
+- "delta-zlib": distances / scale rounded to int32, delta-encoded along the beams of each
+  scan, then zlib. Lossless for the Hokuyo's integer millimetres with scale 1, rounds anything else.
+- "zlib": float32 distances, zlib. Lossless for any input.
+- "auto" (default): "delta-zlib" for chunks whose distances are whole multiples of scale,
+  "zlib" for the others; the encoded distances start with a byte telling which.
+
+A log without a footer (recording cut off) is still readable: the chunks are scanned
+from the header and a trailing partial chunk is ignored.
+
+Convert an existing raw .dat recording with:
+
+    python3 lidar_log.py lidar_output_1700000000.dat lidar_output_1700000000.ldr
+"""
+import bisect
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+
+MAGIC = b"SLUGLDR\0"
+FOOTER_MAGIC = b"SLUGIDX\0"
+CHUNK_MAGIC = b"CHNK"
+VERSION = 1
+CODECS = ("auto", "delta-zlib", "zlib")
+# Leading byte of the encoded distances of an "auto" chunk
+_AUTO_CODECS = ("delta-zlib", "zlib")
+
+_PREAMBLE = struct.Struct("<8sHI")
+_CHUNK = struct.Struct("<4sIII")
+_INDEX_ENTRY = struct.Struct("<QIdd")
+_TRAILER = struct.Struct("<QI8s")
+
+# Hokuyo UST-10LX: 1081 steps over 270 degrees
+HOKUYO_ANGLE_MIN = -0.75 * np.pi
+HOKUYO_ANGLE_MAX = 0.75 * np.pi
+
+
+def encode_scans(scans, codec, scale):
+    if codec == "auto":
+        scans = np.asarray(scans, dtype=np.float64)
+        quantized = np.rint(scans / scale)
+        # Quantize only when decoding gives back exactly the same distances
+        exact = np.array_equal(quantized * scale, scans) and np.all(np.abs(quantized) < 2 ** 31)
+        chunk_codec = "delta-zlib" if exact else "zlib"
+        return bytes([_AUTO_CODECS.index(chunk_codec)]) + encode_scans(scans, chunk_codec, scale)
+    if codec == "delta-zlib":
+        quantized = np.rint(np.asarray(scans, dtype=np.float64) / scale).astype("<i4")
+        deltas = np.diff(quantized, axis=1, prepend=0).astype("<i4")
+        return zlib.compress(deltas.tobytes(), 6)
+    if codec == "zlib":
+        return zlib.compress(np.asarray(scans, dtype="<f4").tobytes(), 6)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decode_scans(data, count, beams, codec, scale):
+    if codec == "auto":
+        return decode_scans(data[1:], count, beams, _AUTO_CODECS[data[0]], scale)
+    raw = zlib.decompress(data)
+    if codec == "delta-zlib":
+        deltas = np.frombuffer(raw, dtype="<i4").reshape(count, beams)
+        return (np.cumsum(deltas, axis=1, dtype=np.int64) * scale).astype(np.float32)
+    if codec == "zlib":
+        return np.frombuffer(raw, dtype="<f4").reshape(count, beams).copy()
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class LidarLogWriter:
+    """
+    Writes scans to a .ldr log, chunk_scans scans per compressed chunk.
+    - filename: Name of the log file
+    - beams: distances per scan (None: taken from the first scan)
+    - angle_min, angle_max: angle of the first and last beam in radians
+    - units: unit of the distances, stored in the header
+    - scale: quantization step of the "delta-zlib" codec, in units
+    - sensor_id: free-form sensor identifier, stored in the header
+    - codec: "auto", "delta-zlib" (rounds distances to scale) or "zlib"
+    - chunk_scans: scans per chunk
+    - flush_interval: seconds a scan may wait before its chunk is written early (None: only when full)
+    """
+    def __init__(self, filename, beams=None, angle_min=HOKUYO_ANGLE_MIN, angle_max=HOKUYO_ANGLE_MAX, units="mm",
+                 scale=1.0, sensor_id="", codec="auto", chunk_scans=256, flush_interval=None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        self.file = open(filename, "wb")
+        self.header = {
+            "beams": beams,
+            "angle_min": float(angle_min),
+            "angle_max": float(angle_max),
+            "units": units,
+            "scale": float(scale),
+            "sensor_id": sensor_id,
+            "codec": codec,
+        }
+        self.chunk_scans = chunk_scans
+        self.flush_interval = flush_interval
+        self._first_buffered = 0.0
+        self.index = []
+        self._timestamps = []
+        self._scans = []
+        if beams is not None:
+            self._write_header()
+
+    def _write_header(self):
+        metadata = json.dumps(self.header).encode()
+        self.file.write(_PREAMBLE.pack(MAGIC, VERSION, len(metadata)))
+        self.file.write(metadata)
+
+    @property
+    def beams(self):
+        """Distances per scan, None until the first scan when not given."""
+        return self.header["beams"]
+
+    def write(self, timestamp, scan):
+        if self.header["beams"] is None:
+            self.header["beams"] = len(scan)
+            self._write_header()
+        if len(scan) != self.header["beams"]:
+            raise ValueError(f"Expected {self.header['beams']} distances, got {len(scan)}")
+        if not self._timestamps:
+            self._first_buffered = time.monotonic()
+        self._timestamps.append(timestamp)
+        self._scans.append(scan)
+        if len(self._scans) == self.chunk_scans:
+            self.flush()
+        elif self.flush_interval is not None and time.monotonic() - self._first_buffered >= self.flush_interval:
+            self.flush()
+
+    def write_many(self, timestamps, scans):
+        """Writes a block of scans, e.g. a slice of a LidarDatReader."""
+        for start in range(0, len(timestamps), self.chunk_scans):
+            self.flush()
+            self._timestamps = list(timestamps[start:start + self.chunk_scans])
+            self._scans = scans[start:start + self.chunk_scans]
+            if self.header["beams"] is None:
+                self.header["beams"] = np.shape(self._scans)[1]
+                self._write_header()
+            if np.shape(self._scans)[1] != self.header["beams"]:
+                raise ValueError(f"Expected {self.header['beams']} distances, got {np.shape(self._scans)[1]}")
+            self.flush()
+
+    def flush(self):
+        """Compresses the buffered scans into a chunk."""
+        if not len(self._timestamps):
+            return
+        timestamps = np.asarray(self._timestamps, dtype="<f8")
+        encoded_times = zlib.compress(timestamps.tobytes(), 6)
+        encoded_scans = encode_scans(self._scans, self.header["codec"], self.header["scale"])
+        offset = self.file.tell()
+        self.file.write(_CHUNK.pack(CHUNK_MAGIC, len(timestamps), len(encoded_times), len(encoded_scans)))
+        self.file.write(encoded_times)
+        self.file.write(encoded_scans)
+        self.index.append((offset, len(timestamps), float(timestamps[0]), float(timestamps[-1])))
+        self._timestamps = []
+        self._scans = []
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        if self.header["beams"] is None:
+            self.header["beams"] = 0
+            self._write_header()
+        footer_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(_INDEX_ENTRY.pack(*entry))
+        self.file.write(_TRAILER.pack(footer_offset, len(self.index), FOOTER_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LidarLogReader:
+    """
+    Reads a .ldr log. Scans are addressed by position or timestamp; only the chunks that
+    are needed get read and decompressed (the last decoded chunk is cached).
+    - filename: .ldr file to read
+    """
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        magic, self.version, length = _PREAMBLE.unpack(self.file.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a LIDAR log")
+        if self.version > VERSION:
+            raise ValueError(f"{filename} is version {self.version}, this reader supports up to {VERSION}")
+        self.header = json.loads(self.file.read(length))
+        self.beams = self.header["beams"]
+        self._data_start = _PREAMBLE.size + length
+        self.index = self._read_footer()
+        if self.index is None:
+            self.index = self._scan_chunks()
+        self.chunk_starts = []
+        total = 0
+        for _, count, _, _ in self.index:
+            self.chunk_starts.append(total)
+            total += count
+        self.count = total
+        self.chunk_first_times = [entry[2] for entry in self.index]
+        self._cached = (None, None, None)
+
+    def _read_footer(self):
+        size = self.file.seek(0, os.SEEK_END)
+        if size < self._data_start + _TRAILER.size:
+            return None
+        self.file.seek(size - _TRAILER.size)
+        footer_offset, chunks, magic = _TRAILER.unpack(self.file.read(_TRAILER.size))
+        if magic != FOOTER_MAGIC:
+            return None
+        self.file.seek(footer_offset)
+        data = self.file.read(chunks * _INDEX_ENTRY.size)
+        return [_INDEX_ENTRY.unpack_from(data, i * _INDEX_ENTRY.size) for i in range(chunks)]
+
+    def _scan_chunks(self):
+        """Rebuilds the index of a log without footer, skipping a trailing partial chunk."""
+        index = []
+        size = self.file.seek(0, os.SEEK_END)
+        offset = self._data_start
+        while offset + _CHUNK.size <= size:
+            self.file.seek(offset)
+            magic, count, times_length, scans_length = _CHUNK.unpack(self.file.read(_CHUNK.size))
+            end = offset + _CHUNK.size + times_length + scans_length
+            if magic != CHUNK_MAGIC or end > size:
+                break
+            timestamps = np.frombuffer(zlib.decompress(self.file.read(times_length)), dtype="<f8")
+            index.append((offset, count, float(timestamps[0]), float(timestamps[-1])))
+            offset = end
+        if offset != size:
+            print(f"Warning: ignoring {size - offset} bytes of partial chunk at the end of the log.")
+        return index
+
+    def __len__(self):
+        return self.count
+
+    def read_chunk(self, chunk):
+        """(timestamps, scans) arrays of one chunk."""
+        if self._cached[0] == chunk:
+            return self._cached[1], self._cached[2]
+        offset, count, _, _ = self.index[chunk]
+        self.file.seek(offset)
+        _, count, times_length, scans_length = _CHUNK.unpack(self.file.read(_CHUNK.size))
+        timestamps = np.frombuffer(zlib.decompress(self.file.read(times_length)), dtype="<f8")
+        scans = decode_scans(self.file.read(scans_length), count, self.beams, self.header["codec"],
+                             self.header["scale"])
+        self._cached = (chunk, timestamps, scans)
+        return timestamps, scans
+
+    def __getitem__(self, position):
+        """(timestamp, scan) at a position."""
+        if position < 0:
+            position += self.count
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        chunk = bisect.bisect_right(self.chunk_starts, position) - 1
+        timestamps, scans = self.read_chunk(chunk)
+        return float(timestamps[position - self.chunk_starts[chunk]]), scans[position - self.chunk_starts[chunk]]
+
+    def __iter__(self):
+        for chunk in range(len(self.index)):
+            timestamps, scans = self.read_chunk(chunk)
+            for timestamp, scan in zip(timestamps, scans):
+                yield float(timestamp), scan
+
+    def index_at(self, timestamp):
+        """Position of the first scan at or after timestamp (len(self) if there is none)."""
+        chunk = max(bisect.bisect_right(self.chunk_first_times, timestamp) - 1, 0)
+        while chunk < len(self.index) and self.index[chunk][3] < timestamp:
+            chunk += 1
+        if chunk == len(self.index):
+            return self.count
+        timestamps, _ = self.read_chunk(chunk)
+        return self.chunk_starts[chunk] + bisect.bisect_left(timestamps, timestamp)
+
+    def between(self, start, end):
+        """(timestamps, scans) with start <= timestamp < end."""
+        first, last = self.index_at(start), self.index_at(end)
+        times, scans = [], []
+        position = first
+        while position < last:
+            chunk = bisect.bisect_right(self.chunk_starts, position) - 1
+            timestamps, chunk_scans = self.read_chunk(chunk)
+            lo = position - self.chunk_starts[chunk]
+            hi = min(last - self.chunk_starts[chunk], len(timestamps))
+            times.append(timestamps[lo:hi])
+            scans.append(chunk_scans[lo:hi])
+            position += hi - lo
+        if not times:
+            return np.zeros(0, dtype="<f8"), np.zeros((0, self.beams), dtype=np.float32)
+        return np.concatenate(times), np.concatenate(scans)
+
+    def close(self):
+        self.file.close()
+
+
+def convert_dat(dat_filename, log_filename, chunk_scans=256, beams=None, **options):
+    """
+    Converts a raw .dat recording (write_lidar_to_dat) into a .ldr log.
+    - beams: distances per scan the .dat file was written with (default LIDAR_BEAMS)
+    Extra keyword arguments are passed to LidarLogWriter.
+    Returns the number of scans converted.
+    """
+    from lidar_full import LIDAR_BEAMS
+    from lidar_reader import LidarDatReader
+    reader = LidarDatReader(dat_filename, LIDAR_BEAMS if beams is None else beams)
+    with LidarLogWriter(log_filename, beams=reader.scans.shape[1], chunk_scans=chunk_scans, **options) as writer:
+        for start in range(0, len(reader), chunk_scans):
+            block = reader[start:start + chunk_scans]
+            writer.write_many(block["timestamp"], block["scan"])
+    return len(reader)
+
+
+def convert_log(log_filename, dat_filename):
+    """
+    Converts a .ldr log back into a raw .dat recording, with the log's beams distances per scan
+    (pass the same beams to LidarDatReader if it is not LIDAR_BEAMS).
+    """
+    from lidar_full import LidarDatWriter
+    reader = LidarLogReader(log_filename)
+    with LidarDatWriter(dat_filename, flush_interval=None, beams=reader.beams) as writer:
+        for chunk in range(len(reader.index)):
+            timestamps, scans = reader.read_chunk(chunk)
+            for timestamp, scan in zip(timestamps, scans):
+                writer.write(timestamp, scan)
+    reader.close()
+    return len(reader)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python3 lidar_log.py <input.dat> <output.ldr>")
+        sys.exit(1)
+    source, destination = sys.argv[1], sys.argv[2]
+    scans = convert_dat(source, destination)
+    print(f"Converted {scans} scans: {os.path.getsize(source)} -> {os.path.getsize(destination)} bytes")
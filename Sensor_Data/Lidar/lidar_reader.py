@@ -0,0 +1,76 @@
+import bisect
+import os
+import numpy as np
+from lidar_full import LIDAR_BEAMS, lidar_record_dtype
+
+class LidarDatReader:
+    """
+    Memory-mapped reader for LIDAR .dat files written by write_lidar_to_dat.
+    The file is mapped as an array of lidar_record_dtype(beams) records, so only the pages that are
+    actually touched get read from disk; lookups by timestamp are binary searches.
+    Timestamps are assumed to be non-decreasing, as recorded.
+    A trailing partial record (recording interrupted mid-write) is ignored.
+    - filename: .dat file to read
+    - beams: distances per scan the file was written with
+    """
+    def __init__(self, filename, beams=LIDAR_BEAMS):
+        self.filename = filename
+        record_dtype = lidar_record_dtype(beams)
+        size = os.path.getsize(filename)
+        count = size // record_dtype.itemsize
+        self.torn_bytes = size % record_dtype.itemsize
+        if self.torn_bytes:
+            print(f"Warning: {filename} ends with a partial record ({self.torn_bytes} bytes), ignoring it.")
+        if count:
+            self.records = np.memmap(filename, dtype=record_dtype, mode='r', shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=record_dtype)
+        # Strided views into the mapping, nothing is copied
+        self.timestamps = self.records['timestamp']
+        self.scans = self.records['scan']
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        """Record(s) by position: (timestamp, scan) for an int, a record array for a slice."""
+        return self.records[index]
+
+    def __iter__(self):
+        for record in self.records:
+            yield float(record['timestamp']), record['scan']
+
+    @property
+    def start_time(self):
+        return float(self.timestamps[0]) if len(self) else None
+
+    @property
+    def end_time(self):
+        return float(self.timestamps[-1]) if len(self) else None
+
+    def index_at(self, timestamp):
+        """Position of the first record at or after timestamp (len(self) if there is none)."""
+        # bisect only touches O(log n) records; np.searchsorted would copy the strided column first
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def nearest(self, timestamp):
+        """Position of the record closest in time to timestamp."""
+        if not len(self):
+            raise IndexError("empty recording")
+        index = self.index_at(timestamp)
+        if index == len(self):
+            return index - 1
+        if index > 0 and timestamp - self.timestamps[index - 1] <= self.timestamps[index] - timestamp:
+            return index - 1
+        return index
+
+    def between(self, start, end):
+        """Records with start <= timestamp < end, as a view into the mapping."""
+        return self.records[self.index_at(start):self.index_at(end)]
+
+    def take(self, indices):
+        """Copies of the records at the given positions, e.g. a random training batch."""
+        return self.records[np.asarray(indices)]
+
+    def close(self):
+        self.records = self.timestamps = self.scans = None
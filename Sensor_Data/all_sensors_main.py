@@ -1,80 +1,136 @@
+import argparse
 import threading
 import time
 import os
+import sys
+
+# Each sensor script lives in its own folder
+SENSOR_DIR = os.path.dirname(os.path.abspath(__file__))
+for sensor_folder in ("Camera", "Controller", "IMU", "Event_Camera", "Lidar"):
+    sys.path.append(os.path.join(SENSOR_DIR, sensor_folder))
+
+from backends import open_lidar
 from camera2JPEG import save_camera_frames
 from controller_full import ControllerInputLogger
 from imu2csv import log_imu_data
 from events2dat import record_event_camera_data
-from lidarfull import write_lidar_to_dat, lidar_generator
-from hokuyolx import HokuyoLX
-
-# Initialize directories for outputs
-os.makedirs("data", exist_ok=True)
-os.makedirs("data/color_frames", exist_ok=True)
-os.makedirs("data/gray_frames", exist_ok=True)
-os.makedirs("data/imu", exist_ok=True)
-os.makedirs("data/lidar", exist_ok=True)
-os.makedirs("data/controller", exist_ok=True)
-os.makedirs("data/event_camera", exist_ok=True)
-
-def run_camera():
+from lidar_full import write_lidar_to_dat, lidar_generator
+from sensor_supervisor import SensorSupervisor
+
+# "threads": every sensor in a thread of this process; "processes": one supervised process per sensor
+MODES = ("threads", "processes")
+
+def make_output_dirs():
+    """Initialize directories for outputs"""
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("data/color_frames", exist_ok=True)
+    os.makedirs("data/gray_frames", exist_ok=True)
+    os.makedirs("data/imu", exist_ok=True)
+    os.makedirs("data/lidar", exist_ok=True)
+    os.makedirs("data/controller", exist_ok=True)
+    os.makedirs("data/event_camera", exist_ok=True)
+
+def _suffix(attempt):
+    # A restarted sensor writes a new file instead of truncating the previous one
+    return f"_{attempt}" if attempt else ""
+
+def run_camera(stop_event=None, attempt=0):
     """Run the camera script to save color and grayscale frames."""
     try:
-        save_camera_frames(output_dir="data/color_frames", gray_dir="data/gray_frames")
+        # Headless: preview windows cannot be driven from a worker thread
+        save_camera_frames(output_dir="data/color_frames", gray_dir="data/gray_frames", show=False,
+                           stop_event=stop_event)
     except Exception as e:
         print(f"Camera thread error: {e}")
 
-def run_controller():
+def run_controller(stop_event=None, attempt=0):
     """Run the controller script to log inputs."""
     try:
-        controller_logger = ControllerInputLogger(output_dir="data/controller")
-        controller_logger.start_logging()
+        controller_logger = ControllerInputLogger(output_dir="data/controller",
+                                                  filename=f"controller_data{_suffix(attempt)}.col")
+        controller_logger.start_logging(stop_event)
     except Exception as e:
         print(f"Controller thread error: {e}")
 
-def run_imu():
-    """Run the IMU script to log data to CSV."""
+def run_imu(stop_event=None, attempt=0):
+    """Run the IMU script to log data to a binary column log (column_log.py converts it to CSV)."""
     try:
-        log_imu_data(output_file="data/imu/imu_data.csv")
+        log_imu_data(output_file=f"data/imu/imu_data{_suffix(attempt)}.col", stop_event=stop_event)
     except Exception as e:
         print(f"IMU thread error: {e}")
 
-def run_event_camera():
-    """Run the event camera script to log data to .dat."""
+def run_event_camera(stop_event=None, attempt=0):
+    """Run the event camera script to log data to .raw."""
     try:
-        record_event_camera_data(output_file="data/event_camera/event_camera_data.dat")
+        record_event_camera_data(output_file=f"data/event_camera/event_camera_data{_suffix(attempt)}.raw",
+                                 stop_event=stop_event)
     except Exception as e:
         print(f"Event Camera thread error: {e}")
 
-def run_lidar():
-    """Run the LIDAR script to log data to .dat."""
+def run_lidar(stop_event=None, attempt=0):
+    """Run the LIDAR script to log data to a .ldr log."""
     try:
-        lidar = HokuyoLX()
-        lidar_filename = f"data/lidar/lidar_output_{int(time.time())}.dat"
-        write_lidar_to_dat(lidar.iterdist, lidar_filename)
+        lidar = open_lidar()
+        lidar_filename = f"data/lidar/lidar_output_{int(time.time())}.ldr"
+        write_lidar_to_dat(lidar.iterdist, lidar_filename, stop_event)
     except Exception as e:
         print(f"LIDAR thread error: {e}")
 
-def main():
-    """Main function to run all scripts simultaneously."""
+SENSORS = {
+    "Camera": run_camera,
+    "Controller": run_controller,
+    "IMU": run_imu,
+    "EventCamera": run_event_camera,
+    "LIDAR": run_lidar,
+}
+
+def run_threads(stop_event):
+    """Run every sensor in a thread of this process until stop_event is set or Ctrl+C."""
     # Create threads for each sensor
-    threads = [
-        threading.Thread(target=run_camera, name="CameraThread"),
-        threading.Thread(target=run_controller, name="ControllerThread"),
-        threading.Thread(target=run_imu, name="IMUThread"),
-        threading.Thread(target=run_event_camera, name="EventCameraThread"),
-        threading.Thread(target=run_lidar, name="LIDARThread"),
-    ]
+    threads = [threading.Thread(target=target, args=(stop_event,), name=f"{name}Thread")
+               for name, target in SENSORS.items()]
 
     # Start all threads
     for thread in threads:
         thread.start()
 
     # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        print("Stopping sensors...")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+def main(mode="threads", stop_event=None, max_restarts=5):
+    """
+    Main function to run all scripts simultaneously.
+    - mode: "threads" or "processes" (each sensor in its own process, restarted if it dies)
+    - stop_event: optional threading.Event that ends the recording when set
+    - max_restarts: restarts per sensor in "processes" mode
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    make_output_dirs()
+    if stop_event is None:
+        stop_event = threading.Event()
+    if mode == "threads":
+        run_threads(stop_event)
+        return None
+    summary = SensorSupervisor(SENSORS, max_restarts=max_restarts).run(stop_event)
+    for name, status in summary.items():
+        print(f"{name}: exit code {status['exit_code']}, {status['restarts']} restarts")
+    return summary
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record every sensor of the car.")
+    parser.add_argument("--mode", choices=MODES, default="threads",
+                        help="run the sensors as threads of one process or as one supervised process each")
+    parser.add_argument("--max-restarts", type=int, default=5, help="restarts per sensor in processes mode")
+    args = parser.parse_args()
     print("Starting multi-sensor data collection...")
-    main()
+    main(args.mode, max_restarts=args.max_restarts)
     print("All sensors have completed data collection.")
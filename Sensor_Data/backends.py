@@ -0,0 +1,853 @@
+"""
+Device backends for the Slug-Mobile.
+
+Every device is opened through one of the open_* functions below instead of
+constructing the driver directly. With the SLUG_MOBILE_BACKEND environment
+variable unset (or "hardware") they return the real drivers; with "sim" they
+return deterministic simulated devices that produce data at configurable rates
+and payload sizes, so the acquisition stack can run on a machine with no
+sensors attached.
+
+    SLUG_MOBILE_BACKEND=sim python3 all_sensors_main.py
+
+or from Python:
+
+    import backends
+    backends.use_backend("sim")
+    backends.configure_sim(lidar_rate=40, camera_fps=60)
+
+A rate of 0 (or None) makes a simulated device unpaced: it returns data as
+fast as it is asked for, which is what load tests want.
+"""
+import math
+import os
+import queue
+import select
+import threading
+import time
+import numpy as np
+
+HARDWARE = "hardware"
+SIM = "sim"
+
+BACKEND = os.environ.get("SLUG_MOBILE_BACKEND", HARDWARE)
+
+SIM_CONFIG = {
+    "seed": 0,
+    "lidar_rate": 40.0,            # scans per second (Hokuyo UST-10LX: 40 Hz)
+    "lidar_beams": 1081,           # distances per scan
+    "camera_fps": 30.0,
+    "camera_width": 640,
+    "camera_height": 480,
+    "event_rate": 1000000.0,       # events per second
+    "event_width": 1280,
+    "event_height": 720,
+    "event_buffer_bytes": 65536,   # size of one raw buffer from the events stream
+    "event_bytes_per_event": 4,    # raw encoding density (the simulated stream is EVT 2.0, 4 bytes per event)
+    "controller_rate": 250.0,      # controller reports per second (USB gamepads: 125-1000 Hz)
+}
+
+# EVT 2.0 word types (upper 4 bits): CD_OFF = 0, CD_ON = 1, EV_TIME_HIGH = 8
+EVT2_TIME_HIGH = 0x8
+
+# Metavision EventCD layout, as yielded by EventsIterator
+EVENT_CD_DTYPE = np.dtype({"names": ["x", "y", "p", "t"],
+                           "formats": ["<u2", "<u2", "<i2", "<i8"],
+                           "offsets": [0, 2, 4, 8],
+                           "itemsize": 16})
+
+
+def use_backend(name):
+    """Select the backend ("hardware" or "sim") for devices opened from now on."""
+    global BACKEND
+    if name not in (HARDWARE, SIM):
+        raise ValueError(f"Unknown backend: {name}")
+    BACKEND = name
+
+
+def configure_sim(**settings):
+    """Update SIM_CONFIG; affects simulated devices opened afterwards."""
+    for key in settings:
+        if key not in SIM_CONFIG:
+            raise KeyError(f"Unknown simulation setting: {key}")
+    SIM_CONFIG.update(settings)
+
+
+def is_sim():
+    return BACKEND == SIM
+
+
+def open_smbus(bus=1):
+    """SMBus handle for the I2C bus (BMX160 at 0x68, PCA9685 at 0x40/0x60)."""
+    if is_sim():
+        return SimSMBus(bus)
+    try:
+        from smbus2 import SMBus
+    except ImportError:
+        from smbus import SMBus
+    return SMBus(bus)
+
+
+def open_servo_kit(address=0x60, channels=16):
+    if is_sim():
+        return SimServoKit(address=address, channels=channels)
+    from adafruit_servokit import ServoKit
+    return ServoKit(address=address, channels=channels)
+
+
+def open_lidar(**kwargs):
+    if is_sim():
+        return SimHokuyoLX(**kwargs)
+    from hokuyolx import HokuyoLX
+    return HokuyoLX(**kwargs)
+
+
+def open_events_iterator(input_path="", **kwargs):
+    if is_sim():
+        return SimEventsIterator(input_path=input_path, **kwargs)
+    from metavision_core.event_io import EventsIterator
+    return EventsIterator(input_path=input_path, **kwargs)
+
+
+def open_event_device(serial=""):
+    """Event camera HAL device, as returned by metavision_hal.DeviceDiscovery.open()."""
+    if is_sim():
+        return SimEventDevice(serial)
+    from metavision_hal import DeviceDiscovery
+    return DeviceDiscovery.open(serial)
+
+
+def open_video_capture(index=0):
+    if is_sim():
+        return SimVideoCapture(index)
+    import cv2
+    return cv2.VideoCapture(index)
+
+
+def open_joystick(index=0, driver="pygame"):
+    """
+    Game controller with get_axis(), get_numaxes(), pump(), wait_axis_events() and quit().
+    - driver: "pygame", or "evdev" to read the Linux input device directly (kernel timestamps,
+      no SDL event queue; index may also be a /dev/input/event* path)
+    Raises RuntimeError when no controller is connected.
+    """
+    if driver not in ("pygame", "evdev"):
+        raise ValueError(f"Unknown joystick driver: {driver}")
+    if is_sim():
+        return SimJoystick(index)
+    if driver == "evdev":
+        return EvdevJoystick(index)
+    return PygameJoystick(index)
+
+
+class PygameJoystick:
+    """
+    Owns pygame for the lifetime of one controller.
+    SDL delivers events only on the thread that initialized it, while the controller is read
+    from other threads (a ControllerReader waits for reports on its own). So pygame is
+    initialized, pumped and shut down on a dedicated PygameEvents thread that hands the axis
+    changes over; every method here may be called from any thread. That thread takes all
+    events off the SDL queue (so it cannot fill up), nothing else in the process may use
+    pygame's event queue or display.
+    """
+
+    def __init__(self, index=0):
+        import pygame
+        self.pygame = pygame
+        self._axes = []
+        self._changes = queue.Queue()
+        self._ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._event_loop, args=(index,), name="PygameEvents", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread.join()
+            raise RuntimeError("No joystick found. Please connect a controller and try again.") from self._error
+
+    def _event_loop(self, index):
+        pygame = self.pygame
+        pygame.init()
+        pygame.joystick.init()
+        try:
+            joystick = pygame.joystick.Joystick(index)
+            joystick.init()
+        except pygame.error as e:
+            pygame.quit()
+            self._error = e
+            self._ready.set()
+            return
+        instance_id = joystick.get_instance_id()
+        self._axes = [joystick.get_axis(axis) for axis in range(joystick.get_numaxes())]
+        self._ready.set()
+        try:
+            while not self._stop_event.is_set():
+                # Short timeout so quit() does not wait for the next event
+                event = pygame.event.wait(100)
+                timestamp = time.time()
+                for event in [event] + pygame.event.get():
+                    if getattr(event, "instance_id", instance_id) != instance_id:
+                        continue
+                    if event.type == pygame.JOYAXISMOTION:
+                        self._axes[event.axis] = event.value
+                        self._changes.put((timestamp, event.axis, event.value))
+                    elif event.type == pygame.JOYDEVICEREMOVED:
+                        # Marks the disconnect for wait_axis_events
+                        self._changes.put(None)
+                        return
+        finally:
+            pygame.quit()
+
+    def get_axis(self, axis):
+        return self._axes[axis]
+
+    def get_numaxes(self):
+        return len(self._axes)
+
+    def pump(self):
+        """Nothing to do, the event thread keeps get_axis() current."""
+
+    def wait_axis_events(self, timeout=None):
+        """
+        Block until the controller reports axis motion (or timeout seconds pass) and return
+        every pending change as (timestamp, axis, value), timestamped with time.time() on arrival.
+        Raises OSError when the controller is disconnected.
+        """
+        try:
+            changes = [self._changes.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                changes.append(self._changes.get_nowait())
+            except queue.Empty:
+                break
+        if None in changes:
+            # Keep the marker, every later call fails as well
+            self._changes.put(None)
+            raise OSError("Controller disconnected")
+        return changes
+
+    def quit(self):
+        self._stop_event.set()
+        self._thread.join()
+
+
+class EvdevJoystick:
+    """
+    Controller read straight from its Linux input device with python-evdev.
+    Axes are numbered like pygame numbers an Xbox-style pad (0/1 left stick, 2/3 right stick,
+    4 left trigger, 5 right trigger) and scaled to -1..1.
+    """
+
+    # ABS_X, ABS_Y, ABS_RX, ABS_RY, ABS_Z, ABS_RZ
+    AXIS_CODES = (0x00, 0x01, 0x03, 0x04, 0x02, 0x05)
+
+    def __init__(self, index=0):
+        import evdev
+        self.evdev = evdev
+        if isinstance(index, str):
+            paths = [index]
+        else:
+            # Devices with a left stick, in the order the kernel numbered them
+            paths = [path for path in sorted(evdev.list_devices())
+                     if 0x00 in evdev.InputDevice(path).capabilities(absinfo=False).get(evdev.ecodes.EV_ABS, [])]
+            paths = [paths[index]] if index < len(paths) else []
+        if not paths:
+            raise RuntimeError("No joystick found. Please connect a controller and try again.")
+        self.device = evdev.InputDevice(paths[0])
+        self.axes = {}
+        self.scale = {}
+        abs_codes = self.device.capabilities(absinfo=False).get(evdev.ecodes.EV_ABS, [])
+        for axis, code in enumerate(self.AXIS_CODES):
+            if code in abs_codes:
+                info = self.device.absinfo(code)
+                self.scale[code] = (axis, info.min, info.max)
+                self.axes[axis] = self._normalize(code, info.value)[1]
+
+    def _normalize(self, code, value):
+        axis, low, high = self.scale[code]
+        return axis, 2.0 * (value - low) / (high - low) - 1.0
+
+    def _read(self):
+        changes = []
+        try:
+            for event in self.device.read():
+                if event.type == self.evdev.ecodes.EV_ABS and event.code in self.scale:
+                    axis, value = self._normalize(event.code, event.value)
+                    self.axes[axis] = value
+                    changes.append((event.timestamp(), axis, value))
+        except BlockingIOError:
+            pass
+        return changes
+
+    def get_axis(self, axis):
+        return self.axes.get(axis, 0.0)
+
+    def get_numaxes(self):
+        return len(self.AXIS_CODES)
+
+    def pump(self):
+        self._read()
+
+    def wait_axis_events(self, timeout=None):
+        """
+        Like PygameJoystick.wait_axis_events, timestamped by the kernel when the report came in.
+        Raises OSError when the controller is disconnected.
+        """
+        readable, _, _ = select.select([self.device.fd], [], [], timeout)
+        return self._read() if readable else []
+
+    def quit(self):
+        self.device.close()
+
+
+class _Pacer:
+    """Sleeps until the next tick of a fixed-rate schedule; a falsy rate never sleeps."""
+
+    def __init__(self, rate):
+        self.period = 1.0 / rate if rate else 0.0
+        self.next_tick = time.monotonic()
+
+    def due(self):
+        return time.monotonic() >= self.next_tick
+
+    def wait(self):
+        if not self.period:
+            return
+        now = time.monotonic()
+        if self.next_tick > now:
+            time.sleep(self.next_tick - now)
+        elif now - self.next_tick > self.period:
+            # A real sensor does not replay ticks the consumer missed
+            self.next_tick = now
+        self.next_tick += self.period
+
+
+class SimSMBus:
+    """
+    smbus-compatible bus with a simulated BMX160 at 0x68.
+
+    The BMX160 produces samples at the output data rate programmed in its
+    accel config register, sets the data-ready bits of its status register
+    and fills its FIFO when FIFO_CONFIG_1 enables it. Any other address acts
+    as a plain 256-byte register file (enough for the PCA9685).
+    """
+
+    BMX160_ADDR = 0x68
+    CHIP_ID = 0xD8
+    FIFO_SIZE = 1024
+    FRAME_LEN = 20
+
+    def __init__(self, bus=1):
+        self.bus = bus
+        self.registers = {self.BMX160_ADDR: bytearray(128)}
+        self.registers[self.BMX160_ADDR][0x00] = self.CHIP_ID
+        self.transactions = 0
+        self._reset_imu()
+
+    def _reset_imu(self):
+        regs = self.registers[self.BMX160_ADDR]
+        regs[0x40] = 0x28  # accel 100 Hz
+        regs[0x42] = 0x28  # gyro 100 Hz
+        regs[0x47] = 0x00  # FIFO off
+        self._t0 = time.monotonic()
+        self._period = 0.01
+        self._read_index = 0
+        self._fifo_index = 0
+        self._fifo = bytearray()
+
+    def _imu_index(self):
+        """Index of the newest sample the sensor has produced."""
+        return int((time.monotonic() - self._t0) / self._period)
+
+    def _set_odr(self, code):
+        # Re-anchor the sample clock so indices stay monotonic across the change
+        index = self._imu_index()
+        self._period = 1.0 / (100.0 * 2 ** ((code & 0x0F) - 8))
+        self._t0 = time.monotonic() - index * self._period
+
+    @staticmethod
+    def imu_frame(index):
+        """Deterministic raw 20 byte magn/gyro/accel frame for sample `index`."""
+        words = [
+            int(300 * math.sin(index * 0.010)), int(300 * math.cos(index * 0.010)), -150, 0,
+            int(2000 * math.sin(index * 0.050)), int(1500 * math.sin(index * 0.031)), int(800 * math.cos(index * 0.020)),
+            int(1000 * math.sin(index * 0.070)), int(1000 * math.cos(index * 0.070)), 16384,
+        ]
+        return b"".join((w & 0xFFFF).to_bytes(2, "little") for w in words)
+
+    def _fill_fifo(self):
+        index = self._imu_index()
+        if self.registers[self.BMX160_ADDR][0x47] & 0xE0:
+            while self._fifo_index < index:
+                self._fifo_index += 1
+                self._fifo += self.imu_frame(self._fifo_index)
+            overflow = len(self._fifo) - (self.FIFO_SIZE - self.FIFO_SIZE % self.FRAME_LEN)
+            if overflow > 0:
+                del self._fifo[:overflow + (-overflow) % self.FRAME_LEN]
+        else:
+            self._fifo_index = index
+
+    def read_byte(self, addr):
+        self.transactions += 1
+        if addr not in self.registers:
+            raise OSError(f"No device at 0x{addr:02x}")
+        return self.registers[addr][0]
+
+    def read_byte_data(self, addr, register):
+        return self.read_i2c_block_data(addr, register, 1)[0]
+
+    def write_byte_data(self, addr, register, value):
+        self.write_i2c_block_data(addr, register, [value])
+
+    def write_i2c_block_data(self, addr, register, data):
+        self.transactions += 1
+        regs = self.registers.setdefault(addr, bytearray(256))
+        regs[register:register + len(data)] = bytes(data)
+        if addr != self.BMX160_ADDR:
+            return
+        if register == 0x7E and data[0] == 0xB6:
+            self._reset_imu()
+        elif register == 0x7E and data[0] == 0xB0:
+            self._fifo.clear()
+            self._fifo_index = self._imu_index()
+        elif register == 0x40:
+            self._set_odr(data[0])
+
+    def read_i2c_block_data(self, addr, register, length=32):
+        self.transactions += 1
+        if addr != self.BMX160_ADDR:
+            regs = self.registers.setdefault(addr, bytearray(256))
+            return list(regs[register:register + length])
+        if register == 0x24:
+            self._fill_fifo()
+            data = self._fifo[:length]
+            del self._fifo[:length]
+            # An empty FIFO reads back 0x80
+            return list(data) + [0x80] * (length - len(data))
+        regs = self.registers[addr]
+        index = self._imu_index()
+        self._fill_fifo()
+        regs[0x04:0x18] = self.imu_frame(index)
+        sensortime = int((time.monotonic() - self._t0) / 39.0625e-6) & 0xFFFFFF
+        regs[0x18:0x1B] = sensortime.to_bytes(3, "little")
+        regs[0x1B] = 0xE0 if index > self._read_index else 0x00
+        regs[0x22:0x24] = len(self._fifo).to_bytes(2, "little")
+        if register <= 0x04 < register + length:
+            self._read_index = index
+        return list(regs[register:register + length])
+
+    def close(self):
+        pass
+
+
+class SimServo:
+    def __init__(self, kit):
+        self.kit = kit
+        self.actuation_range = 180
+        self.min_pulse = 750
+        self.max_pulse = 2250
+        self._angle = None
+
+    def set_pulse_width_range(self, min_pulse=750, max_pulse=2250):
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, value):
+        if value is not None and not 0 <= value <= self.actuation_range:
+            raise ValueError("Angle out of range")
+        self.kit.writes += 1
+        self._angle = value
+
+
+class SimServoKit:
+    """ServoKit stand-in that records every PWM write."""
+
+    def __init__(self, address=0x60, channels=16, frequency=50):
+        self.address = address
+        self.frequency = frequency
+        self.writes = 0
+        self.servo = [SimServo(self) for _ in range(channels)]
+
+
+class SimHokuyoLX:
+    """HokuyoLX stand-in producing `lidar_beams` distances (mm) at `lidar_rate` scans per second."""
+
+    def __init__(self, **kwargs):
+        self.beams = SIM_CONFIG["lidar_beams"]
+        self._pacer = _Pacer(SIM_CONFIG["lidar_rate"])
+        self._rng = np.random.default_rng(SIM_CONFIG["seed"])
+        angles = np.linspace(-3 * np.pi / 4, 3 * np.pi / 4, self.beams)
+        # A 4 m x 6 m room seen from its centre, plus range noise
+        self._room = np.minimum(2000 / np.maximum(np.abs(np.cos(angles)), 1e-3),
+                                3000 / np.maximum(np.abs(np.sin(angles)), 1e-3))
+        self.scans = 0
+
+    def get_dist(self, *args, **kwargs):
+        self._pacer.wait()
+        self.scans += 1
+        noise = self._rng.normal(0, 10, self.beams)
+        scan = np.clip(self._room + noise, 20, 30000).astype(np.uint32)
+        return time.time(), scan
+
+    def iterdist(self, *args, **kwargs):
+        while True:
+            yield self.get_dist()
+
+    def close(self):
+        pass
+
+
+class SimVideoCapture:
+    """cv2.VideoCapture stand-in producing BGR frames at `camera_fps`."""
+
+    def __init__(self, index=0):
+        self.index = index
+        self.width = SIM_CONFIG["camera_width"]
+        self.height = SIM_CONFIG["camera_height"]
+        self._pacer = _Pacer(SIM_CONFIG["camera_fps"])
+        self._opened = True
+        self.frames = 0
+        # Horizontal gradient that scrolls one pixel per frame
+        ramp = (np.arange(self.width * 2) * 255 // (self.width * 2)).astype(np.uint8)
+        self._ramp = np.concatenate([ramp, ramp])
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        self._pacer.wait()
+        shift = self.frames % (self.width * 2)
+        row = self._ramp[shift:shift + self.width]
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        frame[:, :, 0] = row
+        frame[:, :, 1] = row[::-1]
+        frame[:, :, 2] = (self.frames * 3) % 256
+        self.frames += 1
+        return True, frame
+
+    def get(self, prop):
+        return {3: self.width, 4: self.height, 5: SIM_CONFIG["camera_fps"]}.get(prop, 0)
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self._opened = False
+
+
+def encode_evt2(events):
+    """
+    EVT 2.0 words (little-endian uint32) for EventCD events sorted by time: a CD word per event
+    (polarity type, low 6 timestamp bits, x, y), preceded by a time-high word (upper 28 timestamp
+    bits) wherever those change.
+    """
+    t = events["t"].astype(np.uint64)
+    high = (t >> np.uint64(6)).astype(np.uint32)
+    starts = np.ones(len(events), dtype=bool)
+    starts[1:] = high[1:] != high[:-1]
+    # Each event moves back by the time-high words up to and including its own
+    positions = np.arange(len(events)) + np.cumsum(starts)
+    words = np.empty(len(events) + int(starts.sum()), dtype="<u4")
+    words[positions] = ((events["p"].astype(np.uint32) << 28) | ((t & np.uint64(63)).astype(np.uint32) << 22)
+                        | (events["x"].astype(np.uint32) << 11) | events["y"].astype(np.uint32))
+    words[positions[starts] - 1] = (EVT2_TIME_HIGH << 28) | (high[starts] & 0x0FFFFFFF)
+    return words
+
+
+def decode_evt2(words, time_high=0):
+    """
+    EventCD events of EVT 2.0 words; words before the first time-high word use `time_high`,
+    the time-high value carried over from the previous words of the stream.
+    Returns (events, time_high at the end of words).
+    """
+    types = words >> 28
+    is_high = types == EVT2_TIME_HIGH
+    # Latest time-high word at or before each word
+    latest = np.where(is_high, np.arange(len(words)), -1)
+    np.maximum.accumulate(latest, out=latest)
+    highs = np.where(latest >= 0, words[np.maximum(latest, 0)] & 0x0FFFFFFF, time_high).astype(np.int64)
+    cd = types <= 1
+    cd_words = words[cd]
+    events = np.empty(len(cd_words), dtype=EVENT_CD_DTYPE)
+    events["x"] = (cd_words >> 11) & 0x7FF
+    events["y"] = cd_words & 0x7FF
+    events["p"] = types[cd]
+    events["t"] = (highs[cd] << 6) | ((cd_words >> 22) & 63)
+    return events, int(highs[-1]) if len(words) else time_high
+
+
+def read_raw_header(f):
+    """Reads the "% key value" header of a Metavision RAW file, leaving f at the event data; returns a dict."""
+    header = {}
+    while True:
+        position = f.tell()
+        line = f.readline()
+        if not line.startswith(b"%"):
+            f.seek(position)
+            return header
+        key, _, value = line[1:].strip().decode().partition(" ")
+        if key == "end":
+            return header
+        header[key] = value
+
+
+def sim_events(rng, count, t_start, t_end, width, height):
+    """`count` uniformly spread EventCD events with timestamps in [t_start, t_end) microseconds."""
+    events = np.empty(count, dtype=EVENT_CD_DTYPE)
+    events["x"] = rng.integers(0, width, count)
+    events["y"] = rng.integers(0, height, count)
+    events["p"] = rng.integers(0, 2, count)
+    events["t"] = t_start + (np.arange(count) * (t_end - t_start)) // max(count, 1)
+    return events
+
+
+class SimEventsIterator:
+    """
+    EventsIterator stand-in yielding EventCD arrays at `event_rate` events per second,
+    in "delta_t" (fixed time slices) or "n_events" (fixed counts) mode.
+    With an input_path, it instead decodes that recording (an EVT 2.0 RAW file, as the simulated
+    camera records) and ends with it, like EventsIterator on a file.
+    """
+    # Words decoded at a time from a recording
+    FILE_CHUNK_WORDS = 1 << 20
+
+    def __init__(self, input_path="", mode="delta_t", delta_t=10000, n_events=10000, **kwargs):
+        if mode not in ("delta_t", "n_events"):
+            raise ValueError(f"Unsupported mode: {mode}")
+        self.input_path = input_path
+        self.mode = mode
+        self.delta_t = delta_t
+        self.n_events = n_events
+        self.width = SIM_CONFIG["event_width"]
+        self.height = SIM_CONFIG["event_height"]
+        if input_path:
+            with open(input_path, "rb") as f:
+                self.header = read_raw_header(f)
+                self._data_start = f.tell()
+            encoding, *fields = self.header.get("format", "").split(";")
+            if encoding != "EVT2":
+                raise ValueError(f"Unsupported event encoding in {input_path}: {encoding or 'none'}")
+            size = dict(field.split("=", 1) for field in fields)
+            self.width = int(size.get("width", self.width))
+            self.height = int(size.get("height", self.height))
+        self.rate = SIM_CONFIG["event_rate"]
+        self._rng = np.random.default_rng(SIM_CONFIG["seed"])
+        self._t = 0
+
+    def get_size(self):
+        return self.height, self.width
+
+    def _file_chunks(self):
+        count = (os.path.getsize(self.input_path) - self._data_start) // 4
+        if not count:
+            return
+        words = np.memmap(self.input_path, dtype="<u4", mode="r", offset=self._data_start, shape=(count,))
+        time_high = 0
+        for start in range(0, count, self.FILE_CHUNK_WORDS):
+            events, time_high = decode_evt2(np.asarray(words[start:start + self.FILE_CHUNK_WORDS]), time_high)
+            yield events
+
+    @staticmethod
+    def _join(pieces):
+        if len(pieces) == 1:
+            return pieces[0]
+        # Into an EVENT_CD_DTYPE array: concatenating structured arrays would drop the padding before t
+        out = np.empty(sum(len(piece) for piece in pieces), dtype=EVENT_CD_DTYPE)
+        return np.concatenate(pieces, out=out)
+
+    def _iter_file(self):
+        # Windows are cut from each decoded chunk with searchsorted; only a window that spans
+        # chunks is copied, once, from the pieces carried over
+        carry = []
+        carried = 0
+        window_end = self.delta_t
+        for events in self._file_chunks():
+            start = 0
+            if self.mode == "delta_t":
+                times = events["t"]
+                while len(events) and times[-1] >= window_end:
+                    cut = np.searchsorted(times, window_end)
+                    carry.append(events[start:cut])
+                    yield self._join(carry)
+                    carry, carried = [], 0
+                    start = cut
+                    window_end += self.delta_t
+            else:
+                while carried + len(events) - start >= self.n_events:
+                    cut = start + self.n_events - carried
+                    carry.append(events[start:cut])
+                    yield self._join(carry)
+                    carry, carried = [], 0
+                    start = cut
+            if start < len(events):
+                carry.append(events[start:])
+                carried += len(events) - start
+        if carried:
+            yield self._join(carry)
+
+    def __iter__(self):
+        if self.input_path:
+            yield from self._iter_file()
+            return
+        if self.mode == "delta_t":
+            count = int(self.rate * self.delta_t / 1e6)
+            span = self.delta_t
+        else:
+            count = self.n_events
+            span = max(int(self.n_events * 1e6 / self.rate), 1) if self.rate else self.n_events
+        pacer = _Pacer(1e6 / span if self.rate else 0)
+        while True:
+            pacer.wait()
+            events = sim_events(self._rng, count, self._t, self._t + span, self.width, self.height)
+            self._t += span
+            yield events
+
+
+class _SimGeometry:
+    def __init__(self, width, height):
+        self._width = width
+        self._height = height
+
+    def get_width(self):
+        return self._width
+
+    def get_height(self):
+        return self._height
+
+
+class _SimHwIdentification:
+    def __init__(self, serial):
+        self._serial = serial
+
+    def get_serial(self):
+        return self._serial
+
+    def get_current_data_encoding_format(self):
+        return "EVT2"
+
+
+class SimEventsStream:
+    """
+    metavision_hal I_EventsStream stand-in handing out EVT 2.0 encoded buffers of about
+    `event_buffer_bytes` at the configured event rate; the sensor clock starts at 0 with the stream.
+    """
+
+    def __init__(self):
+        self.buffer_bytes = SIM_CONFIG["event_buffer_bytes"]
+        count = max(self.buffer_bytes // SIM_CONFIG["event_bytes_per_event"], 1)
+        rate = SIM_CONFIG["event_rate"]
+        # A whole number of 64 us time-high periods per buffer, so every buffer is the first one
+        # with its time-high words shifted (unpaced streams advance 1 us per event)
+        self.span = 64 * max(round((count / rate * 1e6 if rate else count) / 64), 1)
+        self._pacer = _Pacer(1e6 / self.span if rate else 0)
+        events = sim_events(np.random.default_rng(SIM_CONFIG["seed"]), count, 0, self.span,
+                            SIM_CONFIG["event_width"], SIM_CONFIG["event_height"])
+        self._template = encode_evt2(events)
+        self._time_high = (self._template >> 28) == EVT2_TIME_HIGH
+        self._pending = None
+        self.running = False
+        self.buffers = 0
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def _next_buffer(self):
+        payload = self._template.copy()
+        payload[self._time_high] += np.uint32(self.buffers * self.span >> 6)
+        self.buffers += 1
+        self._pending = payload.view(np.uint8)
+        return 1
+
+    def poll_buffer(self):
+        """Non-blocking: 1 when a new buffer is available, 0 otherwise."""
+        if self._pending is None and self._pacer.due():
+            self._pacer.wait()
+            self._next_buffer()
+        return 0 if self._pending is None else 1
+
+    def wait_next_buffer(self):
+        """Block until a new buffer is available."""
+        if self._pending is None:
+            self._pacer.wait()
+            self._next_buffer()
+        return 1
+
+    def get_latest_raw_data(self):
+        if self._pending is None and not self.poll_buffer():
+            return None
+        data, self._pending = self._pending, None
+        return data
+
+
+class SimEventDevice:
+    def __init__(self, serial=""):
+        self.serial = serial
+        self._geometry = _SimGeometry(SIM_CONFIG["event_width"], SIM_CONFIG["event_height"])
+        self._stream = SimEventsStream()
+        self._identification = _SimHwIdentification(serial or "sim")
+
+    def get_i_geometry(self):
+        return self._geometry
+
+    def get_i_hw_identification(self):
+        return self._identification
+
+    def get_i_events_stream(self):
+        return self._stream
+
+
+class SimJoystick:
+    """Controller whose sticks follow slow deterministic sine sweeps."""
+
+    AXES = 6
+
+    def __init__(self, index=0):
+        self.index = index
+        self._t0 = time.monotonic()
+        self._pacer = _Pacer(SIM_CONFIG["controller_rate"])
+        self._reported = [None] * self.AXES
+
+    def get_numaxes(self):
+        return self.AXES
+
+    def wait_axis_events(self, timeout=None):
+        """Reports at `controller_rate`, with the axes that moved by at least one 16-bit step."""
+        self._pacer.wait()
+        timestamp = time.time()
+        changes = []
+        for axis in range(self.AXES):
+            value = round(self.get_axis(axis) * 32767) / 32767
+            if value != self._reported[axis]:
+                self._reported[axis] = value
+                changes.append((timestamp, axis, value))
+        return changes
+
+    def get_axis(self, axis):
+        t = time.monotonic() - self._t0
+        if axis == 0:
+            return math.sin(2 * math.pi * 0.25 * t)
+        if axis in (4, 5):
+            # Triggers rest at -1; alternate between them
+            phase = math.sin(2 * math.pi * 0.1 * t)
+            pressed = phase if axis == 5 else -phase
+            return max(pressed, 0.0) * 2 - 1
+        return 0.0
+
+    def pump(self):
+        pass
+
+    def quit(self):
+        pass
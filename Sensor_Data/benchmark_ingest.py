@@ -0,0 +1,375 @@
+"""
+Ingest throughput benchmark for the multi-sensor recorder.
+
+Drives each writer used by all_sensors_main.py (write_lidar_to_dat,
+save_camera_frames, log_imu_data, record_event_camera_data and
+ControllerInputLogger) from the simulated backend, first one at a time and
+then all together, and reports per writer:
+
+- items and sustained rate (and the target rate in realtime mode)
+- latency percentiles: time from an item leaving its source until the
+  writer asks for the next one, i.e. what the writer spends per item
+- writer and source CPU time (thread CPU, source share measured separately;
+  includes a writer's own background write thread)
+- bytes written to disk
+
+"max" mode runs every source unpaced to find the ceiling; "realtime" mode
+paces sources at the SIM_CONFIG rates to check that nothing falls behind.
+Results are printed (or written with --output) as JSON for regression tracking.
+
+    python3 benchmark_ingest.py --duration 10 --mode realtime --output bench.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+SENSOR_DIR = os.path.dirname(os.path.abspath(__file__))
+for sensor_folder in ("Camera", "Controller", "IMU", "Event_Camera", "Lidar"):
+    sys.path.append(os.path.join(SENSOR_DIR, sensor_folder))
+
+import backends
+from BMX160 import BMX160
+
+WRITERS = ("lidar", "camera", "imu", "event_camera", "controller")
+RESULTS_VERSION = 1
+
+
+class Probe:
+    """Counts and times the items a writer pulls from its source."""
+
+    def __init__(self):
+        self.items = 0
+        self.source_bytes = 0
+        self.source_cpu = 0.0
+        self.latencies = []
+        self.reader_threads = set()
+        self._handed_out = None
+        self._cpu_start = 0.0
+
+    def item_done(self):
+        """Ends the latency span of the last item, for writers that wait before asking for the next one."""
+        if self._handed_out is not None:
+            self.latencies.append(time.perf_counter() - self._handed_out)
+            self._handed_out = None
+
+    def before_read(self):
+        self.item_done()
+        self._cpu_start = time.thread_time()
+        self.reader_threads.add(threading.get_ident())
+
+    def after_read(self, count=1, nbytes=0):
+        self.source_cpu += time.thread_time() - self._cpu_start
+        if count:
+            self.items += count
+            self.source_bytes += nbytes
+            self._handed_out = time.perf_counter()
+
+    def wrap(self, iterable):
+        iterator = iter(iterable)
+        while True:
+            self.before_read()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.after_read()
+            yield item
+
+
+class TimedCapture:
+    def __init__(self, cap, probe):
+        self.cap = cap
+        self.probe = probe
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        self.probe.before_read()
+        ret, frame = self.cap.read()
+        self.probe.after_read(1 if ret else 0, frame.nbytes if ret else 0)
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class TimedEventsStream:
+    def __init__(self, stream, probe):
+        self.stream = stream
+        self.probe = probe
+
+    def start(self):
+        self.stream.start()
+
+    def stop(self):
+        self.stream.stop()
+
+    def poll_buffer(self):
+        return self.stream.poll_buffer()
+
+    def get_latest_raw_data(self):
+        self.probe.before_read()
+        data = self.stream.get_latest_raw_data()
+        self.probe.after_read(0 if data is None else 1, 0 if data is None else len(data))
+        return data
+
+
+class TimedEventDevice:
+    def __init__(self, device, probe):
+        self.device = device
+        self.stream = TimedEventsStream(device.get_i_events_stream(), probe)
+
+    def get_i_geometry(self):
+        return self.device.get_i_geometry()
+
+    def get_i_hw_identification(self):
+        return self.device.get_i_hw_identification()
+
+    def get_i_events_stream(self):
+        return self.stream
+
+
+def imu_samples(mode, rate):
+    """(timestamp, data) samples from a simulated BMX160, paced by its data-ready bits in realtime mode."""
+    bmx = BMX160(backends.open_smbus(1))
+    bmx.begin()
+    if mode == "realtime":
+        bmx.set_odr(rate)
+        yield from bmx.iter_data_ready()
+    index = 0
+    while True:
+        index += 1
+        yield time.time(), bmx.decode_frame(backends.SimSMBus.imu_frame(index))
+
+
+def controller_ticks(logger, probe, stop_event, rate):
+    """
+    Feed ControllerInputLogger the way its polling loop does, at `rate` ticks per second (0: unpaced).
+    Returns the logger's counters.
+    """
+    joystick = backends.open_joystick(0)
+    period = 1.0 / rate if rate else 0.0
+    next_tick = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            probe.before_read()
+            steering = joystick.get_axis(0)
+            throttle = (joystick.get_axis(5) + 1) / 2 - (joystick.get_axis(4) + 1) / 2
+            probe.after_read()
+            logger.record(steering * logger.max_steering, throttle * logger.max_throttle)
+            # The pacing wait stands for the controller's report interval, not writer latency
+            probe.item_done()
+            if period:
+                next_tick += period
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        logger.close()
+    return dict(logger.counters)
+
+
+def make_writer(name, data_dir, probe, stop_event, args):
+    """Return (target, target_rate) for one writer recording into data_dir."""
+    if name == "lidar":
+        from lidar_full import write_lidar_to_dat
+        lidar = backends.open_lidar()
+        filename = os.path.join(data_dir, "lidar.dat")
+        return (lambda: write_lidar_to_dat(lambda: probe.wrap(lidar.iterdist()), filename, stop_event),
+                backends.SIM_CONFIG["lidar_rate"])
+    if name == "camera":
+        from camera2JPEG import save_camera_frames
+        cap = TimedCapture(backends.open_video_capture(0), probe)
+        return (lambda: save_camera_frames(os.path.join(data_dir, "color_frames"), os.path.join(data_dir, "gray_frames"),
+                                           show=False, stop_event=stop_event, cap=cap),
+                backends.SIM_CONFIG["camera_fps"])
+    if name == "imu":
+        from imu2csv import log_imu_data
+        samples = probe.wrap(imu_samples(args.mode, args.imu_rate))
+        return (lambda: log_imu_data(os.path.join(data_dir, "imu_data.csv"), stop_event=stop_event,
+                                     print_interval=None, samples=samples),
+                args.imu_rate)
+    if name == "event_camera":
+        from events2dat import record_event_camera_data
+        device = TimedEventDevice(backends.open_event_device(""), probe)
+        buffer_rate = (backends.SIM_CONFIG["event_rate"] * backends.SIM_CONFIG["event_bytes_per_event"]
+                       / backends.SIM_CONFIG["event_buffer_bytes"])
+        return (lambda: record_event_camera_data(os.path.join(data_dir, "event_camera_data.raw"), stop_event, device),
+                buffer_rate)
+    if name == "controller":
+        from controller_full import ControllerInputLogger
+        logger = ControllerInputLogger(output_dir=data_dir)
+        rate = args.controller_rate if args.mode == "realtime" else 0
+        return lambda: controller_ticks(logger, probe, stop_event, rate), args.controller_rate
+    raise ValueError(f"Unknown writer: {name}")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def disk_usage(path):
+    total = 0
+    for folder, _, files in os.walk(path):
+        for filename in files:
+            total += os.path.getsize(os.path.join(folder, filename))
+    return total
+
+
+def io_write_bytes():
+    """Bytes this process has passed to write() so far (Linux only)."""
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_scenario(names, data_root, args):
+    stop_event = threading.Event()
+    probes, cpu, idents, stats, threads = {}, {}, {}, {}, []
+
+    def thread_main(name, target):
+        idents[name] = threading.get_ident()
+        start = time.thread_time()
+        try:
+            stats[name] = target()
+        except Exception as e:
+            print(f"{name} writer error: {e}", file=sys.stderr)
+        finally:
+            cpu[name] = time.thread_time() - start
+
+    for name in names:
+        data_dir = os.path.join(data_root, name)
+        os.makedirs(data_dir, exist_ok=True)
+        probes[name] = Probe()
+        target, target_rate = make_writer(name, data_dir, probes[name], stop_event, args)
+        threads.append((name, target_rate, threading.Thread(target=thread_main, args=(name, target), name=name)))
+
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io_start = io_write_bytes()
+    wall_start = time.perf_counter()
+    for _, _, thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop_event.set()
+    for _, _, thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io_end = io_write_bytes()
+
+    results = {}
+    for name, target_rate, _ in threads:
+        probe = probes[name]
+        latencies = sorted(probe.latencies)
+        rate = probe.items / wall
+        # Sources read from another thread (e.g. the camera capture thread) don't count against the writer thread
+        source_in_writer = probe.reader_threads == {idents.get(name)}
+        writer_stats = stats.get(name) if isinstance(stats.get(name), dict) else None
+        # Writers that hand the file writes to a thread of their own (controller, event camera) report its CPU
+        background_cpu = writer_stats.get("writer_cpu_s", 0.0) if writer_stats else 0.0
+        results[name] = {
+            "items": probe.items,
+            "rate_hz": rate,
+            "target_hz": target_rate if args.mode == "realtime" else None,
+            "behind": bool(args.mode == "realtime" and target_rate and rate < 0.95 * target_rate),
+            "latency_ms": {
+                "p50": _ms(percentile(latencies, 0.50)),
+                "p90": _ms(percentile(latencies, 0.90)),
+                "p99": _ms(percentile(latencies, 0.99)),
+                "max": _ms(latencies[-1] if latencies else None),
+            },
+            "writer_cpu_s": cpu.get(name, 0.0) - (probe.source_cpu if source_in_writer else 0.0) + background_cpu,
+            "source_cpu_s": probe.source_cpu,
+            "writer_stats": writer_stats,
+            "source_bytes": probe.source_bytes,
+            "bytes_on_disk": disk_usage(os.path.join(data_root, name)),
+        }
+    process_cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    children_cpu = ((children_end.ru_utime - children_start.ru_utime)
+                    + (children_end.ru_stime - children_start.ru_stime))
+    return {
+        "name": "+".join(names) if len(names) < len(WRITERS) else "all",
+        "writers": list(names),
+        "wall_s": wall,
+        "process_cpu_s": process_cpu,
+        "process_cpu_percent": 100.0 * process_cpu / wall,
+        # worker processes (e.g. the JPEG encoders), counted once they have exited
+        "children_cpu_s": children_cpu,
+        "io_write_bytes": None if io_start is None else io_end - io_start,
+        "results": results,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the multi-sensor recorder writers on simulated devices.")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--mode", choices=("max", "realtime"), default="max",
+                        help="max: unpaced sources; realtime: sources paced at the SIM_CONFIG rates")
+    parser.add_argument("--writers", nargs="+", choices=WRITERS, default=list(WRITERS))
+    parser.add_argument("--no-solo", action="store_true", help="only run the combined scenario")
+    parser.add_argument("--imu-rate", type=float, default=100, help="IMU output data rate in realtime mode")
+    parser.add_argument("--controller-rate", type=float, default=10, help="controller ticks per second in realtime mode")
+    parser.add_argument("--data-dir", help="keep recordings here instead of a temporary folder")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    backends.use_backend(backends.SIM)
+    if args.mode == "max":
+        backends.configure_sim(lidar_rate=0, camera_fps=0, event_rate=0)
+
+    started = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    data_root = args.data_dir or tempfile.mkdtemp(prefix="slug_bench_")
+    scenarios = []
+    try:
+        # Keep stdout for the JSON report, the writers print progress messages
+        with contextlib.redirect_stdout(sys.stderr):
+            if not args.no_solo:
+                for name in args.writers:
+                    scenarios.append(run_scenario([name], os.path.join(data_root, name), args))
+            if len(args.writers) > 1 or args.no_solo:
+                scenarios.append(run_scenario(args.writers, os.path.join(data_root, "combined"), args))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_root, ignore_errors=True)
+
+    report = {
+        "benchmark": "ingest",
+        "version": RESULTS_VERSION,
+        "started": started,
+        "mode": args.mode,
+        "duration_s": args.duration,
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "sim_config": dict(backends.SIM_CONFIG),
+        "scenarios": scenarios,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Binary columnar log format (.col) for fixed-schema numeric streams (IMU samples,
+controller commands).
+
+Layout (all integers little-endian):
+
+    header   b"SLUGCOL\\0", uint16 version, uint32 length, JSON metadata
+             (columns: [[name, dtype], ...], plus any user metadata), padded with spaces
+             so the data starts 8-byte aligned
+    chunks   b"CHNK", uint32 rows, then each column's rows as raw typed values, every
+             column padded to a multiple of 8 bytes
+    footer   one (uint64 offset, uint32 rows, float64 first, float64 last) entry per chunk,
+             then uint64 footer offset, uint32 chunk count, b"SLUGIDX\\0"
+
+The first column is the time.time() timestamp of the row and must be float64. Values are
+stored uncompressed and aligned, so the reader memory-maps the file and hands out NumPy
+views into it instead of parsing anything. Like the .ldr LIDAR log, a file without a footer
+(recording cut off) is still readable: the chunks are scanned from the header and a
+trailing partial chunk is ignored.
+
+    with ColumnLogWriter("imu_data.col", IMU_COLUMNS) as log:
+        log.write(timestamp, *data)
+    log = ColumnLogReader("imu_data.col")
+    gyro_x = log.column("gyro_x")
+
+Convert the CSV files of imu2csv / ControllerInputLogger, and back, with:
+
+    python3 column_log.py imu_data.csv imu_data.col
+    python3 column_log.py imu_data.col imu_data.csv
+"""
+import bisect
+import csv
+import itertools
+import json
+import os
+import struct
+import sys
+import numpy as np
+
+MAGIC = b"SLUGCOL\0"
+FOOTER_MAGIC = b"SLUGIDX\0"
+CHUNK_MAGIC = b"CHNK"
+VERSION = 1
+ALIGN = 8
+
+_PREAMBLE = struct.Struct("<8sHI")
+_CHUNK = struct.Struct("<4sI")
+_INDEX_ENTRY = struct.Struct("<QIdd")
+_TRAILER = struct.Struct("<QI8s")
+
+# Schemas of the streams written by imu2csv and ControllerInputLogger; the sensors' 16-bit
+# readings and the controller's stick values lose nothing as float32
+IMU_COLUMNS = [("timestamp", "<f8")] + [(name, "<f4") for name in
+                                        ("magn_x", "magn_y", "magn_z", "gyro_x", "gyro_y", "gyro_z",
+                                         "accel_x", "accel_y", "accel_z")]
+CONTROLLER_COLUMNS = [("timestamp", "<f8"), ("steering_angle", "<f4"), ("throttle", "<f4")]
+
+
+def _padded(size):
+    return -(-size // ALIGN) * ALIGN
+
+
+class ColumnLogWriter:
+    """
+    Appends rows to a .col log, chunk_rows rows per chunk (flush() ends a chunk early).
+    - filename: Name of the log file
+    - columns: list of (name, dtype); the first is the float64 timestamp
+    - chunk_rows: rows buffered in memory before they are written as a chunk
+    - metadata: dict stored in the header next to the column list
+    """
+    def __init__(self, filename, columns, chunk_rows=4096, metadata=None):
+        self.names = [name for name, _ in columns]
+        self.dtypes = [np.dtype(dtype).newbyteorder("<") for _, dtype in columns]
+        if self.dtypes[0] != np.dtype("<f8"):
+            raise ValueError("The first column must be a float64 timestamp")
+        self.chunk_rows = chunk_rows
+        self.file = open(filename, "wb")
+        header = dict(metadata or {}, columns=[[name, dtype.str] for name, dtype in zip(self.names, self.dtypes)])
+        encoded = json.dumps(header).encode()
+        encoded += b" " * (_padded(_PREAMBLE.size + len(encoded)) - _PREAMBLE.size - len(encoded))
+        self.file.write(_PREAMBLE.pack(MAGIC, VERSION, len(encoded)))
+        self.file.write(encoded)
+        self.index = []
+        self.rows = 0
+        self._buffers = [np.empty(chunk_rows, dtype=dtype) for dtype in self.dtypes]
+        self._filled = 0
+
+    def write(self, *row):
+        """Appends one row, a value per column."""
+        if len(row) != len(self.names):
+            raise ValueError(f"Expected {len(self.names)} values, got {len(row)}")
+        for buffer, value in zip(self._buffers, row):
+            buffer[self._filled] = value
+        self._filled += 1
+        if self._filled == self.chunk_rows:
+            self._write_chunk(self._buffers, self._filled)
+            self._filled = 0
+
+    def write_columns(self, columns):
+        """Appends a block of rows given as one array per column (all the same length)."""
+        if len(columns) != len(self.names):
+            raise ValueError(f"Expected {len(self.names)} columns, got {len(columns)}")
+        columns = [np.asarray(column) for column in columns]
+        count = len(columns[0])
+        start = 0
+        while start < count:
+            if self._filled == 0 and count - start >= self.chunk_rows:
+                # Whole chunks go straight from the caller's arrays
+                self._write_chunk([column[start:start + self.chunk_rows] for column in columns], self.chunk_rows)
+                start += self.chunk_rows
+                continue
+            take = min(self.chunk_rows - self._filled, count - start)
+            for buffer, column in zip(self._buffers, columns):
+                buffer[self._filled:self._filled + take] = column[start:start + take]
+            self._filled += take
+            start += take
+            if self._filled == self.chunk_rows:
+                self._write_chunk(self._buffers, self._filled)
+                self._filled = 0
+
+    def _write_chunk(self, columns, count):
+        offset = self.file.tell()
+        self.file.write(_CHUNK.pack(CHUNK_MAGIC, count))
+        for column, dtype in zip(columns, self.dtypes):
+            data = np.ascontiguousarray(column[:count], dtype=dtype).tobytes()
+            self.file.write(data)
+            self.file.write(b"\0" * (_padded(len(data)) - len(data)))
+        timestamps = columns[0]
+        self.index.append((offset, count, float(timestamps[0]), float(timestamps[count - 1])))
+        self.rows += count
+
+    def flush(self):
+        """Writes the buffered rows as a (short) chunk and hands the file to the OS."""
+        if self._filled:
+            self._write_chunk(self._buffers, self._filled)
+            self._filled = 0
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        footer_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(_INDEX_ENTRY.pack(*entry))
+        self.file.write(_TRAILER.pack(footer_offset, len(self.index), FOOTER_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnLogReader:
+    """
+    Reads a .col log through a memory map: chunk() returns views into the file, column()
+    and between() concatenate them.
+    - filename: .col file to read
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        if os.path.getsize(filename) < _PREAMBLE.size:
+            raise ValueError(f"{filename} is not a column log")
+        self._map = np.memmap(filename, dtype=np.uint8, mode="r")
+        magic, self.version, length = _PREAMBLE.unpack(self._map[:_PREAMBLE.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a column log")
+        if self.version > VERSION:
+            raise ValueError(f"{filename} is version {self.version}, this reader supports up to {VERSION}")
+        self.header = json.loads(self._map[_PREAMBLE.size:_PREAMBLE.size + length].tobytes())
+        self.names = [name for name, _ in self.header["columns"]]
+        self.dtypes = [np.dtype(dtype) for _, dtype in self.header["columns"]]
+        self._data_start = _PREAMBLE.size + length
+        self.index = self._read_footer()
+        if self.index is None:
+            self.index = self._scan_chunks()
+        self.chunk_starts = []
+        total = 0
+        for _, count, _, _ in self.index:
+            self.chunk_starts.append(total)
+            total += count
+        self.count = total
+        self.chunk_first_times = [entry[2] for entry in self.index]
+        self._columns = {}
+
+    def _chunk_size(self, count):
+        return _CHUNK.size + sum(_padded(count * dtype.itemsize) for dtype in self.dtypes)
+
+    def _read_footer(self):
+        size = len(self._map)
+        if size < self._data_start + _TRAILER.size:
+            return None
+        footer_offset, chunks, magic = _TRAILER.unpack(self._map[size - _TRAILER.size:].tobytes())
+        if magic != FOOTER_MAGIC:
+            return None
+        data = self._map[footer_offset:footer_offset + chunks * _INDEX_ENTRY.size].tobytes()
+        return [_INDEX_ENTRY.unpack_from(data, i * _INDEX_ENTRY.size) for i in range(chunks)]
+
+    def _scan_chunks(self):
+        """Rebuilds the index of a log without footer, skipping a trailing partial chunk."""
+        index = []
+        size = len(self._map)
+        offset = self._data_start
+        while offset + _CHUNK.size <= size:
+            magic, count = _CHUNK.unpack(self._map[offset:offset + _CHUNK.size].tobytes())
+            end = offset + self._chunk_size(count)
+            if magic != CHUNK_MAGIC or count == 0 or end > size:
+                break
+            timestamps = np.ndarray((count,), dtype=self.dtypes[0], buffer=self._map, offset=offset + _CHUNK.size)
+            index.append((offset, count, float(timestamps[0]), float(timestamps[-1])))
+            offset = end
+        if offset != size:
+            print(f"Warning: ignoring {size - offset} bytes of partial chunk at the end of the log.")
+        return index
+
+    def __len__(self):
+        return self.count
+
+    def chunk(self, chunk):
+        """Dict of column name -> read-only view into the file for one chunk."""
+        offset, count, _, _ = self.index[chunk]
+        offset += _CHUNK.size
+        views = {}
+        for name, dtype in zip(self.names, self.dtypes):
+            views[name] = np.ndarray((count,), dtype=dtype, buffer=self._map, offset=offset)
+            offset += _padded(count * dtype.itemsize)
+        return views
+
+    def column(self, name):
+        """Whole column as one array (a view for single-chunk logs, cached otherwise)."""
+        if name not in self._columns:
+            if name not in self.names:
+                raise KeyError(name)
+            parts = [self.chunk(chunk)[name] for chunk in range(len(self.index))]
+            if len(parts) == 1:
+                self._columns[name] = parts[0]
+            elif parts:
+                self._columns[name] = np.concatenate(parts)
+            else:
+                self._columns[name] = np.zeros(0, dtype=self.dtypes[self.names.index(name)])
+        return self._columns[name]
+
+    @property
+    def timestamps(self):
+        return self.column(self.names[0])
+
+    def table(self, names=None, dtype=np.float64):
+        """2D array of the given columns (default: all, timestamp first), one row per row."""
+        names = self.names if names is None else names
+        table = np.empty((self.count, len(names)), dtype=dtype)
+        for i, name in enumerate(names):
+            table[:, i] = self.column(name)
+        return table
+
+    def index_at(self, timestamp):
+        """Position of the first row at or after timestamp (len(self) if there is none)."""
+        chunk = max(bisect.bisect_right(self.chunk_first_times, timestamp) - 1, 0)
+        while chunk < len(self.index) and self.index[chunk][3] < timestamp:
+            chunk += 1
+        if chunk == len(self.index):
+            return self.count
+        timestamps = self.chunk(chunk)[self.names[0]]
+        return self.chunk_starts[chunk] + int(np.searchsorted(timestamps, timestamp, side="left"))
+
+    def between(self, start, end):
+        """Dict of column name -> array of the rows with start <= timestamp < end."""
+        first, last = self.index_at(start), self.index_at(end)
+        return {name: self.column(name)[first:last] for name in self.names}
+
+    def __iter__(self):
+        """(timestamp, values) per row, values as a float64 array of the other columns."""
+        for chunk in range(len(self.index)):
+            views = self.chunk(chunk)
+            timestamps = views[self.names[0]]
+            values = np.column_stack([views[name] for name in self.names[1:]]).astype(np.float64)
+            for timestamp, row in zip(timestamps, values):
+                yield float(timestamp), row
+
+    def close(self):
+        # Views handed out keep the map alive until they are gone
+        self._columns = {}
+        self._map = None
+
+
+def csv_to_log(csv_filename, log_filename, columns=None, chunk_rows=65536):
+    """
+    Converts a CSV log with a header row and a timestamp first column into a .col log.
+    - columns: list of (name, dtype) to store; default: the CSV header, all float64
+      (lossless for the CSV's values)
+    A trailing incomplete row (recording cut off) is skipped. Returns the number of rows converted.
+    """
+    with open(csv_filename, newline="") as f:
+        rows = csv.reader(f)
+        header = next(rows, [])
+        if columns is None:
+            columns = [(name, "<f8") for name in header]
+        if [name for name, _ in columns] != header:
+            raise ValueError(f"Columns {[name for name, _ in columns]} do not match the CSV header {header}")
+        log = ColumnLogWriter(log_filename, columns, chunk_rows=chunk_rows,
+                              metadata={"source": os.path.basename(csv_filename)})
+        with log:
+            while True:
+                block = [row for row in itertools.islice(rows, chunk_rows) if len(row) == len(header)]
+                if not block:
+                    break
+                try:
+                    values = np.array(block, dtype=np.float64)
+                except ValueError:
+                    # Rows that are not all numbers (a line cut off mid-value) are skipped
+                    parsed = [_floats(row) for row in block]
+                    values = np.array([value for row in parsed if row is not None for value in row],
+                                      dtype=np.float64)
+                log.write_columns(list(values.reshape(-1, len(header)).T))
+    return log.rows
+
+
+def _floats(row):
+    try:
+        return [float(value) for value in row]
+    except ValueError:
+        return None
+
+
+def log_to_csv(log_filename, csv_filename):
+    """Converts a .col log into a CSV file like imu2csv / ControllerInputLogger write. Returns the row count."""
+    log = ColumnLogReader(log_filename)
+    with open(csv_filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(log.names)
+        for chunk in range(len(log.index)):
+            views = log.chunk(chunk)
+            # Each value as the shortest repr in its own type, the way Python prints a float
+            columns = [views[name].tolist() if views[name].dtype.itemsize == 8 else views[name].astype(str).tolist()
+                       for name in log.names]
+            writer.writerows(zip(*columns))
+    count = len(log)
+    log.close()
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python3 column_log.py <input.csv> <output.col>  or  <input.col> <output.csv>")
+        sys.exit(1)
+    source, destination = sys.argv[1], sys.argv[2]
+    if source.endswith(".col"):
+        rows = log_to_csv(source, destination)
+    else:
+        rows = csv_to_log(source, destination)
+    print(f"Converted {rows} rows: {os.path.getsize(source)} -> {os.path.getsize(destination)} bytes")
@@ -0,0 +1,182 @@
+"""
+Fixed-rate control loop.
+
+Runs a callback on absolute time.monotonic() deadlines and keeps timing statistics:
+
+    def step(tick):
+        with tick.stage("read"):
+            value = controller.get_axis(0)
+        with tick.stage("actuate"):
+            car.set_steering_angle(value)
+
+    stats = ControlLoop(50, step).run(stop_event)
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper edges of the jitter histogram buckets in microseconds; the last bucket is open-ended
+JITTER_BUCKETS_US = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Tick:
+    """What the callback of a ControlLoop gets on every iteration."""
+    def __init__(self, loop, index, deadline, started):
+        self.loop = loop
+        self.index = index
+        self.deadline = deadline
+        self.started = started
+
+    @contextmanager
+    def stage(self, name):
+        """Time a part of the callback: `with tick.stage("read"): ...`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.loop._record_stage(name, time.perf_counter() - start)
+
+class ControlLoop:
+    """
+    Calls callback(tick) at a fixed rate on absolute time.monotonic() deadlines, so the period
+    does not drift with the time the callback takes.
+    An iteration that ends after the next deadline is an overrun; the loop then skips the
+    deadlines it missed instead of running late iterations back to back.
+    Records jitter (start delay after the deadline) as a histogram, overruns and per-stage
+    timing from tick.stage().
+    - rate: iterations per second
+    - callback: function taking a Tick; returning False stops the loop
+    - spin: seconds before each deadline spent polling the clock instead of sleeping (sharper
+      start times at the cost of CPU; 0 only sleeps). None: 0.5 ms when realtime or cpus set the
+      loop apart from the other threads, else 0. The poll yields the GIL, but still costs a core.
+    - realtime: run the loop thread with SCHED_FIFO priority `priority` (needs CAP_SYS_NICE,
+      falls back to a lower nice value, then to normal priority)
+    - cpus: CPU numbers to pin the loop thread to
+      (priority and affinity apply to the thread calling run() and outlast the loop)
+    - history: number of recent timings kept per stage for percentiles
+    """
+    def __init__(self, rate, callback, spin=None, realtime=False, priority=50, cpus=None, history=1000):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.callback = callback
+        if spin is None:
+            spin = 0.0005 if realtime or cpus is not None else 0.0
+        self.spin = spin
+        self.realtime = realtime
+        self.priority = priority
+        self.cpus = cpus
+        self.history = history
+        self.iterations = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_histogram = [0] * (len(JITTER_BUCKETS_US) + 1)
+        self.jitter = deque(maxlen=history)
+        self.stages = {}
+        self.elapsed = 0.0
+        self.scheduling = "normal"
+
+    def _record_stage(self, name, seconds):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {"count": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=self.history)}
+        stage["count"] += 1
+        stage["total"] += seconds
+        stage["max"] = max(stage["max"], seconds)
+        stage["recent"].append(seconds)
+
+    def _apply_scheduling(self):
+        # Both calls act on the calling thread, i.e. the loop thread
+        if self.cpus is not None:
+            try:
+                os.sched_setaffinity(0, self.cpus)
+            except (AttributeError, OSError) as e:
+                print(f"Warning: could not set CPU affinity: {e}")
+        if not self.realtime:
+            return
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+            self.scheduling = f"SCHED_FIFO {self.priority}"
+            return
+        except (AttributeError, PermissionError, OSError):
+            pass
+        try:
+            os.nice(-10)
+            self.scheduling = "nice -10"
+        except OSError:
+            print("Warning: no permission to raise the control loop priority, running at normal priority")
+
+    def _wait_until(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.monotonic() < deadline:
+            # Let the other threads of the process run meanwhile
+            time.sleep(0)
+
+    def run(self, stop_event=None, iterations=None):
+        """
+        Run until stop_event is set, the callback returns False or `iterations` iterations ran.
+        Returns stats().
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        self._apply_scheduling()
+        start = time.monotonic()
+        deadline = start
+        index = 0
+        try:
+            while not stop_event.is_set() and (iterations is None or index < iterations):
+                self._wait_until(deadline)
+                started = time.monotonic()
+                jitter_us = (started - deadline) * 1e6
+                self.jitter_histogram[bisect.bisect_left(JITTER_BUCKETS_US, jitter_us)] += 1
+                self.jitter.append(jitter_us)
+
+                result = self.callback(Tick(self, index, deadline, started))
+                finished = time.monotonic()
+                self._record_stage("total", finished - started)
+                self.iterations += 1
+                index += 1
+                if result is False:
+                    break
+
+                deadline += self.period
+                if finished > deadline:
+                    self.overruns += 1
+                    # Next deadline still ahead of us, on the original grid
+                    missed = int((finished - deadline) / self.period) + 1
+                    self.skipped += missed
+                    deadline += missed * self.period
+        finally:
+            # Also when the callback raises or Ctrl+C interrupts the loop
+            self.elapsed = time.monotonic() - start
+        return self.stats()
+
+    def stats(self):
+        """Iterations, achieved rate, overruns, jitter histogram and percentiles, per-stage timing."""
+        def percentile(values, fraction):
+            if not values:
+                return None
+            ordered = sorted(values)
+            return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+        labels = [f"<={edge}us" for edge in JITTER_BUCKETS_US] + [f">{JITTER_BUCKETS_US[-1]}us"]
+        return {
+            "rate_hz": self.rate,
+            "achieved_hz": self.iterations / self.elapsed if self.elapsed else None,
+            "iterations": self.iterations,
+            "overruns": self.overruns,
+            "skipped_deadlines": self.skipped,
+            "scheduling": self.scheduling,
+            "jitter_us": {"p50": percentile(self.jitter, 0.5), "p99": percentile(self.jitter, 0.99),
+                          "max": max(self.jitter) if self.jitter else None,
+                          "histogram": dict(zip(labels, self.jitter_histogram))},
+            "stages_ms": {name: {"mean": 1e3 * stage["total"] / stage["count"],
+                                 "p99": 1e3 * percentile(stage["recent"], 0.99),
+                                 "max": 1e3 * stage["max"]}
+                          for name, stage in self.stages.items()},
+        }
@@ -0,0 +1,153 @@
+"""
+Prioritized access to the I2C bus shared by the PCA9685 servo driver and the BMX160.
+
+The bus carries one transaction at a time. I2CArbiter owns the SMBus handle and hands the
+bus to waiting transactions by priority (control writes, then IMU FIFO drains, then
+housekeeping) instead of in arrival order, so a steering write waits for at most the
+transaction already on the bus (strict priority: a saturated bus starves housekeeping).
+It records per-transaction latency (queueing + bus time) and bus utilization per priority.
+
+    arbiter = I2CArbiter(open_smbus(1))
+    imu = BMX160(arbiter.client(PRIORITY_IMU))         # any smbus-style user
+    with arbiter.hold(PRIORITY_CONTROL):                # anything else on the same bus
+        pca_write()
+
+The arbiter orders transactions of one process; across processes let the sensor daemon
+own the bus.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+PRIORITY_CONTROL = 0
+PRIORITY_IMU = 1
+PRIORITY_HOUSEKEEPING = 2
+PRIORITY_NAMES = {PRIORITY_CONTROL: "control", PRIORITY_IMU: "imu", PRIORITY_HOUSEKEEPING: "housekeeping"}
+
+class I2CArbiter:
+    """
+    Priority lock around an SMBus handle, with timing statistics.
+    - bus: smbus/smbus2 SMBus (or backends.SimSMBus); None when every user brings its own
+      handle and only needs the ordering, like ServoKit
+    - history: number of recent transactions kept per priority for percentiles
+    """
+    def __init__(self, bus=None, history=1000):
+        self.bus = bus
+        self.history = history
+        self._cond = threading.Condition()
+        self._owner = None
+        self._depth = 0
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._acquired = 0.0
+        self._start = time.monotonic()
+        self._busy = 0.0
+        self._stats = {}
+
+    def acquire(self, priority=PRIORITY_HOUSEKEEPING):
+        """Wait for the bus; lower priority numbers go first. Reentrant within a thread."""
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return
+            entry = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, entry)
+            while self._owner is not None or self._waiting[0] != entry:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._owner = me
+            self._depth = 1
+            self._acquired = time.monotonic()
+
+    def release(self):
+        with self._cond:
+            self._depth -= 1
+            if self._depth:
+                return
+            self._busy += time.monotonic() - self._acquired
+            self._owner = None
+            self._cond.notify_all()
+
+    def hold(self, priority=PRIORITY_HOUSEKEEPING):
+        """Context manager holding the bus for one transaction (or a group of them)."""
+        return _Hold(self, priority)
+
+    def client(self, priority=PRIORITY_HOUSEKEEPING):
+        """SMBus-compatible view of the bus whose transactions run at `priority`."""
+        if self.bus is None:
+            raise ValueError("This arbiter has no SMBus handle to share")
+        return ArbitratedBus(self, priority)
+
+    def _record(self, priority, wait, total):
+        with self._cond:
+            stats = self._stats.get(priority)
+            if stats is None:
+                stats = self._stats[priority] = {"count": 0, "wait_total": 0.0, "wait_max": 0.0,
+                                                 "bus_total": 0.0, "latency": deque(maxlen=self.history)}
+            stats["count"] += 1
+            stats["wait_total"] += wait
+            stats["wait_max"] = max(stats["wait_max"], wait)
+            stats["bus_total"] += total - wait
+            stats["latency"].append(total)
+
+    def stats(self):
+        """
+        Bus utilization (fraction of time held) and, per priority, transaction count, queueing
+        wait (mean, max) and latency from request to completion (mean, p99, max), in ms.
+        """
+        elapsed = time.monotonic() - self._start
+        priorities = {}
+        with self._cond:
+            snapshot = [(priority, dict(stats, latency=sorted(stats["latency"])))
+                        for priority, stats in sorted(self._stats.items())]
+        for priority, stats in snapshot:
+            latency = stats["latency"]
+            priorities[PRIORITY_NAMES.get(priority, str(priority))] = {
+                "count": stats["count"],
+                "wait_mean_ms": 1e3 * stats["wait_total"] / stats["count"],
+                "wait_max_ms": 1e3 * stats["wait_max"],
+                "latency_mean_ms": 1e3 * sum(latency) / len(latency),
+                "latency_p99_ms": 1e3 * latency[min(int(0.99 * len(latency)), len(latency) - 1)],
+                "latency_max_ms": 1e3 * latency[-1],
+                "utilization": stats["bus_total"] / elapsed if elapsed else 0.0,
+            }
+        return {"utilization": self._busy / elapsed if elapsed else 0.0, "priorities": priorities}
+
+class _Hold:
+    def __init__(self, arbiter, priority):
+        self.arbiter = arbiter
+        self.priority = priority
+
+    def __enter__(self):
+        self._requested = time.monotonic()
+        self.arbiter.acquire(self.priority)
+        self._wait = time.monotonic() - self._requested
+        return self
+
+    def __exit__(self, *exc):
+        total = time.monotonic() - self._requested
+        self.arbiter.release()
+        self.arbiter._record(self.priority, self._wait, total)
+
+class ArbitratedBus:
+    """Forwards SMBus methods to the arbiter's bus, each call as one transaction at `priority`."""
+    def __init__(self, arbiter, priority):
+        self.arbiter = arbiter
+        self.priority = priority
+
+    def __getattr__(self, name):
+        attr = getattr(self.arbiter.bus, name)
+        if not callable(attr):
+            return attr
+
+        def transaction(*args, **kwargs):
+            with self.arbiter.hold(self.priority):
+                return attr(*args, **kwargs)
+        return transaction
+
+    def close(self):
+        # The bus belongs to the arbiter
+        pass
@@ -0,0 +1,458 @@
+"""
+Sensor daemon: one long-running process owns every device of the car (servo driver, RGB
+camera, LIDAR, IMU, event camera) and serves them to any number of local clients.
+
+- Camera frames, LIDAR scans and IMU samples are published into shared-memory ring buffers
+  (shm_ring.py); clients read them directly from shared memory, no round trip to the daemon.
+- Servo commands and event camera batches go over a Unix domain socket: each message is a
+  uint32 length followed by a JSON object, optionally followed by a binary payload whose
+  size is given in the object's "payload" field.
+
+SensorClient offers SlugMobile's methods on top of that, so a driving policy and the
+logger can run at the same time:
+
+    python3 sensor_daemon.py &
+    car = SensorClient()
+    car.set_steering_angle(100)
+    frame = car.get_RGB()
+
+Servo commands are clamped by the daemon to its --max-steering / --max-throttle band, like
+SlugMobile's. The socket is only accessible to the user running the daemon.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+SENSOR_DIR = os.path.dirname(os.path.abspath(__file__))
+for sensor_folder in ("IMU", "Event_Camera"):
+    sys.path.append(os.path.join(SENSOR_DIR, sensor_folder))
+
+from backends import (EVENT_CD_DTYPE, open_events_iterator, open_lidar, open_servo_kit, open_smbus,
+                      open_video_capture)
+from i2c_arbiter import I2CArbiter, PRIORITY_HOUSEKEEPING, PRIORITY_IMU
+from servo_output import ServoOutput, servo_range
+from shm_ring import RING_SPECS, ShmRing
+
+# The user's runtime directory is private to them; the socket itself is created 0600 as well
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "slug_mobile.sock")
+RING_PREFIX = "slug_mobile_"
+SENSORS = ("servos", "camera", "lidar", "imu", "events")
+STEERING_CHANNEL = 0
+DRIVING_CHANNEL = 15
+
+_LENGTH = struct.Struct("<I")
+
+
+def send_message(sock, message, payload=None):
+    if payload is not None:
+        payload = memoryview(payload).cast('B')
+        message = dict(message, payload=payload.nbytes)
+    data = json.dumps(message).encode()
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("connection closed")
+        received += count
+    return buffer
+
+
+def recv_message(sock):
+    """(message, payload) of the next message; payload is None when there is none."""
+    length, = _LENGTH.unpack(recv_exact(sock, _LENGTH.size))
+    message = json.loads(recv_exact(sock, length))
+    payload = recv_exact(sock, message["payload"]) if "payload" in message else None
+    return message, payload
+
+
+class _ClientHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        while True:
+            try:
+                message, _ = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply, payload = daemon.handle(message)
+            except Exception as e:
+                reply, payload = {"error": f"{type(e).__name__}: {e}"}, None
+            send_message(self.request, reply, payload)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SensorDaemon:
+    """
+    Owns the devices and serves them to SensorClients.
+    - socket_path: Unix socket clients connect to
+    - ring_prefix: prefix of the shared memory ring names
+    - sensors: devices to open, any of SENSORS; a device that fails to open is left out
+    - camera_index: RGB camera to open
+    - imu_rate: IMU output data rate in Hz (default: keep the chip's 100 Hz)
+    - ring_slots: items kept per ring
+    - max_steering, max_throttle: max percentage of the servo swing around 90 clients can command
+    """
+    def __init__(self, socket_path=SOCKET_PATH, ring_prefix=RING_PREFIX, sensors=SENSORS, camera_index=0,
+                 imu_rate=None, ring_slots=16, max_steering=80, max_throttle=20):
+        self.socket_path = socket_path
+        self.max_steering = max_steering
+        self.max_throttle = max_throttle
+        self.ring_prefix = ring_prefix
+        self.sensors = sensors
+        self.camera_index = camera_index
+        self.imu_rate = imu_rate
+        self.ring_slots = ring_slots
+        self.stop_event = threading.Event()
+        self.rings = {}
+        self.threads = []
+        self.servo_kit = None
+        self.servos = None
+        self.events = None
+        self.i2c = None
+        self.counters = {"requests": 0}
+
+    # Devices
+
+    def _create_ring(self, name, dtype, shape):
+        self.rings[name] = ShmRing.create(self.ring_prefix + name, dtype, shape, self.ring_slots)
+        return self.rings[name]
+
+    def _start_thread(self, name, target, *args):
+        thread = threading.Thread(target=target, args=args, name=f"Daemon{name}", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _open_servos(self):
+        self.servo_kit = open_servo_kit(address=0x60, channels=16)
+        self.servos = ServoOutput(self.servo_kit, channels=(STEERING_CHANNEL, DRIVING_CHANNEL),
+                                  arbiter=self._i2c_arbiter())
+        self.servos.set_many({STEERING_CHANNEL: 90, DRIVING_CHANNEL: 90})
+
+    def _i2c_arbiter(self):
+        # Servo driver and IMU share I2C bus 1, opened on first use
+        if self.i2c is None:
+            self.i2c = I2CArbiter(open_smbus(1))
+        return self.i2c
+
+    def _open_camera(self):
+        cap = open_video_capture(self.camera_index)
+        ret, frame = cap.read() if cap.isOpened() else (False, None)
+        if not ret:
+            raise RuntimeError("Could not read from the camera")
+        # The ring is sized from the first frame, the camera may not run at RING_SPECS' 640x480
+        ring = self._create_ring("camera", frame.dtype, frame.shape)
+        ring.publish(frame)
+        self._start_thread("Camera", self._camera_loop, cap, ring)
+
+    def _camera_loop(self, cap, ring):
+        while not self.stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                print("Error: Could not read frame.")
+                break
+            ring.publish(frame, time.time())
+        cap.release()
+
+    def _open_lidar(self):
+        lidar = open_lidar()
+        ring = self._create_ring("lidar", *RING_SPECS["lidar"])
+        self._start_thread("Lidar", self._lidar_loop, lidar, ring)
+
+    def _lidar_loop(self, lidar, ring):
+        for timestamp, scan in lidar.iterdist():
+            if self.stop_event.is_set():
+                break
+            ring.publish(scan, timestamp)
+
+    def _open_imu(self):
+        from BMX160 import BMX160
+        imu_bus = self._i2c_arbiter().client(PRIORITY_HOUSEKEEPING)
+        imu = BMX160(imu_bus)
+        if not imu.begin():
+            raise RuntimeError("BMX160 did not respond")
+        if self.imu_rate is not None:
+            imu.set_odr(self.imu_rate)
+        imu_bus.priority = PRIORITY_IMU
+        ring = self._create_ring("imu", *RING_SPECS["imu"])
+        self._start_thread("IMU", self._imu_loop, imu, ring)
+
+    def _imu_loop(self, imu, ring):
+        for timestamp, data in imu.iter_data_ready():
+            if self.stop_event.is_set():
+                break
+            ring.publish(data, timestamp)
+
+    def _open_events(self):
+        from event_batches import EventBatcher
+        self.events = EventBatcher(open_events_iterator(input_path="", mode="delta_t", delta_t=1000)).start()
+
+    def start(self):
+        for sensor in self.sensors:
+            if sensor not in SENSORS:
+                raise ValueError(f"Unknown sensor: {sensor}")
+            try:
+                getattr(self, f"_open_{sensor}")()
+            except Exception as e:
+                print(f"Sensor daemon: {sensor} unavailable: {e}")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = _Server(self.socket_path, _ClientHandler, bind_and_activate=False)
+        # Owner only, before the socket accepts connections: the servos move on any request
+        self.server.server_bind()
+        os.chmod(self.socket_path, 0o600)
+        self.server.server_activate()
+        self.server.daemon = self
+        self._start_thread("Server", self.server.serve_forever, 0.1)
+        print(f"Sensor daemon serving {', '.join(self.available())} on {self.socket_path}")
+        return self
+
+    def available(self):
+        names = list(self.rings)
+        if self.servos is not None:
+            names.append("servos")
+        if self.events is not None:
+            names.append("events")
+        return names
+
+    # Requests
+
+    def handle(self, message):
+        """(reply, payload) for one client request."""
+        self.counters["requests"] += 1
+        command = message.get("command")
+        if command == "info":
+            return {"rings": {name: ring.shm.name for name, ring in self.rings.items()},
+                    "available": self.available(), "max_steering": self.max_steering,
+                    "max_throttle": self.max_throttle}, None
+        if command == "ping":
+            return {}, None
+        if command in ("set_steering_angle", "set_throttle", "set_controls", "drive"):
+            if self.servos is None:
+                return {"error": "servos unavailable"}, None
+            if command == "drive":
+                angles = {STEERING_CHANNEL: self._stick_angle(message["steering"], self.max_steering),
+                          DRIVING_CHANNEL: self._stick_angle(message["throttle"], self.max_throttle)}
+            elif command == "set_controls":
+                angles = {STEERING_CHANNEL: message["angle"], DRIVING_CHANNEL: message["throttle"]}
+            else:
+                channel = STEERING_CHANNEL if command == "set_steering_angle" else DRIVING_CHANNEL
+                angles = {channel: message["value"]}
+            output = self.servos.set_many({channel: self._clamp(channel, angle) for channel, angle in angles.items()})
+            return {"steering_angle": output.get(STEERING_CHANNEL), "throttle": output.get(DRIVING_CHANNEL)}, None
+        if command in ("event_window", "event_batch", "event_stats"):
+            if self.events is None:
+                return {"error": "event camera unavailable"}, None
+            if command == "event_stats":
+                return self.events.stats(), None
+            latest, timeout = message.get("latest", False), message.get("timeout", 1.0)
+            if command == "event_window":
+                delta_t = message["delta_t"]
+                events = self.events.latest_window(delta_t) if latest else self.events.next_window(delta_t, timeout)
+            else:
+                n_events = message["n_events"]
+                events = self.events.latest_events(n_events) if latest else self.events.next_events(n_events, timeout)
+            if events is None:
+                return {"events": None}, None
+            return {"events": len(events)}, np.ascontiguousarray(events).data
+        if command == "stats":
+            servos = self.servos.stats() if self.servos is not None else None
+            i2c = self.i2c.stats() if self.i2c is not None else None
+            return dict(self.counters, servos=servos, i2c=i2c,
+                        published={name: ring.published for name, ring in self.rings.items()}), None
+        return {"error": f"unknown command {command}"}, None
+
+    def _clamp(self, channel, angle):
+        """angle limited to the channel's max_steering / max_throttle band, as SlugMobile does."""
+        low, high = servo_range(self.max_steering if channel == STEERING_CHANNEL else self.max_throttle)
+        return min(max(angle, low), high)
+
+    @staticmethod
+    def _stick_angle(value, max_percent):
+        """Servo angle for a stick value from -1 to 1, over the allowed band (SlugMobile.drive)."""
+        low, high = servo_range(max_percent)
+        value = min(max(value, -1.0), 1.0)
+        return round(low + (value + 1) / 2 * (high - low), 3)
+
+    def run(self):
+        """Serve until Ctrl+C or SIGTERM."""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop_event.set())
+        self.start()
+        try:
+            while not self.stop_event.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self.events is not None:
+            self.events.stop()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+        for ring in self.rings.values():
+            ring.close()
+        print("Sensor daemon stopped.")
+
+
+class SensorClient:
+    """
+    SlugMobile's interface, served by a running SensorDaemon.
+    Camera, LIDAR and IMU getters read the daemon's shared-memory rings and return copies
+    (use client.rings[...] for zero-copy views); servo and event calls are socket requests.
+    Getters of sensors the daemon does not have return None.
+    - socket_path: Unix socket of the daemon
+    """
+    def __init__(self, socket_path=SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self._lock = threading.Lock()
+        info = self.request("info")
+        self.available = info["available"]
+        self.max_steering = info["max_steering"]
+        self.max_throttle = info["max_throttle"]
+        self.steering_angle = 0
+        self.throttle = 0
+        self.rings = {name: ShmRing.attach(shm_name) for name, shm_name in info["rings"].items()}
+        self.rgb_seq = 0
+        self.imu_seq = -1
+
+    def request(self, command, **arguments):
+        """Send one request; returns the reply (with the payload under "payload_data" if any)."""
+        with self._lock:
+            send_message(self.sock, dict(arguments, command=command))
+            reply, payload = recv_message(self.sock)
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        if payload is not None:
+            reply["payload_data"] = payload
+        return reply
+
+    def _servo_reply(self, reply):
+        # Angles actually output, after the daemon's clamp and quantization
+        if reply["steering_angle"] is not None:
+            self.steering_angle = reply["steering_angle"]
+        if reply["throttle"] is not None:
+            self.throttle = reply["throttle"]
+
+    def servo_range(self, max_percent):
+        """(lowest, highest) servo angle allowed by a max percentage of the swing around 90"""
+        return servo_range(max_percent)
+
+    def set_steering_angle(self, angle):
+        self._servo_reply(self.request("set_steering_angle", value=angle))
+
+    def set_throttle(self, throttle):
+        self._servo_reply(self.request("set_throttle", value=throttle))
+
+    def set_controls(self, angle, throttle):
+        self._servo_reply(self.request("set_controls", angle=angle, throttle=throttle))
+
+    def drive(self, steering, throttle):
+        """Steers and drives from stick values (-1 to 1), see SlugMobile.drive."""
+        self._servo_reply(self.request("drive", steering=steering, throttle=throttle))
+
+    def get_RGB(self, wait_newer=False, timeout=1.0):
+        return self.get_RGB_stamped(wait_newer, timeout)[2]
+
+    def get_RGB_stamped(self, wait_newer=False, timeout=1.0):
+        ring = self.rings.get("camera")
+        if ring is None:
+            return 0, None, None
+        if wait_newer and ring.next(self.rgb_seq, timeout) is None:
+            return self.rgb_seq, None, None
+        entry = ring.latest(copy=True)
+        if entry is None:
+            return 0, None, None
+        self.rgb_seq = entry[0]
+        return entry
+
+    def get_distance(self):
+        ring = self.rings.get("lidar")
+        entry = ring.latest(copy=True) if ring is not None else None
+        if entry is None:
+            return None
+        return entry[1], entry[2]
+
+    def get_imu_data(self):
+        ring = self.rings.get("imu")
+        entry = ring.latest(copy=True) if ring is not None else None
+        if entry is None:
+            return None
+        data = entry[2]
+        return (data[0], data[1], data[2]), (data[3], data[4], data[5]), (data[6], data[7], data[8])
+
+    def get_imu_samples(self):
+        """Every IMU sample published since the last call (at most the ring's slots), oldest first."""
+        ring = self.rings.get("imu")
+        if ring is None:
+            return []
+        samples = []
+        while True:
+            entry = ring.next(self.imu_seq, timeout=0, copy=True)
+            if entry is None:
+                return samples
+            self.imu_seq, timestamp, data = entry
+            samples.append((timestamp, (data[0], data[1], data[2]), (data[3], data[4], data[5]),
+                            (data[6], data[7], data[8])))
+
+    def _events(self, reply):
+        if reply["events"] is None:
+            return None
+        return np.frombuffer(reply.get("payload_data", b""), dtype=EVENT_CD_DTYPE)
+
+    def get_event(self):
+        event = self.get_event_batch(1, timeout=None)[0]
+        return event['x'], event['y'], event['p'], event['t']
+
+    def get_event_window(self, delta_t=10000, latest=False, timeout=1.0):
+        return self._events(self.request("event_window", delta_t=delta_t, latest=latest, timeout=timeout))
+
+    def get_event_batch(self, n_events=10000, latest=False, timeout=1.0):
+        return self._events(self.request("event_batch", n_events=n_events, latest=latest, timeout=timeout))
+
+    def get_event_stats(self):
+        return self.request("event_stats")
+
+    def close(self):
+        self.sock.close()
+        for ring in self.rings.values():
+            ring.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Own the car's devices and serve them to local clients.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("--sensors", nargs="+", choices=SENSORS, default=list(SENSORS), help="devices to open")
+    parser.add_argument("--camera-index", type=int, default=0)
+    parser.add_argument("--imu-rate", type=int, default=None, help="IMU output data rate in Hz")
+    parser.add_argument("--max-steering", type=float, default=80, help="max percentage of steering angle")
+    parser.add_argument("--max-throttle", type=float, default=20, help="max percentage of thrust")
+    args = parser.parse_args()
+    SensorDaemon(args.socket, sensors=args.sensors, camera_index=args.camera_index, imu_rate=args.imu_rate,
+                 max_steering=args.max_steering, max_throttle=args.max_throttle).run()
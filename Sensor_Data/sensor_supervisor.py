@@ -0,0 +1,105 @@
+import multiprocessing
+import signal
+import time
+
+def _worker_main(name, target, stop_event, attempt):
+    # Ctrl+C reaches the whole process group; the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(stop_event=stop_event, attempt=attempt)
+
+class SensorSupervisor:
+    """
+    Runs each sensor in its own process and keeps them running.
+    Workers are called as target(stop_event=..., attempt=...) with a shared multiprocessing
+    Event; attempt counts restarts so a worker can pick a fresh output file. A worker that
+    exits while the supervisor is not stopping (crash or sensor error) is restarted after
+    restart_delay seconds, at most max_restarts times.
+    - targets: dict of sensor name -> module-level function (it is pickled to the worker)
+    - max_restarts: restarts per sensor before giving up on it
+    - restart_delay: seconds to wait before restarting a worker
+    - start_method: multiprocessing start method; "spawn" gives every worker a fresh interpreter
+    """
+    def __init__(self, targets, max_restarts=5, restart_delay=1.0, start_method="spawn"):
+        self.targets = targets
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.context = multiprocessing.get_context(start_method)
+        self.stop_event = self.context.Event()
+        self.processes = {}
+        self.restarts = {name: 0 for name in targets}
+        self.exit_codes = {}
+        self._restart_at = {}
+
+    def _start(self, name):
+        # Not daemonic: workers may start processes of their own (camera encoder pool)
+        process = self.context.Process(target=_worker_main, name=f"{name}-sensor",
+                                       args=(name, self.targets[name], self.stop_event, self.restarts[name]))
+        process.start()
+        self.processes[name] = process
+        print(f"Supervisor: started {name} (pid {process.pid})")
+
+    def start(self):
+        for name in self.targets:
+            self._start(name)
+        return self
+
+    def poll(self):
+        """Check the workers once, restarting those that died; returns the names still running or pending restart."""
+        now = time.monotonic()
+        for name, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            if name in self._restart_at:
+                if now >= self._restart_at[name]:
+                    del self._restart_at[name]
+                    self.restarts[name] += 1
+                    self._start(name)
+                continue
+            process.join()
+            self.exit_codes[name] = process.exitcode
+            if self.stop_event.is_set():
+                continue
+            if self.restarts[name] < self.max_restarts:
+                print(f"Supervisor: {name} exited with code {process.exitcode}, restarting in {self.restart_delay}s")
+                self._restart_at[name] = now + self.restart_delay
+            else:
+                print(f"Supervisor: {name} exited with code {process.exitcode}, giving up after {self.max_restarts} restarts")
+                del self.processes[name]
+        return [name for name, process in self.processes.items() if process.is_alive() or name in self._restart_at]
+
+    def run(self, stop_event=None, poll_interval=0.5):
+        """
+        Start the workers and supervise them until stop_event is set, Ctrl+C or SIGTERM, or
+        every worker is gone; then shut them down.
+        Returns {name: {"restarts": ..., "exit_code": ...}}.
+        """
+        previous_sigterm = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop_event.set())
+        self.start()
+        try:
+            while self.poll() and not self.stop_event.is_set():
+                if stop_event is not None and stop_event.is_set():
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("Supervisor: stopping sensors...")
+        finally:
+            self.shutdown()
+            signal.signal(signal.SIGTERM, previous_sigterm)
+        return {name: {"restarts": self.restarts[name], "exit_code": self.exit_codes.get(name)} for name in self.targets}
+
+    def shutdown(self, timeout=5.0):
+        """Ask every worker to stop, then terminate (and finally kill) the ones that do not exit in time."""
+        self.stop_event.set()
+        self._restart_at.clear()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+        for name, process in self.processes.items():
+            if process.is_alive():
+                print(f"Supervisor: {name} did not stop in time, terminating it")
+                process.terminate()
+                process.join(1.0)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+            self.exit_codes[name] = process.exitcode
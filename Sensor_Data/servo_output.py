@@ -0,0 +1,162 @@
+"""
+Servo output stage for the PCA9685 behind ServoKit.
+
+Every `servo.angle = x` through ServoKit is one I2C transaction, whether or not the value
+changed. ServoOutput keeps the last value written per channel in PWM ticks (the PCA9685 has
+12-bit resolution: at 50 Hz one tick is ~4.9 us of pulse, ~0.6 degrees of a 180 degree
+servo), so a command that lands on the same tick costs nothing. Changed channels are
+written together in one critical section; contiguous channels share a single auto-increment block
+write (steering on 0 and throttle on 15 are 60 registers apart, so they stay two writes
+but go out back to back).
+
+    servos = ServoOutput(open_servo_kit(), channels=(0, 15))
+    with servos.batch():
+        servos.set(0, steering)
+        servos.set(15, throttle)   # both written here, on leaving the block
+"""
+import struct
+import threading
+from contextlib import contextmanager, nullcontext
+
+from i2c_arbiter import PRIORITY_CONTROL
+
+# PCA9685 registers: LEDn_ON_L, LEDn_ON_H, LEDn_OFF_L, LEDn_OFF_H start at 0x06, 4 per channel
+LED0_ON_L = 0x06
+PWM_STEPS = 4096
+_LED = struct.Struct("<HH")
+
+def servo_range(max_percent):
+    """(lowest, highest) servo angle allowed by a max percentage of the swing around 90."""
+    swing = 90 * max_percent / 100
+    return 90 - swing, 90 + swing
+
+class ServoOutput:
+    """
+    Change-only, quantized writes to servo channels of a ServoKit.
+    - servo_kit: adafruit_servokit.ServoKit (or the simulated one from backends)
+    - channels: channels driven through this stage
+    - min_pulse, max_pulse: pulse width range in microseconds (ServoKit's default 750-2250)
+    - actuation_range: angle range in degrees
+    - arbiter: I2CArbiter of the bus, the writes then go out as control priority transactions
+    """
+    def __init__(self, servo_kit, channels=(0, 15), min_pulse=750, max_pulse=2250, actuation_range=180,
+                 arbiter=None):
+        self.servo_kit = servo_kit
+        self.channels = tuple(channels)
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+        self.actuation_range = actuation_range
+        self.arbiter = arbiter
+        self.lock = threading.Lock()
+        # ServoKit keeps its PCA9685 private; without it (simulation) fall back to servo.angle
+        self._pca = getattr(servo_kit, "_pca", None)
+        if self._pca is not None:
+            # The prescaler only approximates the requested frequency, use the one in effect
+            self.frequency = self._pca.frequency
+        else:
+            self.frequency = getattr(servo_kit, "frequency", 50)
+        self.auto_flush = True
+        self.written = {}
+        self.pending = {}
+        self.counters = {"commands": 0, "skipped": 0, "channel_writes": 0, "transactions": 0}
+
+    def ticks(self, angle):
+        """PWM ticks (0-4095) for angle in degrees; None releases the servo (no pulse)."""
+        if angle is None:
+            return 0
+        if not 0 <= angle <= self.actuation_range:
+            raise ValueError("Angle out of range")
+        pulse = self.min_pulse + (self.max_pulse - self.min_pulse) * angle / self.actuation_range
+        return round(pulse * self.frequency * PWM_STEPS / 1e6)
+
+    def angle(self, ticks):
+        """Angle in degrees that ticks corresponds to, None for a released servo."""
+        if ticks == 0:
+            return None
+        pulse = ticks * 1e6 / (self.frequency * PWM_STEPS)
+        angle = (pulse - self.min_pulse) * self.actuation_range / (self.max_pulse - self.min_pulse)
+        return min(max(angle, 0), self.actuation_range)
+
+    def set(self, channel, angle):
+        """
+        Command channel to angle; written right away unless inside batch().
+        Returns the angle actually output after quantization.
+        """
+        if channel not in self.channels:
+            raise ValueError(f"Channel {channel} is not driven by this output")
+        ticks = self.ticks(angle)
+        with self.lock:
+            self.counters["commands"] += 1
+            self.pending[channel] = ticks
+        if self.auto_flush:
+            self.flush()
+        return self.angle(ticks)
+
+    def set_many(self, angles):
+        """
+        Command several channels ({channel: angle}) and write the changed ones together.
+        Returns {channel: angle actually output}.
+        """
+        for channel in angles:
+            if channel not in self.channels:
+                raise ValueError(f"Channel {channel} is not driven by this output")
+        ticks = {channel: self.ticks(angle) for channel, angle in angles.items()}
+        with self.lock:
+            self.counters["commands"] += len(ticks)
+            self.pending.update(ticks)
+        self.flush()
+        return {channel: self.angle(value) for channel, value in ticks.items()}
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect set() calls and write the changed channels together at the end of the block.
+        Meant for a single control loop; set() from other threads is deferred as well meanwhile,
+        use set_many() where several threads command the servos.
+        """
+        auto_flush, self.auto_flush = self.auto_flush, False
+        try:
+            yield self
+        finally:
+            self.auto_flush = auto_flush
+            self.flush()
+
+    def flush(self):
+        """Write every pending channel whose ticks changed; returns the number of channels written."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            changed = {channel: ticks for channel, ticks in pending.items() if self.written.get(channel) != ticks}
+            self.counters["skipped"] += len(pending) - len(changed)
+            if not changed:
+                return 0
+            with self.arbiter.hold(PRIORITY_CONTROL) if self.arbiter is not None else nullcontext():
+                if self._pca is not None:
+                    self._write_registers(changed)
+                else:
+                    for channel, ticks in changed.items():
+                        self.servo_kit.servo[channel].angle = self.angle(ticks)
+                        self.counters["transactions"] += 1
+            self.written.update(changed)
+            self.counters["channel_writes"] += len(changed)
+        return len(changed)
+
+    def _write_registers(self, changed):
+        # One block write per run of consecutive channels, the PCA9685 auto-increments the register
+        channels = sorted(changed)
+        runs = [[channels[0]]]
+        for channel in channels[1:]:
+            if channel == runs[-1][-1] + 1:
+                runs[-1].append(channel)
+            else:
+                runs.append([channel])
+        with self._pca.i2c_device as i2c:
+            for run in runs:
+                data = bytearray([LED0_ON_L + 4 * run[0]])
+                for channel in run:
+                    data += _LED.pack(0, changed[channel])
+                i2c.write(data)
+                self.counters["transactions"] += 1
+
+    def stats(self):
+        """Command, skipped (unchanged after quantization), channel write and I2C transaction counts."""
+        return dict(self.counters)
@@ -0,0 +1,467 @@
+"""
+Time-aligned reading of a recording session written by all_sensors_main.py.
+
+Every stream (camera frames, IMU and controller .col/CSV, LIDAR .dat/.ldr, event .raw) is
+wrapped in a small stream class with the same interface: iterate (timestamp, item) pairs
+in time order, or look items up by position and timestamp. Timestamps are time.time()
+seconds for all of them.
+
+    session = SessionReader("data")
+    # Everything, one timestamp-ordered iterator, read lazily
+    for timestamp, name, item in session.merged():
+        ...
+    # The LIDAR scan, IMU sample and controller command for each camera frame
+    for timestamp, items in session.align("camera", ["lidar", "imu", "controller"], method="interpolate"):
+        frame, scan = items["camera"], items["lidar"]
+
+merged() is a heap-based k-way merge over the streams' iterators, so only one pending
+item per stream is held in memory. align() walks the reference stream and looks the
+other streams up by binary search.
+"""
+import bisect
+import csv
+import glob
+import heapq
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+SENSOR_DIR = os.path.dirname(os.path.abspath(__file__))
+for sensor_folder in ("Camera", "Lidar"):
+    sys.path.append(os.path.join(SENSOR_DIR, sensor_folder))
+
+ALIGN_METHODS = ("nearest", "interpolate")
+
+
+def part_key(path):
+    """Sort key putting a sensor's restart files in recording order: name.ext, name_1.ext, ..., name_10.ext."""
+    stem, ext = os.path.splitext(path)
+    match = re.match(r"(.*)_(\d+)$", stem)
+    if match:
+        return match.group(1), ext, int(match.group(2))
+    return stem, ext, 0
+
+
+class Stream:
+    """
+    Base class of the session streams.
+    Subclasses implement __len__, time_at and item_at; index_at and __iter__ are built on them.
+    interpolatable streams hold numeric arrays that align(method="interpolate") can blend.
+    """
+    interpolatable = False
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def time_at(self, position):
+        raise NotImplementedError
+
+    def item_at(self, position):
+        raise NotImplementedError
+
+    def index_at(self, timestamp):
+        """Position of the first item at or after timestamp (len(self) if there is none)."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.time_at(position), self.item_at(position)
+
+    def close(self):
+        pass
+
+
+class CsvStream(Stream):
+    """
+    CSV log with a timestamp first column (imu2csv, controller_full); items are float64 arrays
+    of the other columns. Iteration reads the file row by row; the table is only loaded
+    into memory for lookups by position or time.
+    A trailing incomplete row (recording cut off) is skipped.
+    """
+    interpolatable = True
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, newline="") as f:
+            self.columns = next(csv.reader(f), [])[1:]
+        self._table = None
+
+    def _rows(self):
+        with open(self.filename, newline="") as f:
+            rows = csv.reader(f)
+            next(rows, None)
+            for row in rows:
+                if len(row) != len(self.columns) + 1:
+                    continue
+                try:
+                    yield [float(value) for value in row]
+                except ValueError:
+                    continue
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = np.array(list(self._rows()), dtype=np.float64).reshape(-1, len(self.columns) + 1)
+        return self._table
+
+    def __len__(self):
+        return len(self.table)
+
+    def time_at(self, position):
+        return float(self.table[position, 0])
+
+    def item_at(self, position):
+        return self.table[position, 1:]
+
+    def index_at(self, timestamp):
+        return int(np.searchsorted(self.table[:, 0], timestamp))
+
+    def __iter__(self):
+        if self._table is not None:
+            yield from super().__iter__()
+            return
+        for row in self._rows():
+            yield row[0], np.array(row[1:])
+
+
+class ColumnStream(Stream):
+    """
+    Binary column log (.col, column_log.py) written by imu2csv or ControllerInputLogger; items
+    are float64 arrays of the non-timestamp columns, like CsvStream's. The file is memory-mapped,
+    nothing is parsed.
+    """
+    interpolatable = True
+
+    def __init__(self, filename):
+        from column_log import ColumnLogReader
+        self.reader = ColumnLogReader(filename)
+        self.columns = self.reader.names[1:]
+        self.timestamps = self.reader.timestamps
+        self._values = None
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = self.reader.table(self.columns)
+        return self._values
+
+    def __len__(self):
+        return len(self.reader)
+
+    def time_at(self, position):
+        return float(self.timestamps[position])
+
+    def item_at(self, position):
+        return self.values[position]
+
+    def index_at(self, timestamp):
+        return int(np.searchsorted(self.timestamps, timestamp))
+
+    def __iter__(self):
+        return iter(self.reader)
+
+    def close(self):
+        self.timestamps = self._values = None
+        self.reader.close()
+
+
+class LidarStream(Stream):
+    """LIDAR recording, raw .dat (LidarDatReader) or .ldr log (LidarLogReader); items are scans."""
+    interpolatable = True
+
+    def __init__(self, filename):
+        if filename.endswith(".ldr"):
+            from lidar_log import LidarLogReader
+            self.reader = LidarLogReader(filename)
+            self.log = True
+        else:
+            from lidar_reader import LidarDatReader
+            self.reader = LidarDatReader(filename)
+            self.log = False
+
+    def __len__(self):
+        return len(self.reader)
+
+    def time_at(self, position):
+        if self.log:
+            return self.reader[position][0]
+        return float(self.reader.timestamps[position])
+
+    def item_at(self, position):
+        if self.log:
+            return self.reader[position][1]
+        return self.reader.scans[position]
+
+    def index_at(self, timestamp):
+        return self.reader.index_at(timestamp)
+
+    def __iter__(self):
+        return iter(self.reader)
+
+    def close(self):
+        self.reader.close()
+
+
+class JpegStream(Stream):
+    """
+    Folder of color_<YYYYMMDD_HHMMSS_microseconds>.jpg frames (camera2JPEG "jpeg" mode);
+    items are BGR frames, decoded when accessed.
+    Frames from before the timestamp fix have no microseconds and count as whole seconds.
+    """
+
+    def __init__(self, directory, prefix="color_"):
+        entries = []
+        for filename in os.listdir(directory):
+            if filename.startswith(prefix) and filename.endswith(".jpg"):
+                timestamp = self.parse_timestamp(filename[len(prefix):-4])
+                if timestamp is not None:
+                    entries.append((timestamp, os.path.join(directory, filename)))
+        entries.sort()
+        self.timestamps = [timestamp for timestamp, _ in entries]
+        self.filenames = [filename for _, filename in entries]
+
+    @staticmethod
+    def parse_timestamp(text):
+        date, _, micro = text.rpartition("_")
+        try:
+            seconds = time.mktime(time.strptime(date, "%Y%m%d_%H%M%S"))
+        except ValueError:
+            return None
+        return seconds + (int(micro) / 1e6 if micro.isdigit() else 0.0)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def time_at(self, position):
+        return self.timestamps[position]
+
+    def item_at(self, position):
+        import cv2
+        return cv2.imread(self.filenames[position])
+
+    def index_at(self, timestamp):
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+
+class SegmentStream(Stream):
+    """Segmented camera recording (camera2JPEG "segments" mode); items are BGR frames."""
+
+    def __init__(self, directory):
+        from frame_segments import FrameSegmentReader
+        self.reader = FrameSegmentReader(directory)
+
+    def __len__(self):
+        return len(self.reader)
+
+    def time_at(self, position):
+        return self.reader.wall_time[position]
+
+    def item_at(self, position):
+        return self.reader.read(position)
+
+    def index_at(self, timestamp):
+        return self.reader.index_at(timestamp)
+
+    def close(self):
+        self.reader.close()
+
+
+class ConcatStream(Stream):
+    """Several recordings of one sensor (e.g. one LIDAR file per run) as a single stream, ordered by start time."""
+
+    def __init__(self, streams):
+        self.streams = sorted((stream for stream in streams if len(stream)), key=lambda stream: stream.time_at(0))
+        self.starts = []
+        total = 0
+        for stream in self.streams:
+            self.starts.append(total)
+            total += len(stream)
+        self.count = total
+        self.interpolatable = all(stream.interpolatable for stream in self.streams)
+
+    def _locate(self, position):
+        part = bisect.bisect_right(self.starts, position) - 1
+        return self.streams[part], position - self.starts[part]
+
+    def __len__(self):
+        return self.count
+
+    def time_at(self, position):
+        stream, offset = self._locate(position)
+        return stream.time_at(offset)
+
+    def item_at(self, position):
+        stream, offset = self._locate(position)
+        return stream.item_at(offset)
+
+    def index_at(self, timestamp):
+        for start, stream in zip(self.starts, self.streams):
+            offset = stream.index_at(timestamp)
+            if offset < len(stream):
+                return start + offset
+        return self.count
+
+    def __iter__(self):
+        for stream in self.streams:
+            yield from stream
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
+
+
+class EventStream:
+    """
+    Event camera recording (events2dat RAW files), decoded with the event camera SDK's
+    EventsIterator in delta_t slices; items are event arrays (x, y, p, t in sensor microseconds),
+    timestamped with the wall time of their first event.
+    Each file's sensor clock starts with its recording, so wall time is start_time + t / 1e6, with
+    start_time taken from the file's .json sidecar. Iteration only: the raw format has no index
+    for lookups, so event streams can be merged but not used in align().
+    - filenames: the recording, or its parts (one per camera restart) in recording order
+    - delta_t: slice length in microseconds
+    """
+
+    def __init__(self, filenames, delta_t=10000):
+        self.filenames = [filenames] if isinstance(filenames, str) else list(filenames)
+        self.delta_t = delta_t
+        self.start_times = []
+        for filename in self.filenames:
+            with open(filename + ".json") as f:
+                self.start_times.append(json.load(f)["start_time"])
+
+    def __iter__(self):
+        from backends import open_events_iterator
+        for filename, start_time in zip(self.filenames, self.start_times):
+            for events in open_events_iterator(input_path=filename, mode="delta_t", delta_t=self.delta_t):
+                if len(events):
+                    yield start_time + events['t'][0] / 1e6, events
+
+    def close(self):
+        pass
+
+
+class SessionReader:
+    """
+    All streams of a session folder laid out like all_sensors_main.py's "data" folder:
+    camera (color_frames/, JPEGs or segments), imu (imu/imu_data*.col or .csv), lidar
+    (lidar/*.dat or *.ldr), controller (controller/controller_data*.col or .csv) and events
+    (event_camera/*.raw, when its .json sidecar exists). Missing streams are skipped.
+    Files of a restarted sensor (name_1, name_2, ...) are read one after the other as one stream.
+    - session_dir: session folder
+    - streams: dict of name -> stream to use instead of (or on top of) the discovered ones
+    """
+
+    def __init__(self, session_dir="data", streams=None):
+        self.session_dir = session_dir
+        self.streams = self._discover(session_dir)
+        self.streams.update(streams or {})
+
+    @staticmethod
+    def _discover(session_dir):
+        streams = {}
+        camera_dir = os.path.join(session_dir, "color_frames")
+        if os.path.exists(os.path.join(camera_dir, "index.csv")):
+            streams["camera"] = SegmentStream(camera_dir)
+        elif os.path.isdir(camera_dir):
+            streams["camera"] = JpegStream(camera_dir)
+        # Sensors restarted by the supervisor continue in imu_data_1.col, controller_data_1.col, ...
+        for name, pattern in (("imu", os.path.join("imu", "imu_data*")),
+                              ("controller", os.path.join("controller", "controller_data*"))):
+            logs = sorted(glob.glob(os.path.join(session_dir, pattern + ".col")), key=part_key)
+            # A CSV converted to .col is read from the column log, not from the CSV as well
+            converted = {os.path.splitext(path)[0] for path in logs}
+            parts = [ColumnStream(path) for path in logs]
+            parts += [CsvStream(path) for path in sorted(glob.glob(os.path.join(session_dir, pattern + ".csv")), key=part_key)
+                      if os.path.splitext(path)[0] not in converted]
+            if len(parts) == 1:
+                streams[name] = parts[0]
+            elif parts:
+                streams[name] = ConcatStream(parts)
+        lidar_files = sorted(glob.glob(os.path.join(session_dir, "lidar", "*.ldr")))
+        # A run converted to .ldr is read from the log, not from its .dat as well
+        converted = {os.path.splitext(path)[0] for path in lidar_files}
+        lidar_files += [path for path in sorted(glob.glob(os.path.join(session_dir, "lidar", "*.dat")))
+                        if os.path.splitext(path)[0] not in converted]
+        if lidar_files:
+            streams["lidar"] = ConcatStream([LidarStream(path) for path in lidar_files])
+        event_files = [path for path in sorted(glob.glob(os.path.join(session_dir, "event_camera", "*.raw")), key=part_key)
+                       if os.path.exists(path + ".json")]
+        if event_files:
+            streams["events"] = EventStream(event_files)
+        return streams
+
+    def merged(self, names=None, start=None, end=None):
+        """
+        Lazily merged (timestamp, name, item) tuples of the given streams (default: all),
+        in timestamp order, limited to start <= timestamp < end when given.
+        """
+        names = list(self.streams) if names is None else names
+
+        def tagged(name):
+            for timestamp, item in self.streams[name]:
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp >= end:
+                    return
+                yield timestamp, name, item
+
+        return heapq.merge(*(tagged(name) for name in names), key=lambda entry: entry[0])
+
+    def lookup(self, name, timestamp, method="nearest", tolerance=None):
+        """
+        Item of stream `name` at timestamp: the nearest item, or (method="interpolate",
+        numeric streams only) a linear blend of the items before and after it.
+        Returns None when the stream has no item within tolerance seconds.
+        """
+        if method not in ALIGN_METHODS:
+            raise ValueError(f"Unknown alignment method: {method}")
+        stream = self.streams[name]
+        if not isinstance(stream, Stream):
+            raise ValueError(f"Stream {name} does not support lookups by time")
+        after = stream.index_at(timestamp)
+        before = after - 1
+        if after < len(stream) and stream.time_at(after) == timestamp:
+            return stream.item_at(after)
+        candidates = [position for position in (before, after) if 0 <= position < len(stream)]
+        if not candidates:
+            return None
+        times = {position: stream.time_at(position) for position in candidates}
+        nearest = min(candidates, key=lambda position: abs(times[position] - timestamp))
+        if tolerance is not None and abs(times[nearest] - timestamp) > tolerance:
+            return None
+        if method == "nearest" or not stream.interpolatable or len(candidates) < 2:
+            return stream.item_at(nearest)
+        weight = (timestamp - times[before]) / (times[after] - times[before])
+        first = np.asarray(stream.item_at(before), dtype=np.float64)
+        return first + (np.asarray(stream.item_at(after), dtype=np.float64) - first) * weight
+
+    def align(self, reference, others=None, method="nearest", tolerance=None, start=None, end=None):
+        """
+        For each item of the reference stream, (timestamp, {name: item}) with the reference item
+        and the items of the other streams at that time (see lookup).
+        - others: stream names to align (default: all that support lookups)
+        """
+        if others is None:
+            others = [name for name, stream in self.streams.items()
+                      if name != reference and isinstance(stream, Stream)]
+        for timestamp, _, item in self.merged([reference], start, end):
+            items = {reference: item}
+            for name in others:
+                items[name] = self.lookup(name, timestamp, method, tolerance)
+            yield timestamp, items
+
+    def close(self):
+        for stream in self.streams.values():
+            stream.close()
@@ -0,0 +1,208 @@
+"""
+Shared-memory ring buffers for sensor data.
+
+One writer process publishes fixed-size items (camera frames, LIDAR scans, IMU samples)
+into a ring of slots in a named shared memory block; any number of reader processes
+attach by name and read the latest or next item as NumPy views straight into the block.
+
+Layout of the block:
+
+    header   b"SLUGRING", uint64 published count, uint32 metadata length,
+             JSON metadata (dtype, shape, slots), padded to 1024 bytes
+    slots    per slot: int64 sequence number (-1 while being written), float64 timestamp,
+             item, padded to a multiple of 64 bytes
+
+Item n (0, 1, 2, ...) lives in slot n % slots. A view stays valid until the writer comes
+round to its slot again, i.e. for slots - 1 further items; check with still_valid(seq)
+after using a view, or pass copy=True to get a private copy.
+
+    ring = ShmRing.create("slug_lidar", *RING_SPECS["lidar"])   # writer
+    ring.publish(scan, timestamp)
+    ring = ShmRing.attach("slug_lidar")                        # readers
+    seq, timestamp, scan = ring.latest()
+"""
+import json
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = b"SLUGRING"
+HEADER_BYTES = 1024
+SLOT_HEADER_BYTES = 16
+SLOT_ALIGN = 64
+_PREAMBLE = struct.Struct("<8sQI")
+
+# dtype and item shape of the rings the car's sensors publish to
+RING_SPECS = {
+    "camera": (np.uint8, (480, 640, 3)),
+    "lidar": (np.float32, (1081,)),
+    # magn, gyro, accel as returned by BMX160.get_all_data()
+    "imu": (np.float64, (9,)),
+}
+
+
+class ShmRing:
+    """
+    Fixed-slot ring buffer in shared memory; use create() in the writer and attach() in readers.
+    - shm: multiprocessing SharedMemory block
+    - owner: True in the creating process, which unlinks the block on close()
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        magic, _, length = _PREAMBLE.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Shared memory {shm.name} is not a ring buffer")
+        metadata = json.loads(bytes(shm.buf[_PREAMBLE.size:_PREAMBLE.size + length]))
+        self.dtype = np.lib.format.descr_to_dtype(metadata["dtype"])
+        self.shape = tuple(metadata["shape"])
+        self.slots = metadata["slots"]
+        self.stride = self.slot_stride(self.dtype, self.shape)
+        buf = shm.buf
+        self._published = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=8)
+        self._seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=buf, offset=HEADER_BYTES,
+                                strides=(self.stride,))
+        self._timestamps = np.ndarray((self.slots,), dtype=np.float64, buffer=buf, offset=HEADER_BYTES + 8,
+                                      strides=(self.stride,))
+        item = np.empty(self.shape, dtype=self.dtype)
+        self._items = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=buf,
+                                 offset=HEADER_BYTES + SLOT_HEADER_BYTES, strides=(self.stride,) + item.strides)
+
+    @staticmethod
+    def slot_stride(dtype, shape):
+        size = SLOT_HEADER_BYTES + np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+        return -(-size // SLOT_ALIGN) * SLOT_ALIGN
+
+    @classmethod
+    def create(cls, name, dtype, shape=(), slots=8):
+        """
+        Create (or replace a stale) ring named `name` for items of the given dtype and shape.
+        - slots: items kept; readers' views stay valid for slots - 1 further items
+        """
+        dtype = np.dtype(dtype)
+        shape = tuple(shape)
+        metadata = json.dumps({"dtype": np.lib.format.dtype_to_descr(dtype), "shape": shape,
+                               "slots": slots}).encode()
+        if _PREAMBLE.size + len(metadata) > HEADER_BYTES:
+            raise ValueError("dtype description too long for the ring header")
+        size = HEADER_BYTES + slots * cls.slot_stride(dtype, shape)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[_PREAMBLE.size:_PREAMBLE.size + len(metadata)] = metadata
+        ring_seqs = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=HEADER_BYTES,
+                               strides=(cls.slot_stride(dtype, shape),))
+        ring_seqs[:] = -1
+        _PREAMBLE.pack_into(shm.buf, 0, MAGIC, 0, len(metadata))
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to the ring `name` created by another process."""
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Before 3.13 attaching registers the block with the resource tracker, which would
+            # unlink it when this reader exits
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        return cls(shm, owner=False)
+
+    @property
+    def published(self):
+        """Number of items published so far; the newest has seq published - 1."""
+        return int(self._published[0])
+
+    # Writer side
+
+    def claim(self):
+        """Writable view of the next slot, to fill in place before commit()."""
+        slot = self.published % self.slots
+        self._seqs[slot] = -1
+        return self._items[slot]
+
+    def commit(self, timestamp=None):
+        """Publish the slot returned by claim(); returns its seq."""
+        seq = self.published
+        slot = seq % self.slots
+        self._timestamps[slot] = time.time() if timestamp is None else timestamp
+        self._seqs[slot] = seq
+        self._published[0] = seq + 1
+        return seq
+
+    def publish(self, item, timestamp=None):
+        """Copy item into the next slot and publish it; returns its seq."""
+        self.claim()[...] = item
+        return self.commit(timestamp)
+
+    # Reader side
+
+    def get(self, seq, copy=False):
+        """
+        (timestamp, item) of item seq, or None if it is not published yet or already overwritten.
+        The item is a view into shared memory unless copy=True.
+        """
+        slot = seq % self.slots
+        if self._seqs[slot] != seq:
+            return None
+        timestamp = float(self._timestamps[slot])
+        item = self._items[slot].copy() if copy else self._items[slot]
+        if copy and not self.still_valid(seq):
+            # Overwritten while copying
+            return None
+        return timestamp, item
+
+    def latest(self, copy=False):
+        """(seq, timestamp, item) of the newest item, None before the first one."""
+        while True:
+            seq = self.published - 1
+            if seq < 0:
+                return None
+            entry = self.get(seq, copy)
+            if entry is not None:
+                return (seq,) + entry
+
+    def next(self, seq, timeout=None, poll_interval=0.0005, copy=False):
+        """
+        (seq, timestamp, item) of the first item after seq that is still available, waiting up to
+        timeout seconds for it (None: forever); None on timeout. Pass seq=-1 for the oldest item.
+        If the reader fell more than `slots` items behind, the returned seq jumps ahead.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            published = self.published
+            if published > seq + 1:
+                wanted = max(seq + 1, published - self.slots + 1)
+                entry = self.get(wanted, copy)
+                if entry is not None:
+                    return (wanted,) + entry
+                seq = wanted
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def still_valid(self, seq):
+        """True while item seq has not been overwritten, i.e. a view of it is still intact."""
+        return self._seqs[seq % self.slots] == seq
+
+    def close(self):
+        # Views into the block must be gone before it can be closed
+        self._published = self._seqs = self._timestamps = self._items = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
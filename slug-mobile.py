@@ -1,17 +1,36 @@
+import argparse
+import os
+import sys
 from enum import Enum
 from time import sleep
-from adafruit_servokit import ServoKit
-import cv2
-from metavision_core.event_io import EventsIterator
-from hokuyolx import HokuyoLX
 from BMX160 import BMX160
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sensor_Data'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sensor_Data', 'Camera'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sensor_Data', 'Event_Camera'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sensor_Data', 'Controller'))
+from backends import open_servo_kit, open_events_iterator, open_lidar, open_smbus, open_video_capture
+from control_loop import ControlLoop
+from controller_full import ControllerInputLogger
+from frame_grabber import FrameGrabber
+from i2c_arbiter import I2CArbiter, PRIORITY_HOUSEKEEPING, PRIORITY_IMU
+from servo_output import ServoOutput, servo_range
+from event_batches import EventBatcher
+
+STEERING_CHANNEL = 0
+DRIVING_CHANNEL = 15
+# FIFO bytes per I2C read (5 frames), so a servo write waits at most one short burst
+IMU_FIFO_BURST = 100
 
 class SlugMobile:
 
-    def __init__(self, max_steering=80, max_throttle=20, i2c_address=0x60, channels=16):
+    def __init__(self, max_steering=80, max_throttle=20, i2c_address=0x60, channels=16, imu_fifo=False, camera_index=0,
+                 max_events=4_000_000):
         """
-        max_steering: max percentage of steering angle
-        max_throttle: max percentage of thrust
+        max_steering: max percentage of steering angle (of the servo swing around 90)
+        max_throttle: max percentage of thrust (of the servo swing around 90)
+        imu_fifo: buffer IMU samples in the BMX160 FIFO, read them with get_imu_samples()
+        camera_index: RGB camera, kept open and read in the background for get_RGB()
+        max_events: events buffered for the get_event* methods before the oldest are dropped
         """
         self.max_steering = max_steering
         self.max_throttle = max_throttle
@@ -19,41 +38,143 @@ class SlugMobile:
         self.steering_angle = 0
         self.throttle = 0
 
-        self.servo_kit = ServoKit(address=i2c_address, channels=channels)
-        self.DrivingServo = self.servo_kit.servo[15]
-        self.SteeringServo = self.servo_kit.servo[0]
+        # Servo writes go first on the bus shared with the IMU, then IMU reads, then configuration
+        self.i2c = I2CArbiter(open_smbus(1))
+
+        self.servo_kit = open_servo_kit(address=i2c_address, channels=channels)
+        self.DrivingServo = self.servo_kit.servo[DRIVING_CHANNEL]
+        self.SteeringServo = self.servo_kit.servo[STEERING_CHANNEL]
+
+        # Only writes values that changed at the PWM resolution
+        self.servos = ServoOutput(self.servo_kit, channels=(STEERING_CHANNEL, DRIVING_CHANNEL), arbiter=self.i2c)
+        self.set_controls(90, 90)
 
-        self.DrivingServo.angle = 90
-        self.SteeringServo.angle = 90
+        # Read in 1 ms slices on a background thread, handed out as NumPy batches
+        self.events = EventBatcher(open_events_iterator(input_path="", mode="delta_t", delta_t=1000), max_events).start()
 
-        self.event_iterator = EventsIterator(input_path="", mode="n_events", n_events=1)
+        self.lidar = open_lidar()
 
-        self.lidar = HokuyoLX()
+        self.camera = FrameGrabber(open_video_capture(camera_index)).start()
+        self.rgb_seq = 0
 
-        self.imu = BMX160(1)
+        imu_bus = self.i2c.client(PRIORITY_HOUSEKEEPING)
+        self.imu = BMX160(imu_bus)
+        if imu_fifo:
+            self.imu.enable_fifo()
+            self.imu.fifoBurst = IMU_FIFO_BURST
+        imu_bus.priority = PRIORITY_IMU
 
         sleep(5)
 
-    def num_to_range(num, inMin, inMax, outMin, outMax):
+    def num_to_range(self, num, inMin, inMax, outMin, outMax):
         return round(
             outMin + (float(num - inMin) / float(inMax - inMin) * (outMax - outMin)), 3
         )
 
+    def servo_range(self, max_percent):
+        """(lowest, highest) servo angle allowed by a max percentage of the swing around 90"""
+        return servo_range(max_percent)
+
     def set_steering_angle(self, angle):
-        self.SteeringServo.angle = angle
+        low, high = self.servo_range(self.max_steering)
+        self.steering_angle = self.servos.set(STEERING_CHANNEL, min(max(angle, low), high))
 
     def set_throttle(self, throttle):
-        self.DrivingServo.angle = throttle
+        low, high = self.servo_range(self.max_throttle)
+        self.throttle = self.servos.set(DRIVING_CHANNEL, min(max(throttle, low), high))
+
+    """
+    Steers and drives from stick values, writing the servos that changed together.
+    steering, throttle: -1 (full left / reverse) to 1 (full right / forward), mapped onto the
+                        servo range allowed by max_steering / max_throttle
+    """
+    def drive(self, steering, throttle):
+        steering = min(max(steering, -1.0), 1.0)
+        throttle = min(max(throttle, -1.0), 1.0)
+        self.set_controls(self.num_to_range(steering, -1, 1, *self.servo_range(self.max_steering)),
+                          self.num_to_range(throttle, -1, 1, *self.servo_range(self.max_throttle)))
+
+    """
+    Sets steering angle and throttle, writing the servos that changed together. Safe to call
+    from several threads.
+    """
+    def set_controls(self, angle, throttle):
+        # set_many rather than batch(): teleop commands the servos from the controller reader
+        # thread and the deadman from the control loop thread
+        steering_low, steering_high = self.servo_range(self.max_steering)
+        throttle_low, throttle_high = self.servo_range(self.max_throttle)
+        output = self.servos.set_many({STEERING_CHANNEL: min(max(angle, steering_low), steering_high),
+                                       DRIVING_CHANNEL: min(max(throttle, throttle_low), throttle_high)})
+        self.steering_angle = output[STEERING_CHANNEL]
+        self.throttle = output[DRIVING_CHANNEL]
 
-    def get_RGB(self):
-        vid = cv2.VideoCapture(0)
-        _, frame = vid.read()
-        vid.release()
-        return frame
+    """
+    Returns:
+        - dict with servo commands, skipped (unchanged) commands, channel writes and I2C transactions
+    """
+    def get_servo_stats(self):
+        return self.servos.stats()
+
+    """
+    Returns:
+        - dict with bus utilization and, per priority (control, imu, housekeeping), transaction
+          count, queueing wait and latency in ms
+    """
+    def get_i2c_stats(self):
+        return self.i2c.stats()
+
+    def get_RGB(self, wait_newer=False, timeout=1.0):
+        """
+        Newest camera frame, None if there is none yet.
+        wait_newer: block (up to timeout seconds) for a frame not returned before
+        """
+        return self.get_RGB_stamped(wait_newer, timeout)[2]
+
+    """
+    Like get_RGB, with the frame's capture info.
+    Returns:
+        - (seq, timestamp, frame): seq counts frames since start, timestamp is time.time() at capture
+    """
+    def get_RGB_stamped(self, wait_newer=False, timeout=1.0):
+        if wait_newer:
+            seq, timestamp, frame = self.camera.wait_newer(self.rgb_seq, timeout)
+        else:
+            seq, timestamp, frame = self.camera.latest()
+        self.rgb_seq = seq
+        return seq, timestamp, frame
 
     def get_event(self):
-        event = next(self.event_iterator)
-        return event.x, event.y, event.p, event.t
+        event = self.events.next_events(1)[0]
+        return event['x'], event['y'], event['p'], event['t']
+
+    """
+    Events as a structured array with fields x, y, p, t (t in microseconds).
+    delta_t: window length in microseconds
+    latest: False returns the window following the previous one, so consecutive calls cover
+            the stream without gaps (unless events were dropped); True returns the most recent
+            delta_t, already returned or not
+    timeout: seconds to wait for the stream to pass the end of the window, None if it does not
+    """
+    def get_event_window(self, delta_t=10000, latest=False, timeout=1.0):
+        if latest:
+            return self.events.latest_window(delta_t)
+        return self.events.next_window(delta_t, timeout)
+
+    """
+    Like get_event_window, by event count instead of time.
+    """
+    def get_event_batch(self, n_events=10000, latest=False, timeout=1.0):
+        if latest:
+            return self.events.latest_events(n_events)
+        return self.events.next_events(n_events, timeout)
+
+    """
+    Returns:
+        - dict with received, dropped (events lost because the buffer was full), overflows
+          and pending (buffered, not returned yet) event counts
+    """
+    def get_event_stats(self):
+        return self.events.stats()
     
     def get_distance(self):
         timestamp, scan = self.lidar.get_dist()
@@ -68,3 +189,55 @@ class SlugMobile:
     def get_imu_data(self):
         data = self.imu.get_all_data()
         return (data[0], data[1], data[2]), (data[3], data[4], data[5]), (data[6], data[7], data[8])
+
+    """
+    Drains every IMU sample buffered since the last call (requires imu_fifo=True).
+    Returns:
+        - list of (timestamp, magn, gyro, accel), oldest first
+    """
+    def get_imu_samples(self):
+        return [
+            (timestamp, (data[0], data[1], data[2]), (data[3], data[4], data[5]), (data[6], data[7], data[8]))
+            for timestamp, data in self.imu.read_fifo()
+        ]
+
+    """
+    Calls callback(car, tick) rate times per second on fixed deadlines until stop_event is set,
+    the callback returns False or `iterations` iterations ran; time parts of the callback with
+    `with tick.stage(name):`. Servo commands are written together at the end of each iteration.
+    realtime: run the loop with real-time priority (needs CAP_SYS_NICE, falls back to normal)
+    cpus: CPU numbers to pin the loop to
+    Returns:
+        - dict with achieved rate, overruns, jitter histogram and per-stage timing
+    """
+    def run_control_loop(self, callback, rate=50, stop_event=None, iterations=None, realtime=False, cpus=None):
+        def step(tick):
+            with self.servos.batch():
+                return callback(self, tick)
+
+        loop = ControlLoop(rate, step, realtime=realtime, cpus=cpus)
+        return loop.run(stop_event, iterations)
+
+    def close(self):
+        self.camera.stop()
+        self.events.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teleop: drive the car with the game controller and log the commands.")
+    parser.add_argument("--output-dir", default="data/controller", help="folder of the controller_data.csv log")
+    parser.add_argument("--driver", choices=("pygame", "evdev"), default="pygame", help="how to read the controller")
+    parser.add_argument("--max-steering", type=float, default=80, help="max percentage of steering angle")
+    parser.add_argument("--max-throttle", type=float, default=20, help="max percentage of thrust")
+    parser.add_argument("--input-timeout", type=float, default=1.0,
+                        help="seconds without controller input before the car is set to neutral")
+    args = parser.parse_args()
+
+    car = SlugMobile(max_steering=args.max_steering, max_throttle=args.max_throttle)
+    try:
+        logger = ControllerInputLogger(max_steering=args.max_steering, max_throttle=args.max_throttle,
+                                       output_dir=args.output_dir)
+        logger.start_logging(driver=args.driver, car=car, input_timeout=args.input_timeout)
+    finally:
+        # Neutral steering and throttle before letting go of the servos
+        car.set_controls(90, 90)
+        car.close()